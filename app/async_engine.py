@@ -0,0 +1,320 @@
+"""One event-loop thread for Gemini calls, bridged back to Tk"""
+import asyncio
+import heapq
+import itertools
+import queue
+import sys
+import threading
+import time
+
+from worker_pool import QueueFull
+
+
+class AsyncEngine:
+    """Run request coroutines on a single background event loop
+
+    Admission works like WorkerPool: at most max_in_flight coroutines run at
+    once, up to max_queue more wait their turn (FIFO) and anything beyond
+    that is rejected with QueueFull.
+
+    Requests submitted with the same lane run one at a time, in order, so
+    several chats can share the engine (and its max_in_flight) while each
+    keeps its replies in order. A lane is dropped once nothing in it is
+    queued or running.
+    """
+
+    def __init__(self, max_in_flight=1, max_queue=5, executor=None, name="chat-engine"):
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.executor = executor
+        self.lock = threading.Lock()
+        self.closed = False
+
+        # Counters
+        self.pending = 0
+        self.lane_pending = {}
+        self.active = 0
+        self.submitted = 0
+        self.completed = 0
+        self.rejected = 0
+        self.cancelled = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+        self.loop = asyncio.new_event_loop()
+        self.slots = asyncio.Semaphore(max_in_flight)
+        self.lanes = {}
+        self.thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+        self.loop.close()
+
+    @property
+    def queue_depth(self):
+        """Number of requests waiting for a free slot"""
+        with self.lock:
+            return self.pending
+
+    def lane_depth(self, lane):
+        """Number of requests in lane that are waiting to run"""
+        with self.lock:
+            return self.lane_pending.get(lane, 0)
+
+    def submit(self, coro_fn, *args, lane=None):
+        """Schedule coro_fn(*args) on the loop and return a concurrent Future"""
+        with self.lock:
+            if self.closed:
+                raise RuntimeError("engine is shut down")
+            if self.pending >= self.max_queue:
+                self.rejected += 1
+                raise QueueFull(f"{self.pending} requests already queued")
+            self.pending += 1
+            self.submitted += 1
+            if lane is not None:
+                self.lane_pending[lane] = self.lane_pending.get(lane, 0) + 1
+        coro = self._admit(time.perf_counter(), coro_fn, args)
+        if lane is not None:
+            coro = self._in_lane(lane, coro)
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    async def _in_lane(self, lane, coro):
+        # Wait for the lane before taking a slot, so a busy chat never holds
+        # a slot another chat could use
+        lock = self.lanes.get(lane)
+        if lock is None:
+            lock = self.lanes[lane] = asyncio.Lock()
+        started = False
+        try:
+            async with lock:
+                started = True
+                with self.lock:
+                    self.lane_pending[lane] -= 1
+                return await coro
+        finally:
+            if not started:
+                # Cancelled while waiting for the lane; _admit never ran
+                coro.close()
+                with self.lock:
+                    self.lane_pending[lane] -= 1
+                    self.pending -= 1
+                    self.cancelled += 1
+            with self.lock:
+                if not self.lane_pending[lane] and not lock.locked():
+                    # Nothing queued or running: forget the lane, or one
+                    # lock per server session would pile up for good
+                    del self.lane_pending[lane]
+                    if self.lanes.get(lane) is lock:
+                        del self.lanes[lane]
+
+    def spawn(self, coro_fn, *args):
+        """Run background work on the loop, outside request admission"""
+        with self.lock:
+            if self.closed:
+                return None
+        return asyncio.run_coroutine_threadsafe(coro_fn(*args), self.loop)
+
+    async def _admit(self, queued_at, coro_fn, args):
+        waiting = True
+        try:
+            async with self.slots:
+                wait = time.perf_counter() - queued_at
+                with self.lock:
+                    self.pending -= 1
+                    self.active += 1
+                    self.total_wait += wait
+                    self.max_wait = max(self.max_wait, wait)
+                waiting = False
+                try:
+                    return await coro_fn(*args)
+                finally:
+                    with self.lock:
+                        self.active -= 1
+                        self.completed += 1
+        except asyncio.CancelledError:
+            with self.lock:
+                self.cancelled += 1
+            raise
+        finally:
+            if waiting:
+                with self.lock:
+                    self.pending -= 1
+
+    def after(self, delay_ms, fn, *args):
+        """Run fn(*args) on the loop once delay_ms has passed (Tk-style, so
+        a StreamBuffer can batch on the loop instead of on Tk). Calls with
+        no delay run in the order they were made."""
+        if delay_ms <= 0:
+            self.loop.call_soon_threadsafe(fn, *args)
+        else:
+            self.loop.call_soon_threadsafe(self.loop.call_later, delay_ms / 1000, fn, *args)
+
+    async def run_blocking(self, fn, *args):
+        """Await a blocking call on the engine's executor"""
+        if self.executor is None:
+            return await self.loop.run_in_executor(None, fn, *args)
+        return await asyncio.wrap_future(self.executor.submit(fn, *args))
+
+    def stats(self):
+        """Snapshot of queue depth, throughput and wait time counters"""
+        with self.lock:
+            started = self.completed + self.active
+            return {
+                "max_in_flight": self.max_in_flight,
+                "queue_depth": self.pending,
+                "active": self.active,
+                "submitted": self.submitted,
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "cancelled": self.cancelled,
+                "avg_wait": self.total_wait / started if started else 0.0,
+                "max_wait": self.max_wait,
+            }
+
+    def shutdown(self, cancel_pending=True, timeout=2.0):
+        """Cancel (or drain) outstanding requests and stop the loop thread"""
+        with self.lock:
+            if self.closed:
+                return
+            self.closed = True
+
+        async def finish():
+            tasks = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+            if cancel_pending:
+                for task in tasks:
+                    task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        try:
+            asyncio.run_coroutine_threadsafe(finish(), self.loop).result(timeout)
+        except Exception:
+            pass
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(timeout)
+
+
+class TkBridge:
+    """Hand callbacks from any thread to Tk through one periodic after() pump
+
+    after() mirrors the Tk signature so helpers written against a Tk master,
+    such as StreamBuffer, can be pointed at the bridge instead.
+
+    Each pump runs one frame: every call that has come due, in order, with
+    two kinds coalesced first. Consecutive append(fn, text) calls for the
+    same fn become one fn(text) with the texts joined, so a streamed reply
+    costs one Text insert per frame however many chunks arrived. Calls made
+    with latest(fn, ...) keep only the newest arguments per fn and run at
+    the end of the frame, so a status bar is set once per frame. stats()
+    reports how long frames take and how many calls they ran.
+    """
+
+    def __init__(self, master, interval_ms=16):
+        self.master = master
+        self.interval_ms = interval_ms
+        self.calls = queue.SimpleQueue()
+        self.scheduled = []
+        self.seq = itertools.count()
+        self.running = True
+        self.job = master.after(interval_ms, self._pump)
+
+        # Counters
+        self.frames = 0
+        self.events = 0
+        self.callbacks = 0
+        self.merged = 0
+        self.collapsed = 0
+        self.max_events = 0
+        self.total_frame_time = 0.0
+        self.max_frame_time = 0.0
+        self.slow_frames = 0
+
+    def post(self, fn, *args):
+        """Run fn(*args) on the Tk thread at the next pump"""
+        self.after(0, fn, *args)
+
+    def after(self, delay_ms, fn, *args):
+        """Run fn(*args) on the Tk thread once delay_ms has passed"""
+        self._put(delay_ms, None, fn, args)
+
+    def append(self, fn, text):
+        """Run fn(text) at the next pump, joined with adjacent appends to fn"""
+        self._put(0, "append", fn, (text,))
+
+    def latest(self, fn, *args):
+        """Run fn(*args) at the end of the next pump unless a newer call to fn replaces it"""
+        self._put(0, "latest", fn, args)
+
+    def _put(self, delay_ms, kind, fn, args):
+        due = time.monotonic() + delay_ms / 1000
+        self.calls.put((due, next(self.seq), kind, fn, args))
+
+    def _frame(self, due):
+        """The frame's calls as (fn, args), appends merged and latest calls collapsed"""
+        calls = []
+        latest = {}
+        for _, _, kind, fn, args in due:
+            if kind == "latest":
+                if fn in latest:
+                    self.collapsed += 1
+                latest[fn] = args
+            elif kind == "append" and calls and calls[-1][0] == fn and calls[-1][2]:
+                calls[-1][1].append(args[0])
+                self.merged += 1
+            else:
+                calls.append((fn, [args[0]] if kind == "append" else args, kind == "append"))
+        frame = [(fn, ("".join(args),) if joined else args) for fn, args, joined in calls]
+        frame.extend(latest.items())
+        return frame
+
+    def _pump(self):
+        started = time.perf_counter()
+        while True:
+            try:
+                heapq.heappush(self.scheduled, self.calls.get_nowait())
+            except queue.Empty:
+                break
+        now = time.monotonic()
+        due = []
+        while self.scheduled and self.scheduled[0][0] <= now:
+            due.append(heapq.heappop(self.scheduled))
+        if due:
+            frame = self._frame(due)
+            for fn, args in frame:
+                try:
+                    fn(*args)
+                except Exception:
+                    self.master.report_callback_exception(*sys.exc_info())
+            elapsed = time.perf_counter() - started
+            self.frames += 1
+            self.events += len(due)
+            self.callbacks += len(frame)
+            self.max_events = max(self.max_events, len(due))
+            self.total_frame_time += elapsed
+            self.max_frame_time = max(self.max_frame_time, elapsed)
+            if elapsed * 1000 > self.interval_ms:
+                self.slow_frames += 1
+        if self.running:
+            self.job = self.master.after(self.interval_ms, self._pump)
+
+    def stop(self):
+        """Stop the pump; callbacks still queued are dropped"""
+        self.running = False
+        self.master.after_cancel(self.job)
+
+    def stats(self):
+        """Frames run, events per frame and UI frame time"""
+        return {
+            "interval_ms": self.interval_ms,
+            "frames": self.frames,
+            "events": self.events,
+            "callbacks": self.callbacks,
+            "merged_appends": self.merged,
+            "collapsed_latest": self.collapsed,
+            "avg_events_per_frame": self.events / self.frames if self.frames else 0.0,
+            "max_events_per_frame": self.max_events,
+            "avg_frame_time": self.total_frame_time / self.frames if self.frames else 0.0,
+            "max_frame_time": self.max_frame_time,
+            "slow_frames": self.slow_frames,
+        }
@@ -0,0 +1,925 @@
+"""UI-free chat core: prompt, context and model logic shared by every front end"""
+import asyncio
+import json
+import math
+import os
+import re
+import threading
+import time
+from streaming import StreamBuffer, stream_response
+from worker_pool import QueueFull, WorkerPool
+from async_engine import AsyncEngine
+from response_cache import ResponseCache, make_cache_key
+from semantic_cache import SemanticCache
+from context_window import ContextWindow
+from memory_summary import RollingSummary
+from model_pool import ModelPool
+from chat_session import ChatSession
+from memory_store import MemoryStore, TurnLog, connect
+from db_writer import DbWriter
+from vector_memory import VectorMemory, create_memory_table
+from history_search import HistorySearch
+from session_store import SessionStore
+from resilience import CircuitOpen, ModelGuard
+from hedging import Hedger
+from prewarm import Prewarmer
+
+_SESSION_ID_RE = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+
+class ChatListener:
+    """What a front end hears from a ChatCore; every event is optional
+
+    Events arrive in order on the engine's loop thread: user_message, then
+    status updates, then either reply (a whole reply at once, e.g. from the
+    cache) or reply_start / reply_text... / reply_end, or error.
+    """
+
+    def user_message(self, text):
+        pass
+
+    def status(self, text):
+        pass
+
+    def reply(self, text):
+        pass
+
+    def reply_start(self):
+        pass
+
+    def reply_text(self, text):
+        pass
+
+    def reply_end(self):
+        pass
+
+    def error(self, text):
+        pass
+
+
+class _Fanout(ChatListener):
+    """Pass every event on to each listener of a request that identical
+    sends joined; a listener that joins late misses what came before"""
+
+    def __init__(self, listener):
+        self.listeners = [listener]
+
+    def add(self, listener):
+        if listener not in self.listeners:
+            self.listeners.append(listener)
+
+
+def _forward(event):
+    def forward(self, *args):
+        for listener in list(self.listeners):
+            getattr(listener, event)(*args)
+    return forward
+
+
+for _event in ("user_message", "status", "reply", "reply_start", "reply_text", "reply_end", "error"):
+    setattr(_Fanout, _event, _forward(_event))
+
+
+class _Request:
+    """A message queued or running in a ChatCore"""
+
+    def __init__(self, user_message, mode, listener):
+        self.user_message = user_message
+        self.mode = mode
+        self.listener = _Fanout(listener)
+        self.future = None
+        # The loop task running it, once it has started
+        self.task = None
+        self.superseded = False
+
+
+class ViewListener(ChatListener):
+    """Forward events to view callbacks on the UI thread through a TkBridge;
+    events without a callback are dropped
+
+    Streamed text goes through bridge.append, so chunks that land in the
+    same frame become one insert, and status through bridge.latest, so only
+    the newest status of a frame is shown. The rest keep their order.
+    """
+
+    EVENTS = ("user_message", "status", "reply", "reply_start", "reply_text", "reply_end", "error")
+
+    def __init__(self, bridge, **callbacks):
+        unknown = set(callbacks) - set(self.EVENTS)
+        if unknown:
+            raise TypeError(f"unknown events: {', '.join(sorted(unknown))}")
+        for event, callback in callbacks.items():
+            post = {"reply_text": bridge.append, "status": bridge.latest}.get(event, bridge.post)
+            setattr(self, event, lambda *args, post=post, callback=callback: post(callback, *args))
+
+
+class ChatServices:
+    """Everything chats share: store, writer, read worker, engine, models and caches
+
+    model_factory(system_instruction) returns a model with the SDK's async
+    API (genai.GenerativeModel or a gemini_rest model). Chats are opened with
+    core(), one per persona and session, and run their requests on the
+    shared engine in their own lane. Session chats live in a SessionStore:
+    idle ones are written out and dropped after session_idle_ttl seconds or
+    once the resident ones pass max_session_bytes, and come back on their
+    next message.
+
+    Every model call goes through one ModelGuard, since the quota belongs to
+    the API key: requests_per_minute and tokens_per_minute (the free tier's
+    by default), retries of quota and transient errors, and a breaker that
+    fails fast while the model keeps failing. With a governor (a Governor
+    shared by every app on the machine) the limits are the governor's.
+
+    With hedge, a call that has not started answering by the rolling p90
+    of time to first token is raced against a duplicate (see Hedger), for
+    at most one call in ten.
+
+    With a router (a ModelRouter) each request gets the model tier and
+    max_output_tokens it picks, and model_factory is then called as
+    model_factory(system_instruction, model_name, generation_config).
+
+    With prewarm, ChatCore.prewarm() (called as the user focuses the input
+    or types) opens the model connection ahead of the message when it has
+    been idle (see Prewarmer).
+
+    Caches, summaries, saved exchanges and snapshots share the key/value
+    table named by table. With turn_log (a table name), each persona's own
+    chat keeps its exchanges in that MemoryStore turn log instead, the
+    newest turn_log_size of them, one context entry per row (see TurnLog).
+    """
+
+    def __init__(self, db_path, model_factory, max_in_flight=1, max_queue=5, max_reads=50,
+                 summary_model=None, max_models=16, semantic_threshold=0.95,
+                 max_session_bytes=256 * 2 ** 20, session_idle_ttl=900,
+                 requests_per_minute=15, tokens_per_minute=1_000_000, governor=None, hedge=False,
+                 router=None, prewarm=True, table="context_memory", turn_log=None, turn_log_size=50):
+        # Database (WAL mode, busy timeout); writes go to one writer thread
+        # that group-commits them
+        self.db_path = db_path
+        self.table = table
+        self.conn = connect(db_path)
+        # The personas' own chats' turn log, if any, appended through the writer
+        self.turn_log = MemoryStore(self.conn, turn_log_size, table=turn_log) if turn_log is not None else None
+        self.create_tables()
+        self.writer = DbWriter(db_path)
+        if self.turn_log is not None:
+            self.turn_log.writer = self.writer
+
+        # Models: one per (persona scope, mode), built on first use, and
+        # with a router one per routed model and reply length too
+        self.models = ModelPool(model_factory, max_models)
+        self.router = router
+        self.summary_model = summary_model
+
+        # Rate limits, retries and the circuit breaker, shared by every chat
+        self.governor = governor
+        self.guard = ModelGuard(requests_per_minute, tokens_per_minute, governor=governor)
+        # Duplicate calls for slow starters, off unless hedge
+        self.hedger = Hedger(hedge)
+        # Connection warm-ups while the user types, and what they save
+        self.prewarmer = Prewarmer(prewarm)
+        # Model calls under way by prompt hash (the response cache key), so
+        # identical prompts share one; touched on the loop thread only
+        self.in_flight = {}
+
+        # Async engine; SQLite reads run on one worker thread
+        self.pool = WorkerPool(max_workers=1, max_queue=max_reads, name="db")
+        self.engine = AsyncEngine(max_in_flight, max_queue, executor=self.pool)
+
+        # Response caches; keys carry the model, persona and conversation
+        self.cache = ResponseCache(self.conn, table=table, writer=self.writer)
+        self.semantic_cache = SemanticCache(semantic_threshold)
+
+        # Full-text search over every stored turn, backfilled in the background
+        self.search_index = HistorySearch(self.conn)
+        self.search_index.create_tables()
+        self.engine.spawn(self._backfill_search)
+
+        # Counters
+        self.joined_sends = 0
+        self.shared_calls = 0
+        self.superseded = 0
+
+        # Conversations, the idle ones swept out every so often
+        self.sessions = SessionStore(max_session_bytes, session_idle_ttl)
+        self.engine.spawn(self._sweep_sessions)
+
+    def create_tables(self):
+        self.conn.execute(f'''
+            CREATE TABLE IF NOT EXISTS {self.table} (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                key TEXT UNIQUE,
+                value TEXT,
+                timestamp DATETIME
+            )
+        ''')
+        self.conn.commit()
+        columns = {row[1] for row in self.conn.execute(f"PRAGMA table_info({self.table})")}
+        if "key" not in columns:
+            # A MemoryStore turn log (id, value, timestamp): pass it as
+            # turn_log and the key/value state as another table
+            raise RuntimeError(f"{self.db_path}: {self.table} has no key column; use another table or database file")
+        if self.turn_log is not None:
+            self.turn_log.create_tables()
+        create_memory_table(self.conn)
+
+    def core(self, persona, session_id=None):
+        """The ChatCore for persona (a registry entry) and session, rehydrated
+        when it is not resident. The persona's own chat (no session id, as
+        in the desktop apps) stays resident."""
+        if session_id is not None and not _SESSION_ID_RE.match(session_id):
+            raise ValueError(f"bad session id: {session_id!r}")
+        scope = persona["scope"] if session_id is None else f"{persona['scope']}/{session_id}"
+        return self.sessions.get(scope, lambda: ChatCore(persona, self, scope), pin=session_id is None)
+
+    def session_store(self, persona, scope):
+        """Where the chat for scope saves its exchanges: the turn log for a
+        persona's own chat when there is one, else None (the key/value table)"""
+        if self.turn_log is None or scope != persona["scope"]:
+            return None
+        return TurnLog(self.turn_log, persona["context_entry"])
+
+    def memory_path(self, scope):
+        """Long-term memory files for scope, next to the database"""
+        return f"{os.path.splitext(self.db_path)[0]}.{scope.replace('/', '.')}.vectors"
+
+    async def _backfill_search(self):
+        """Index turns stored before the search index, one writer batch at a time"""
+        while await asyncio.wrap_future(self.writer.submit(self.search_index.backfill_batch)):
+            pass
+
+    async def _sweep_sessions(self):
+        """Evict idle conversations, checking a few times per idle_ttl"""
+        interval = max(1.0, min(60.0, self.sessions.idle_ttl / 4))
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.engine.run_blocking(self.sessions.sweep)
+            except QueueFull:
+                pass
+
+    def stats(self):
+        return {
+            "sessions": self.sessions.stats(),
+            "guard": self.guard.stats(),
+            "hedging": self.hedger.stats(),
+            "prewarm": self.prewarmer.stats(),
+            "routing": self.router.stats() if self.router is not None else None,
+            "requests": {
+                "joined_sends": self.joined_sends,
+                "shared_calls": self.shared_calls,
+                "superseded": self.superseded,
+            },
+            "engine": self.engine.stats(),
+            "writer": self.writer.stats(),
+            "turn_log": self.turn_log.stats() if self.turn_log is not None else None,
+            "cache": self.cache.stats(),
+            "search": self.search_index.stats(),
+        }
+
+    def close(self, timeout=2):
+        """Cancel outstanding requests, flush every chat and commit queued writes"""
+        self.engine.shutdown(cancel_pending=True)
+        self.pool.shutdown(wait=True, timeout=timeout)
+        self.sessions.close()
+        # Barrier: commit every queued write before returning
+        self.writer.close(timeout=timeout)
+        if self.governor is not None:
+            self.governor.close()
+        if self.router is not None:
+            self.router.close()
+
+    def __del__(self):
+        """Close database connection"""
+        self.conn.close()
+
+
+class ChatCore:
+    """One conversation with one persona: context, memory, prompts and replies
+
+    Owns what is per conversation (context window, rolling summary, chat
+    session, long-term memory), all namespaced by scope, and reports every
+    step to a ChatListener instead of touching a UI. Requests run on the
+    shared engine in the scope's lane, so replies stay in order.
+
+    Everything but the token calibration is saved as it happens, so
+    suspend() only writes that snapshot and flushes the memory log before
+    the SessionStore drops the core; a new core for the scope picks up
+    where it left off.
+    """
+
+    def __init__(self, persona, services, scope=None):
+        self.persona = persona
+        self.services = services
+        self.engine = services.engine
+        self.scope = scope or persona["scope"]
+        self.lock = threading.Lock()
+        # Requests queued or running plus background folds; never evicted while busy
+        self.busy = 0
+        self.last_used = services.sessions.clock()
+        self.restored = False
+        # Listeners being shown the breaker's cooldown
+        self.cooldown_listeners = set()
+        # Unfinished requests by (mode, message), oldest first
+        self.requests = {}
+
+        # Requests: with SUPERSEDE, a new message cancels older unfinished ones
+        self.SUPERSEDE = False
+
+        # Response streaming
+        self.STREAM_RESPONSES = True
+        self.STREAM_FLUSH_MS = 50
+        self.REQUEST_TIMEOUT = 60
+
+        # Response caches (modes listed in UNCACHED_MODES always get a fresh response)
+        self.CACHE_RESPONSES = True
+        self.SEMANTIC_CACHE = True
+        self.UNCACHED_MODES = set(persona.get("uncached_modes", ()))
+
+        # Context Management: as many recent turns as fit the token budget
+        self.CONTEXT_TOKEN_BUDGET = 2000
+        self.TOKEN_CALIBRATION_EVERY = 25
+        self.COMPACT_AT_TOKENS = 1500
+        self.context_window = ContextWindow(self.CONTEXT_TOKEN_BUDGET, compact_at=self.COMPACT_AT_TOKENS)
+        # The part of the prompt that is the same whatever the message, built
+        # once per context change: (key, summary part, conversation part),
+        # and its exact token count once a warm-up has counted it:
+        # ((key, model name), tokens)
+        self.prompt_cache = None
+        self.static_count = None
+        # Context key the last prewarm() got ready for
+        self.prepared = None
+        self.prewarming = False
+
+        # Rolling summary of turns that left the context window
+        self.summary = RollingSummary(
+            services.conn, table=services.table, key=f"summary:{self.scope}", model=services.summary_model,
+            writer=services.writer,
+        )
+        self.summary.load()
+
+        # Chat sessions: each message goes to a start_chat() chat that keeps
+        # the history as structured turns; exchanges are saved so the chat
+        # survives a restart. Set CHAT_SESSIONS to False for the flattened prompt.
+        self.CHAT_SESSIONS = True
+        self.MAX_STORED_TURNS = 200
+        self.session = ChatSession(
+            services.conn, table=services.table, key_prefix=f"turn:{self.scope}:",
+            max_stored=self.MAX_STORED_TURNS, writer=services.writer,
+            store=services.session_store(persona, self.scope),
+        )
+
+        # Long-term memory: the RECALL_TURNS most relevant older turns ride
+        # along with each message
+        self.LONG_TERM_MEMORY = True
+        self.RECALL_TURNS = 3
+        self.memory = VectorMemory(
+            services.memory_path(self.scope), services.conn, scope=self.scope, writer=services.writer,
+        )
+        self.memory.load()
+
+        # Models for the known modes; typed-in modes are built on first use
+        for mode in persona["modes"]:
+            services.models.get((self.scope_key, mode), lambda mode=mode: self.build_system_instruction(mode))
+
+        if self.CHAT_SESSIONS:
+            self.load_session()
+
+    @property
+    def scope_key(self):
+        """Models are per persona, whatever the session"""
+        return self.persona["scope"]
+
+    @property
+    def queue_depth(self):
+        """Number of this chat's requests waiting to run"""
+        return self.engine.lane_depth(self.scope)
+
+    def send(self, user_message, mode, listener, supersede=None):
+        """Queue a message; returns a Future of (reply, note), or None on error.
+        Raises QueueFull when the engine's queue is full.
+
+        Sending a message while the same message (and mode) is still queued
+        or running joins that request: listener hears the rest of its events
+        and gets its Future, and the conversation gets one exchange. With
+        supersede (SUPERSEDE by default) every other unfinished request of
+        this conversation is cancelled, a streaming reply stopping where it
+        is, and left out of the history.
+        """
+        key = (mode, user_message)
+        self._hold()
+        try:
+            with self.lock:
+                request = self.requests.get(key)
+                if request is not None:
+                    request.listener.add(listener)
+                    self.services.joined_sends += 1
+                    joined = True
+                else:
+                    joined = False
+                    request = _Request(user_message, mode, listener)
+                    stale = list(self.requests.values()) if (self.SUPERSEDE if supersede is None else supersede) else []
+                    # Registered with the submit, so an identical send can never miss it
+                    request.future = self.engine.submit(self._run, request, lane=self.scope)
+                    self.requests[key] = request
+        except Exception:
+            self._release()
+            raise
+        if joined:
+            self._release()
+            return request.future
+        request.future.add_done_callback(lambda future: self._finished(key, request))
+        for old in stale:
+            self.engine.after(0, self._supersede, old)
+        return request.future
+
+    async def _run(self, request):
+        request.task = asyncio.current_task()
+        try:
+            return await self.reply(request.user_message, request.mode, request.listener)
+        except asyncio.CancelledError:
+            if request.superseded:
+                self._emit(request.listener.error, "Stopped: superseded by a newer message")
+            raise
+
+    def _supersede(self, request):
+        """Cancel an older request (on the loop thread, where it runs)"""
+        if request.future.done():
+            return
+        request.superseded = True
+        self.services.superseded += 1
+        if request.task is not None:
+            # Its reply ends and says why before its Future completes
+            request.task.cancel()
+        else:
+            # Never shown; say what was dropped
+            self._emit(request.listener.error, f"Skipped {request.user_message!r}: superseded by a newer message")
+            request.future.cancel()
+
+    def _finished(self, key, request):
+        with self.lock:
+            if self.requests.get(key) is request:
+                del self.requests[key]
+        self._release()
+
+    def _spawn(self, coro_fn):
+        """Background work for this conversation, counted as busy"""
+        self._hold()
+        future = self.engine.spawn(coro_fn)
+        if future is None:
+            self._release()
+        else:
+            future.add_done_callback(self._release)
+
+    def _hold(self):
+        with self.lock:
+            self.busy += 1
+            self.last_used = self.services.sessions.clock()
+
+    def _release(self, future=None):
+        with self.lock:
+            self.busy -= 1
+            self.last_used = self.services.sessions.clock()
+        # Its footprint has changed; the store may need room
+        self.services.sessions.update(self)
+
+    def _emit(self, event, *args):
+        # Through the loop's FIFO, after any stream flush already scheduled
+        self.engine.after(0, event, *args)
+
+    def _with_queue_depth(self, message):
+        """Append the number of waiting requests to a status message"""
+        depth = self.queue_depth
+        return f"{message} | queued: {depth}" if depth else message
+
+    async def reply(self, user_message, mode, listener):
+        """Answer one message, reporting each step to listener"""
+        self._emit(listener.user_message, user_message)
+        self._emit(listener.status, self._with_queue_depth("Processing..."))
+
+        # Older turns relevant to this message, beyond the context window
+        recalled = []
+        if self.LONG_TERM_MEMORY:
+            recalled = await self.engine.run_blocking(
+                self.memory.search, user_message, self.RECALL_TURNS, len(self.context_window)
+            )
+
+        route = None
+        if self.services.router is not None:
+            route = self.services.router.route(user_message, self.persona, mode, self.engine.pending)
+        model, system_instruction = self._model_for(mode, route)
+        static_tokens = self._static_tokens(model)
+        chat, flat_tokens = None, None
+        if self.CHAT_SESSIONS:
+            # Only the new message is sent; the chat carries the history
+            chat = self.session.chat_for(model, self._session_preamble())
+            contextual_prompt = self._recall_block(recalled) + user_message
+            prompt_tokens, flat_tokens = self.session.measure(contextual_prompt, self.context_window)
+        else:
+            contextual_prompt = self.build_contextual_prompt(user_message, recalled)
+            prompt_tokens = self.context_window.measure(contextual_prompt)
+            if self.TOKEN_CALIBRATION_EVERY and (self.context_window.prompts_measured - 1) % self.TOKEN_CALIBRATION_EVERY == 0:
+                # Refine the local token estimate off the reply path
+                asyncio.create_task(self._calibrate_tokens(model, contextual_prompt))
+        if static_tokens is not None:
+            # A warm-up counted the rest exactly; only the new text is estimated
+            prompt_tokens = static_tokens + self.context_window.estimate(self._recall_block(recalled) + user_message)
+
+        try:
+            response_text, note = await asyncio.wait_for(
+                self._generate_response(
+                    user_message, contextual_prompt, mode, model, system_instruction, listener, chat,
+                    tokens=flat_tokens or prompt_tokens, generation_config=route and route.generation_config,
+                ),
+                self.REQUEST_TIMEOUT,
+            )
+        except asyncio.TimeoutError:
+            self.session.discard(chat)
+            self._record_model(model, None)
+            self._emit(listener.error, f"No response after {self.REQUEST_TIMEOUT}s")
+            return None
+        except asyncio.CancelledError:
+            # Superseded or shut down mid-reply; the exchange is left out
+            self.session.discard(chat)
+            raise
+        except CircuitOpen as e:
+            self.session.discard(chat)
+            self._emit(listener.error, str(e))
+            self._show_cooldown(listener)
+            return None
+        except Exception as e:
+            # A half-finished exchange leaves the chat unusable
+            self.session.discard(chat)
+            self._emit(listener.error, str(e))
+            if self.services.guard.cooldown_remaining() > 0:
+                # This failure opened the breaker
+                self._show_cooldown(listener)
+            return None
+
+        # Update context once the full response is in
+        self._update_context(user_message, response_text, chat)
+        if self.CHAT_SESSIONS:
+            self.session.save(user_message, response_text)
+
+        status = "Response received"
+        if note:
+            status += f" | {note}"
+        status += f" | ~{prompt_tokens} prompt tokens"
+        if flat_tokens:
+            status += f" (~{flat_tokens} flattened)"
+        self._emit(listener.status, status)
+        return response_text, note
+
+    async def _generate_response(self, user_message, contextual_prompt, mode, model, system_instruction, listener,
+                                 chat=None, tokens=0, generation_config=None):
+        """Return (response_text, status_note), reporting the response as it arrives
+
+        The model call goes through the services' guard (rate limits,
+        retries, breaker); tokens is what the prompt is expected to cost.
+        While it is under way, requests with the same cache key (model,
+        persona, conversation and prompt) wait for its reply instead of
+        making their own call. generation_config is the routed model's
+        (None: the mode's model), part of both cache keys.
+        """
+        cache_key = self._cache_key(contextual_prompt, mode, model, system_instruction, chat, generation_config)
+        if cache_key:
+            cached = await self.engine.run_blocking(self.services.cache.get, cache_key)
+            if cached is not None:
+                self._emit(listener.reply, cached)
+                return cached, "from cache"
+
+        semantic_scope = self._semantic_scope(mode, generation_config)
+        if semantic_scope:
+            similar = self.services.semantic_cache.get(semantic_scope, user_message)
+            if similar is not None:
+                self._emit(listener.reply, similar)
+                return similar, "from cache (similar message)"
+
+        # An identical prompt already on its way to the model: wait for its reply
+        in_flight = self.services.in_flight
+        if cache_key in in_flight:
+            shared = await self._shared_reply(in_flight[cache_key])
+            if shared is not None:
+                self.services.shared_calls += 1
+                self._emit(listener.reply, shared)
+                return shared, "shared with an identical request"
+        owner = None
+        if cache_key and cache_key not in in_flight:
+            owner = in_flight[cache_key] = asyncio.get_running_loop().create_future()
+        try:
+            response_text, note = await self._call_model(contextual_prompt, model, listener, chat, tokens)
+        except BaseException:
+            if owner is not None:
+                # Anyone waiting makes its own call
+                owner.cancel()
+            raise
+        finally:
+            if owner is not None and in_flight.get(cache_key) is owner:
+                del in_flight[cache_key]
+        if owner is not None:
+            owner.set_result(response_text)
+
+        if semantic_scope:
+            self.services.semantic_cache.put(semantic_scope, user_message, response_text)
+        if cache_key:
+            await self.engine.run_blocking(self.services.cache.put, cache_key, response_text)
+        return response_text, note
+
+    async def _shared_reply(self, shared):
+        """The reply of the call shared, or None when it failed or was cancelled"""
+        try:
+            return await asyncio.shield(shared)
+        except asyncio.CancelledError:
+            if shared.cancelled() and not asyncio.current_task().cancelling():
+                return None
+            raise
+
+    async def _call_model(self, contextual_prompt, model, listener, chat, tokens):
+        """Return (response_text, status_note) from the model through the guard
+
+        With the services' hedger enabled, a call still silent past its
+        threshold is raced against a second one on a fork of the chat.
+        """
+        guard = self.services.guard
+        hedger = self.services.hedger
+        prewarmer = self.services.prewarmer
+        warmth = prewarmer.call_started()
+        started = time.perf_counter()
+
+        def notify(text):
+            self._emit(listener.status, text)
+
+        async def attempt(number, send, hedge=False):
+            target = chat
+            if chat is not None and hedge:
+                # The live chat is busy with the first call
+                target = self.session.fork(model, self._session_preamble())
+            elif chat is not None and number:
+                # The failed send may have left its chat unusable; start over from the saved turns
+                target = self.session.chat_for(model, self._session_preamble())
+            try:
+                return await send(target if target is not None else model)
+            except BaseException as e:
+                self.session.discard(target)
+                if isinstance(e, Exception):
+                    self._record_model(model, None)
+                raise
+
+        if self.STREAM_RESPONSES:
+            self._emit(listener.reply_start)
+            buffer = StreamBuffer(self.engine, listener.reply_text, self.STREAM_FLUSH_MS)
+
+            def run(sink, hedge=False):
+                return guard.call(
+                    lambda n: attempt(n, lambda target: stream_response(target, contextual_prompt, sink), hedge),
+                    tokens, notify,
+                    # Once text is on screen a retry would repeat it
+                    can_retry=lambda: sink.first_token_latency is None,
+                )
+
+            try:
+                response_text, hedged = await hedger.race(run, buffer) if hedger.enabled else (await run(buffer), False)
+            finally:
+                buffer.close()
+                self._emit(listener.reply_end)
+            first_token = buffer.first_token_latency
+            note = f"first token in {first_token:.2f}s" if first_token is not None else ""
+            if first_token is None:
+                first_token = time.perf_counter() - started
+            self._record_model(model, first_token)
+            prewarmer.first_token(warmth, first_token)
+        else:
+            async def send(target):
+                send_message = getattr(target, "send_message_async", None) or target.generate_content_async
+                return await send_message(contextual_prompt)
+
+            def run(sink=None, hedge=False):
+                return guard.call(lambda n: attempt(n, send, hedge), tokens, notify)
+
+            response, hedged = await hedger.race(run, None) if hedger.enabled else (await run(), False)
+            response_text, note = response.text, ""
+            elapsed = time.perf_counter() - started
+            self._record_model(model, elapsed)
+            prewarmer.first_token(warmth, elapsed)
+            self._emit(listener.reply, response_text)
+        if hedged:
+            # The live chat never finished this exchange; restart it from the saved turns
+            self.session.discard(chat)
+            note = f"{note} | hedged" if note else "hedged"
+        guard.charge(self.context_window.estimate(response_text))
+        return response_text, note
+
+    def prewarm(self, mode, draft="", focus=False):
+        """Get ready for a message in mode while it is being typed (draft so
+        far; focus when the input just got focus): start the chat it will go
+        to if the context has changed and, once the connection has idled,
+        warm it up by counting the tokens of what the message will reuse.
+        Returns at once; the work runs on the engine's loop."""
+        connect = self.services.prewarmer.due(focus) and self.services.guard.cooldown_remaining() <= 0
+        if self.prewarming or not (connect or self.prepared != self._static_key()):
+            return False
+        self.prewarming = True
+        self._spawn(lambda: self._prewarm(mode, draft, connect))
+        return True
+
+    async def _prewarm(self, mode, draft, connect):
+        try:
+            route = None
+            if self.services.router is not None:
+                route = self.services.router.peek(draft, self.persona, mode, self.engine.pending)
+            model, _ = self._model_for(mode, route)
+            key = self._static_key()
+            contents = None
+            if self.CHAT_SESSIONS:
+                with self.lock:
+                    idle = not self.requests
+                if idle:
+                    # A reply under way still needs the live chat
+                    self.session.chat_for(model, self._session_preamble())
+                contents = self.session.turns(self._session_preamble())
+            if not contents:
+                _, summary_part, conversation_part = self._static_prompt()
+                contents = summary_part + conversation_part
+            self.prepared = key
+            if connect:
+                tokens = await self.services.prewarmer.warm(model, contents)
+                if tokens is not None and key == self._static_key():
+                    self.static_count = ((key, model.model_name), tokens)
+        finally:
+            self.prewarming = False
+
+    def _static_key(self):
+        return self.context_window.version, self.summary.text
+
+    def _static_prompt(self):
+        """(key, summary part, conversation part) of the flat prompt, rebuilt
+        only when the context window or the summary has changed"""
+        key = self._static_key()
+        if self.prompt_cache is None or self.prompt_cache[0] != key:
+            summary_str = f"Earlier Conversation Summary:\n{self.summary.text}\n\n" if self.summary.text else ""
+            conversation = f"{self.persona['context_heading']}:\n" + "\n".join(self.context_window) + "\n\n"
+            self.prompt_cache = (key, summary_str, conversation)
+        return self.prompt_cache
+
+    def _static_tokens(self, model):
+        """Exact token count of what is sent besides the new text, if a
+        warm-up counted it for this model and context"""
+        if self.static_count is None or self.static_count[0] != (self._static_key(), model.model_name):
+            return None
+        return self.static_count[1]
+
+    def _show_cooldown(self, listener):
+        """Count the open breaker's cooldown down in listener's status, once a second"""
+        if listener not in self.cooldown_listeners:
+            self.cooldown_listeners.add(listener)
+            self._tick_cooldown(listener)
+
+    def _tick_cooldown(self, listener):
+        remaining = self.services.guard.cooldown_remaining()
+        if remaining <= 0:
+            self.cooldown_listeners.discard(listener)
+            self._emit(listener.status, "Ready")
+            return
+        self._emit(listener.status, f"Model unavailable | retrying in {math.ceil(remaining)}s")
+        self.engine.after(min(1000, remaining * 1000), self._tick_cooldown, listener)
+
+    def _model_for(self, mode, route=None):
+        """Pre-built (model, system_instruction) for a mode; typed-in modes
+        and routed models are built on first use"""
+        if route is None:
+            return self.services.models.get((self.scope_key, mode), lambda: self.build_system_instruction(mode))
+        return self.services.models.get(
+            (self.scope_key, mode, route.model_name, route.max_output_tokens),
+            lambda: self.build_system_instruction(mode), route.model_name, route.generation_config,
+        )
+
+    def _record_model(self, model, latency):
+        """Tell the router how a call to model went (latency None: it failed)"""
+        if self.services.router is not None:
+            self.services.router.record(model.model_name, latency)
+
+    def _cache_key(self, contextual_prompt, mode, model, system_instruction, chat=None, generation_config=None):
+        """Response cache key, or None when caching is off for this mode"""
+        if not self.CACHE_RESPONSES or mode in self.UNCACHED_MODES:
+            return None
+        if chat is not None:
+            # The message alone is not the prompt; key it on the conversation too
+            contextual_prompt = [self.session.digest, self.session.preamble, contextual_prompt]
+        # A reply cut short for a small route must not answer a larger one
+        return make_cache_key(model.model_name, contextual_prompt, generation_config, system_instruction)
+
+    def _semantic_scope(self, mode, generation_config=None):
+        """Persona, session, mode and generation config the near-duplicate
+        cache is keyed on, or None when off
+
+        Not the conversation so far, which changes every turn and would
+        leave nothing to match: a near-repeat of an earlier message in the
+        session gets that message's reply back.
+        """
+        if not self.SEMANTIC_CACHE or mode in self.UNCACHED_MODES:
+            return None
+        config = tuple(sorted((generation_config or {}).items()))
+        return (self.scope_key, self.scope, mode, config)
+
+    async def _compact_memory(self):
+        """Fold turns that left the context window into the rolling summary"""
+        await self.summary.fold(self.context_window.drain_overflow(), self.engine.run_blocking)
+
+    async def _calibrate_tokens(self, model, contextual_prompt):
+        """Calibrate the context window's token estimate with count_tokens"""
+        try:
+            result = await model.count_tokens_async(contextual_prompt)
+        except Exception:
+            return
+        self.context_window.calibrate(contextual_prompt, result.total_tokens)
+
+    def _context_entry(self, user_message, response_text):
+        return self.persona["context_entry"].format(user=user_message, reply=response_text)
+
+    def _update_context(self, user_message, response_text, chat=None):
+        """Add a finished exchange to the context window and the chat session"""
+        context_entry = self._context_entry(user_message, response_text)
+        self.context_window.append(context_entry)
+        if self.LONG_TERM_MEMORY and self.memory.add(context_entry):
+            self._spawn(self._merge_memory)
+        if self.CHAT_SESSIONS:
+            self.session.record(user_message, response_text, chat, keep=len(self.context_window))
+
+        if self.context_window.has_overflow():
+            # Summarize turns that left the window without holding up replies
+            self._spawn(self._compact_memory)
+
+    def load_session(self):
+        """Rebuild the context window and chat history from saved exchanges"""
+        self._load_snapshot()
+        exchanges = self.session.load(self.MAX_STORED_TURNS)
+        self.restored = self.restored or bool(exchanges)
+        self.context_window.extend(self._context_entry(u, r) for u, r in exchanges)
+        # Older saved turns are already covered by the saved summary
+        self.context_window.drain_overflow()
+        self.session.extend(exchanges[len(exchanges) - len(self.context_window):])
+        if self.LONG_TERM_MEMORY and not len(self.memory):
+            # First run with long-term memory: index what is already saved
+            for user_message, response_text in exchanges:
+                self.memory.add(self._context_entry(user_message, response_text))
+        return exchanges
+
+    def _recall_block(self, recalled):
+        """Relevant older turns from long-term memory, as a prompt section"""
+        if not recalled:
+            return ""
+        return "Relevant Earlier Conversation:\n" + "\n".join(recalled) + "\n\n"
+
+    async def _merge_memory(self):
+        """Fold new turns into the long-term memory index off the reply path"""
+        await self.engine.run_blocking(self.memory.merge)
+
+    def _session_preamble(self):
+        """Summary of earlier turns, sent with the oldest turn of the chat"""
+        return f"Earlier Conversation Summary:\n{self.summary.text}" if self.summary.text else ""
+
+    def footprint(self):
+        """Rough bytes this conversation holds in RAM (text plus per-turn overhead)"""
+        window = sum(len(entry) + 120 for entry in self.context_window)
+        history = self.session.history_chars + 200 * len(self.session)
+        return 4096 + window + history + len(self.summary.text) + self.memory.footprint()
+
+    def suspend(self):
+        """Write out what only lives in RAM, before the core is dropped"""
+        self.memory.flush()
+        snapshot = json.dumps({
+            "chars_per_token": self.context_window.chars_per_token,
+            "calibrations": self.context_window.calibrations,
+        })
+        self.services.writer.submit(self._write_snapshot, snapshot, time.time())
+
+    def _write_snapshot(self, conn, snapshot, now):
+        conn.execute(
+            f"INSERT OR REPLACE INTO {self.services.table} (key, value, timestamp) VALUES (?, ?, ?)",
+            (f"snapshot:{self.scope}", snapshot, now),
+        )
+
+    def _load_snapshot(self):
+        """Restore the token calibration saved by suspend(), if any"""
+        row = self.services.conn.execute(
+            f"SELECT value FROM {self.services.table} WHERE key = ?", (f"snapshot:{self.scope}",)
+        ).fetchone()
+        if row is None:
+            return
+        try:
+            snapshot = json.loads(row[0])
+            self.context_window.chars_per_token = float(snapshot["chars_per_token"])
+            self.context_window.calibrations = int(snapshot["calibrations"])
+        except (TypeError, ValueError, KeyError):
+            return
+        self.restored = True
+
+    def build_system_instruction(self, mode):
+        """Persona and mode text, compiled once per mode into a model's system instruction"""
+        return self.persona["instruction"].format(mode=mode, instructions=self.persona["modes"].get(mode, ''))
+
+    def build_contextual_prompt(self, user_message, recalled=()):
+        """Per-message payload: only the conversation, the persona lives in the system instruction"""
+        _, summary_str, conversation = self._static_prompt()
+        return f"""{summary_str}{self._recall_block(recalled)}{conversation}{self.persona["latest_label"]}: {user_message}
+"""
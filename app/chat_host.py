@@ -0,0 +1,276 @@
+"""Run every persona in one process, as tabs on one engine, worker and store"""
+import tkinter as tk
+from tkinter import ttk, messagebox
+import argparse
+import importlib.util
+import json
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from personas import PERSONAS
+from startup import BackgroundInit, mark, profile_startup
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+class ChatHost:
+    """One Tk root with a notebook tab per persona in the registry
+
+    The expensive parts are one ChatServices, built once and shared: one
+    event loop thread runs every persona's requests (each in its own lane,
+    so one persona's queue never holds up another), one worker thread does
+    the SQLite reads, one writer thread group-commits the writes and the
+    model pool and response caches are common. Personas keep their data
+    apart by scope inside one database file.
+
+    A tab's chat is built the first time it is shown, so startup only pays
+    for the personas actually opened (open_all builds every tab up front).
+    The window paints before any of it: the services are built on a
+    background thread, and tabs shown meanwhile are built once they are up.
+    """
+
+    def __init__(self, master, personas=None, db_path="chat_host.db", open_all=False):
+        self.master = master
+        self.personas = personas or PERSONAS
+        master.title("Chat Host")
+        master.geometry("1000x800")
+
+        # Custom theme setup; each persona configures its own named styles
+        self.style = ttk.Style()
+        self.style.theme_use('clam')
+
+        # Chat services shared by every persona: one WAL database and
+        # writer thread, one event loop thread running every persona's
+        # requests (one in flight per persona at most, replies in order
+        # within a persona), one db worker, the model pool (one model per
+        # persona and mode, built when a persona is first opened) and the
+        # response caches, whose keys carry the persona
+        self.MODEL_NAME = "gemini-1.5-flash"
+        self.SUMMARY_MODEL = None
+        self.MAX_IN_FLIGHT = len(self.personas)
+        self.MAX_QUEUED_MESSAGES = 5 * len(self.personas)
+        # Race a second call against one slow to start (costs extra quota)
+        self.HEDGE_SLOW_CALLS = False
+        # Pick a model tier and reply length per message (see model_router.py;
+        # short messages get the smallest model and 256-token replies)
+        self.ROUTE_MODELS = False
+        # Log each pick to ~/.gemini_routing.jsonl for model_router.py replays
+        self.LOG_ROUTING = False
+        # Warm the connection and the prompt up as the user focuses a tab's input or types
+        self.PREWARM_ON_TYPING = True
+        self.db_path = db_path
+        self.services = self.bridge = None
+        master.protocol("WM_DELETE_WINDOW", self.on_close)
+
+        # Full-text search over every persona's turns (scoped per tab)
+        master.bind("<Control-f>", self.open_search)
+
+        # One tab per persona, its chat built on first view
+        self.chats = {}
+        self.tabs = {}
+        self.notebook = ttk.Notebook(master)
+        self.notebook.pack(fill=tk.BOTH, expand=True)
+        for key, persona in self.personas.items():
+            self.tabs[key] = ttk.Frame(self.notebook)
+            self.notebook.add(self.tabs[key], text=persona["name"])
+        self.notebook.bind("<<NotebookTabChanged>>", self.on_tab_changed)
+
+        # The window paints first: the Gemini SDK import and the database
+        # open on a background thread
+        self.startup = BackgroundInit(
+            master, self._start_services, self._services_ready, self._startup_failed,
+            dispose=lambda services: services.close(timeout=2),
+        )
+        self.startup.start()
+        if open_all:
+            for key in self.personas:
+                self.startup.when_ready(self.open_persona, key)
+        self.on_tab_changed()
+
+    def _start_services(self):
+        """Import the SDK and open the shared services (on the startup thread)"""
+        import google.generativeai as genai
+        from chat_core import ChatServices
+        from governor import Governor
+        from model_router import DEFAULT_LOG, ModelRouter
+        # Imported here so opening the first tab does not import it on the Tk thread
+        import persona_chat
+        mark("sdk")
+
+        genai.configure(api_key=os.environ["GEMINI_API_KEY"])
+        services = ChatServices(
+            self.db_path,
+            lambda instruction, name=None, config=None: genai.GenerativeModel(
+                model_name=name or self.MODEL_NAME, system_instruction=instruction, generation_config=config,
+            ),
+            max_in_flight=self.MAX_IN_FLIGHT,
+            max_queue=self.MAX_QUEUED_MESSAGES,
+            max_reads=50 * len(self.personas),
+            summary_model=genai.GenerativeModel(model_name=self.SUMMARY_MODEL) if self.SUMMARY_MODEL else None,
+            # Shared with every other chat app using the key
+            governor=Governor("chat-host"),
+            hedge=self.HEDGE_SLOW_CALLS,
+            router=ModelRouter(log_path=DEFAULT_LOG if self.LOG_ROUTING else None) if self.ROUTE_MODELS else None,
+            prewarm=self.PREWARM_ON_TYPING,
+            max_models=8 * len(self.personas),
+        )
+        mark("services")
+        return services
+
+    def _services_ready(self, services):
+        from async_engine import TkBridge
+
+        self.services = services
+        self.bridge = TkBridge(self.master)
+
+    def _startup_failed(self, error):
+        messagebox.showerror("Chat Host", f"Could not start the chat services: {error}")
+
+    def open_persona(self, key):
+        """Return the persona's chat, building its tab on first use (once the services are up)"""
+        from persona_chat import PersonaChat
+
+        chat = self.chats.get(key)
+        if chat is None:
+            chat = self.chats[key] = PersonaChat(self.tabs[key], key, self.personas[key], self)
+            chat.frame.pack(fill=tk.BOTH, expand=True)
+        return chat
+
+    def current_persona(self):
+        return list(self.personas)[self.notebook.index(self.notebook.select())]
+
+    def on_tab_changed(self, event=None):
+        key = self.current_persona()
+        self.startup.when_ready(self.open_persona, key)
+        self.master.title(self.personas[key]["title"])
+
+    def open_search(self, event=None):
+        if self.services is None:
+            return self.startup.when_ready(self.open_search)
+        self.open_persona(self.current_persona()).open_search()
+
+    def on_close(self):
+        """Cancel outstanding requests, flush every persona and close the window"""
+        if self.services is not None:
+            self.services.close(timeout=2)
+            self.bridge.stop()
+        else:
+            self.startup.cancel()
+        self.master.destroy()
+
+
+def _report(started, **extra):
+    """Print startup time and peak memory of this process as one JSON line"""
+    report = {
+        "startup": time.perf_counter() - started,
+        # ru_maxrss is in KiB on Linux
+        "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        **extra,
+    }
+    print(json.dumps(report), flush=True)
+
+
+def _wait_ready(root, startup):
+    """Run Tk until the background startup is done and its queued calls have run"""
+    while not startup.done:
+        root.update()
+        time.sleep(0.005)
+    root.update()
+
+
+def _report_host(started):
+    """Start the host with every tab built, report, then close"""
+    root = tk.Tk()
+    host = ChatHost(root, open_all=True)
+    _wait_ready(root, host.startup)
+    _report(started, personas=len(host.chats), ui=host.bridge.stats())
+    host.on_close()
+
+
+def _report_app(started, key):
+    """Start one standalone persona app, report, then close"""
+    filename, class_name = PERSONAS[key]["app"]
+    spec = importlib.util.spec_from_file_location(class_name, os.path.join(APP_DIR, filename))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    root = tk.Tk()
+    app = getattr(module, class_name)(root)
+    _wait_ready(root, app.startup)
+    _report(started, app=filename)
+    app.on_close()
+
+
+def _launch(args, cwd):
+    """Run this script with args in cwd; returns (wall seconds to first report, report)"""
+    started = time.perf_counter()
+    child = subprocess.Popen(
+        [sys.executable, os.path.abspath(__file__), *args], cwd=cwd, stdout=subprocess.PIPE, text=True
+    )
+    line = child.stdout.readline()
+    wall = time.perf_counter() - started
+    child.wait()
+    if not line:
+        raise RuntimeError(f"{args} exited with {child.returncode} before reporting")
+    return wall, json.loads(line)
+
+
+def measure(repeat=3):
+    """Startup time and peak memory: one host with every persona against one
+    process per standalone app, each run in a fresh directory"""
+    runs = {"host": [], "apps": []}
+    for _ in range(repeat):
+        with tempfile.TemporaryDirectory() as cwd:
+            runs["host"].append(_launch(["--report"], cwd))
+        with tempfile.TemporaryDirectory() as cwd:
+            runs["apps"].append([_launch(["--report-app", key], cwd) for key in PERSONAS])
+
+    host_wall = statistics.median(wall for wall, _ in runs["host"])
+    host_rss = statistics.median(report["max_rss_mb"] for _, report in runs["host"])
+    apps_wall = statistics.median(sum(wall for wall, _ in apps) for apps in runs["apps"])
+    apps_rss = statistics.median(sum(report["max_rss_mb"] for _, report in apps) for apps in runs["apps"])
+    return {
+        "host_startup": host_wall,
+        "host_rss_mb": host_rss,
+        "apps_startup": apps_wall,
+        "apps_rss_mb": apps_rss,
+        "apps": len(PERSONAS),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--measure", action="store_true",
+                        help="compare startup time and memory with one process per persona app")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--profile-startup", action="store_true",
+                        help="report when the window paints and the chat is ready, and the slowest imports")
+    parser.add_argument("--report", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--report-app", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    if args.report:
+        return _report_host(started)
+    if args.report_app:
+        return _report_app(started, args.report_app)
+    if args.profile_startup:
+        return profile_startup(__file__, ChatHost)
+    if args.measure:
+        results = measure(args.repeat)
+        print(f"{results['apps']} app processes: {results['apps_startup']:.2f}s to start one after another, "
+              f"{results['apps_rss_mb']:.0f} MB peak RSS in total")
+        print(f"1 host process:  {results['host_startup']:.2f}s to start every persona, "
+              f"{results['host_rss_mb']:.0f} MB peak RSS")
+        return
+
+    root = tk.Tk()
+    ChatHost(root)
+    root.mainloop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,485 @@
+"""Headless chat server: the chat core over HTTP, server-sent events and WebSocket"""
+import argparse
+import asyncio
+import base64
+import hashlib
+import json
+import os
+import re
+import struct
+import time
+import uuid
+from urllib.parse import urlsplit
+from worker_pool import QueueFull
+from chat_core import ChatListener, ChatServices, ViewListener
+from governor import Governor
+from model_router import ModelRouter
+from gemini_rest import DEFAULT_BASE_URL, GeminiClient, HttpClient
+from personas import PERSONAS
+
+MAX_BODY = 1 << 20
+WS_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+REASONS = {
+    101: "Switching Protocols", 200: "OK", 201: "Created", 202: "Accepted", 400: "Bad Request", 404: "Not Found",
+    405: "Method Not Allowed", 413: "Payload Too Large", 429: "Too Many Requests",
+    500: "Internal Server Error", 502: "Bad Gateway", 503: "Service Unavailable",
+}
+
+
+class HttpError(Exception):
+    """Answer the request with status and a JSON error message"""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+class Request:
+    def __init__(self, method, target, headers, body):
+        parts = urlsplit(target)
+        self.method = method
+        self.path = parts.path
+        self.query = parts.query
+        self.headers = headers
+        self.body = body
+
+    def json(self):
+        """The body as a JSON object (an empty body is an empty object)"""
+        try:
+            data = json.loads(self.body or b"{}")
+        except ValueError:
+            raise HttpError(400, "body is not valid JSON")
+        if not isinstance(data, dict):
+            raise HttpError(400, "body must be a JSON object")
+        return data
+
+
+class EventStream(ChatListener):
+    """Queue a core's events as JSON-ready dicts, ending with a "done" event
+
+    Events and the end of the request both arrive through the engine's FIFO,
+    so "done" always comes after every event of its reply.
+    """
+
+    def __init__(self):
+        self.events = asyncio.Queue()
+        for event in ViewListener.EVENTS:
+            setattr(self, event, lambda *args, event=event: self._put(event, *args))
+
+    def _put(self, event, text=None):
+        self.events.put_nowait({"event": event} if text is None else {"event": event, "text": text})
+
+    def finish(self, future):
+        if future.cancelled():
+            done = {"event": "done", "ok": False, "error": "cancelled"}
+        elif future.exception() is not None:
+            done = {"event": "done", "ok": False, "error": str(future.exception())}
+        elif future.result() is None:
+            done = {"event": "done", "ok": False}
+        else:
+            reply, note = future.result()
+            done = {"event": "done", "ok": True, "reply": reply, "note": note}
+        self.events.put_nowait(done)
+
+    async def __aiter__(self):
+        while True:
+            event = await self.events.get()
+            yield event
+            if event["event"] == "done":
+                return
+
+
+class ChatServer:
+    """Serve ChatServices over HTTP/1.1 and WebSocket on the engine's event loop
+
+    Sessions are "<persona>.<session>" ids, each its own ChatCore with its
+    own context and stored turns, so a session picks up where it left off
+    after a restart or an idle eviction. Routes:
+
+        GET  /health, /stats, /personas
+        POST /sessions                      {"persona", "session"?}
+        POST /sessions/<id>/messages        {"message", "mode"?, "stream"?}
+        POST /sessions/<id>/typing          {"mode"?, "draft"?, "focus"?}
+        GET  /sessions/<id>/ws              WebSocket, {"message", "mode"?} frames
+
+    A message answers with one JSON object, or with server-sent events when
+    "stream" is set or the client accepts text/event-stream. WebSocket
+    connections get the same events as JSON text frames.
+
+    A client tells the server the user is typing (POST .../typing, or a
+    {"typing": true} frame) so the session's chat and model connection get
+    ready before the message arrives (see ChatCore.prewarm).
+    """
+
+    ROUTES = [
+        ("GET", re.compile(r"/health"), "_health"),
+        ("GET", re.compile(r"/stats"), "_stats"),
+        ("GET", re.compile(r"/personas"), "_personas"),
+        ("POST", re.compile(r"/sessions"), "_create_session"),
+        ("POST", re.compile(r"/sessions/(?P<session_id>[^/]+)/messages"), "_post_message"),
+        ("POST", re.compile(r"/sessions/(?P<session_id>[^/]+)/typing"), "_typing"),
+        ("GET", re.compile(r"/sessions/(?P<session_id>[^/]+)/ws"), "_websocket"),
+    ]
+
+    def __init__(self, services, host="127.0.0.1", port=8080, personas=None, client=None):
+        self.services = services
+        self.engine = services.engine
+        self.host = host
+        self.port = port
+        self.personas = personas or PERSONAS
+        self.client = client
+        self.server = None
+        self.writers = set()
+
+        # Counters
+        self.connections = 0
+        self.requests = 0
+        self.streams = 0
+        self.websockets = 0
+        self.errors = 0
+
+    def start(self, timeout=10):
+        """Start listening on the engine's loop; returns the bound port"""
+        future = asyncio.run_coroutine_threadsafe(self._start(), self.engine.loop)
+        return future.result(timeout)
+
+    async def _start(self):
+        self.server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        return self.port
+
+    def close(self, timeout=5):
+        """Stop listening, drop open connections, then close the services"""
+        try:
+            asyncio.run_coroutine_threadsafe(self._stop(), self.engine.loop).result(timeout)
+        finally:
+            self.services.close(timeout=timeout)
+
+    async def _stop(self):
+        if self.server is not None:
+            self.server.close()
+        for writer in list(self.writers):
+            writer.close()
+        if self.client is not None:
+            self.client.close()
+
+    def stats(self):
+        stats = {
+            "server": {
+                "connections": self.connections,
+                "open": len(self.writers),
+                "requests": self.requests,
+                "streams": self.streams,
+                "websockets": self.websockets,
+                "errors": self.errors,
+            },
+            **self.services.stats(),
+        }
+        if self.client is not None:
+            stats["gemini"] = self.client.stats()
+        return stats
+
+    async def _handle(self, reader, writer):
+        self.connections += 1
+        self.writers.add(writer)
+        try:
+            keep_alive = True
+            while keep_alive:
+                try:
+                    request = await self._read_request(reader)
+                    if request is None:
+                        break
+                    self.requests += 1
+                    keep_alive = await self._dispatch(request, reader, writer)
+                except HttpError as e:
+                    self.errors += 1
+                    keep_alive = await self._send_json(writer, e.status, {"error": e.message})
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+            pass
+        finally:
+            self.writers.discard(writer)
+            writer.close()
+
+    async def _read_request(self, reader):
+        """Next request on the connection, or None once the client is done"""
+        line = await reader.readline()
+        if not line.strip():
+            return None
+        try:
+            method, target, _ = line.decode("latin-1").split()
+        except ValueError:
+            raise HttpError(400, "malformed request line")
+        headers = {}
+        while (line := await reader.readline()).strip():
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        length = int(headers.get("content-length") or 0)
+        if length > MAX_BODY:
+            raise HttpError(413, f"body over {MAX_BODY} bytes")
+        body = await reader.readexactly(length) if length else b""
+        return Request(method, target, headers, body)
+
+    async def _dispatch(self, request, reader, writer):
+        """Route the request; returns whether the connection stays open"""
+        allowed = False
+        for method, pattern, handler in self.ROUTES:
+            match = pattern.fullmatch(request.path)
+            if match is None:
+                continue
+            if method != request.method:
+                allowed = True
+                continue
+            return await getattr(self, handler)(request, reader, writer, **match.groupdict())
+        if allowed:
+            raise HttpError(405, f"{request.method} not allowed on {request.path}")
+        raise HttpError(404, f"no route for {request.path}")
+
+    async def _send(self, writer, status, headers, body=b""):
+        lines = [f"HTTP/1.1 {status} {REASONS.get(status, '')}"]
+        lines += [f"{name}: {value}" for name, value in headers.items()]
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + body)
+        await writer.drain()
+
+    async def _send_json(self, writer, status, data):
+        body = json.dumps(data).encode("utf-8")
+        await self._send(writer, status, {
+            "Content-Type": "application/json", "Content-Length": len(body),
+        }, body)
+        return True
+
+    async def _health(self, request, reader, writer):
+        return await self._send_json(writer, 200, {"ok": True})
+
+    async def _stats(self, request, reader, writer):
+        return await self._send_json(writer, 200, self.stats())
+
+    async def _personas(self, request, reader, writer):
+        return await self._send_json(writer, 200, {
+            key: {"name": persona["name"], "modes": list(persona["modes"]), "default_mode": persona["default_mode"]}
+            for key, persona in self.personas.items()
+        })
+
+    async def _open_session(self, session_id):
+        """(persona, core) for a "<persona>.<session>" id; the core loads on the db worker"""
+        key, _, session = session_id.partition(".")
+        persona = self.personas.get(key)
+        if persona is None:
+            raise HttpError(404, f"no persona {key!r}")
+        try:
+            core = await self.engine.run_blocking(self.services.core, persona, session)
+        except ValueError as e:
+            raise HttpError(400, str(e))
+        return persona, core
+
+    async def _create_session(self, request, reader, writer):
+        data = request.json()
+        key = data.get("persona")
+        session_id = f"{key}.{data.get('session') or uuid.uuid4().hex[:12]}"
+        persona, core = await self._open_session(session_id)
+        return await self._send_json(writer, 201, {
+            "session": session_id, "persona": key, "modes": list(persona["modes"]),
+            "default_mode": persona["default_mode"], "exchanges": len(core.session),
+        })
+
+    def _submit(self, persona, core, data):
+        """Send a message to the core; returns the EventStream carrying its reply"""
+        message = data.get("message")
+        if not isinstance(message, str) or not message.strip():
+            raise HttpError(400, "message must be a non-empty string")
+        mode = data.get("mode") or persona["default_mode"]
+        events = EventStream()
+        try:
+            future = core.send(message.strip(), mode, events, supersede=data.get("supersede"))
+        except QueueFull as e:
+            raise HttpError(429, str(e))
+        except RuntimeError as e:
+            raise HttpError(503, str(e))
+        future.add_done_callback(lambda f: self.engine.after(0, events.finish, f))
+        return events
+
+    async def _post_message(self, request, reader, writer, session_id):
+        persona, core = await self._open_session(session_id)
+        data = request.json()
+        events = self._submit(persona, core, data)
+        if data.get("stream") or "text/event-stream" in request.headers.get("accept", ""):
+            return await self._stream_events(writer, events)
+
+        status, error = None, None
+        async for event in events:
+            if event["event"] == "status":
+                status = event["text"]
+            elif event["event"] == "error":
+                error = event["text"]
+        if not event["ok"]:
+            return await self._send_json(writer, 502, {"error": error or event.get("error", "no reply")})
+        return await self._send_json(writer, 200, {"reply": event["reply"], "note": event["note"], "status": status})
+
+    def _prewarm(self, persona, core, data):
+        """Get the core ready for a message being typed; returns whether it started warming"""
+        return core.prewarm(data.get("mode") or persona["default_mode"], data.get("draft") or "", bool(data.get("focus")))
+
+    async def _typing(self, request, reader, writer, session_id):
+        persona, core = await self._open_session(session_id)
+        warming = self._prewarm(persona, core, request.json())
+        return await self._send_json(writer, 202, {"warming": warming})
+
+    async def _stream_events(self, writer, events):
+        """Write the events as server-sent events in a chunked response"""
+        self.streams += 1
+        await self._send(writer, 200, {
+            "Content-Type": "text/event-stream", "Cache-Control": "no-cache", "Transfer-Encoding": "chunked",
+        })
+        async for event in events:
+            data = f"event: {event['event']}\ndata: {json.dumps(event)}\n\n".encode("utf-8")
+            writer.write(b"%x\r\n%s\r\n" % (len(data), data))
+            await writer.drain()
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+        return True
+
+    async def _websocket(self, request, reader, writer, session_id):
+        persona, core = await self._open_session(session_id)
+        key = request.headers.get("sec-websocket-key")
+        if request.headers.get("upgrade", "").lower() != "websocket" or not key:
+            raise HttpError(400, "expected a WebSocket upgrade")
+        accept = base64.b64encode(hashlib.sha1((key + WS_GUID).encode("ascii")).digest()).decode("ascii")
+        await self._send(writer, 101, {
+            "Upgrade": "websocket", "Connection": "Upgrade", "Sec-WebSocket-Accept": accept,
+        })
+        self.websockets += 1
+
+        while True:
+            opcode, payload = await read_frame(reader)
+            if opcode == 0x8:
+                await write_frame(writer, 0x8, payload[:2])
+                return False
+            if opcode == 0x9:
+                await write_frame(writer, 0xA, payload)
+                continue
+            if opcode != 0x1:
+                continue
+            try:
+                data = json.loads(payload)
+                if not isinstance(data, dict):
+                    raise ValueError("frame must be a JSON object")
+                # Looked up per message: an idle session may have been evicted
+                persona, core = await self._open_session(session_id)
+                if data.get("typing"):
+                    self._prewarm(persona, core, data)
+                    continue
+                events = self._submit(persona, core, data)
+            except (ValueError, HttpError) as e:
+                self.errors += 1
+                await write_frame(writer, 0x1, json.dumps({"event": "error", "text": str(e)}).encode("utf-8"))
+                continue
+            async for event in events:
+                await write_frame(writer, 0x1, json.dumps(event).encode("utf-8"))
+
+
+async def read_frame(reader, mask_required=True):
+    """Next complete WebSocket message as (opcode, payload); fragments are joined"""
+    message_opcode, parts = None, []
+    while True:
+        first, second = await reader.readexactly(2)
+        fin, opcode = first & 0x80, first & 0x0F
+        masked, length = second & 0x80, second & 0x7F
+        if length == 126:
+            length = struct.unpack("!H", await reader.readexactly(2))[0]
+        elif length == 127:
+            length = struct.unpack("!Q", await reader.readexactly(8))[0]
+        if length > MAX_BODY or (mask_required and not masked):
+            raise ConnectionError("bad WebSocket frame")
+        mask = await reader.readexactly(4) if masked else None
+        payload = await reader.readexactly(length)
+        if mask:
+            payload = bytes(b ^ mask[i % 4] for i, b in enumerate(payload))
+        if opcode >= 0x8:
+            # Control frames may arrive between fragments
+            return opcode, payload
+        if opcode:
+            message_opcode = opcode
+        parts.append(payload)
+        if fin:
+            return message_opcode, b"".join(parts)
+
+
+async def write_frame(writer, opcode, payload, mask=False):
+    """Write one unfragmented frame (clients must mask theirs)"""
+    length = len(payload)
+    if length < 126:
+        head = struct.pack("!BB", 0x80 | opcode, (0x80 if mask else 0) | length)
+    elif length < 1 << 16:
+        head = struct.pack("!BBH", 0x80 | opcode, (0x80 if mask else 0) | 126, length)
+    else:
+        head = struct.pack("!BBQ", 0x80 | opcode, (0x80 if mask else 0) | 127, length)
+    if mask:
+        key = os.urandom(4)
+        head += key
+        payload = bytes(b ^ key[i % 4] for i, b in enumerate(payload))
+    writer.write(head + payload)
+    await writer.drain()
+
+
+def create_server(db_path, api_key, base_url=DEFAULT_BASE_URL, model_name="gemini-1.5-flash",
+                  host="127.0.0.1", port=8080, max_in_flight=8, max_queue=40,
+                  requests_per_minute=15, tokens_per_minute=1_000_000, governor=None, hedge=False, router=None):
+    """ChatServer over a fresh ChatServices using the REST client (not yet started);
+    with a router, model_name is only the default for unrouted calls"""
+    client = GeminiClient(api_key, base_url, http=HttpClient())
+    services = ChatServices(
+        db_path,
+        lambda instruction, name=None, config=None: client.GenerativeModel(name or model_name, instruction, config),
+        max_in_flight=max_in_flight,
+        max_queue=max_queue,
+        max_models=8 * len(PERSONAS) * (len(router.tiers) if router is not None else 1),
+        requests_per_minute=requests_per_minute,
+        tokens_per_minute=tokens_per_minute,
+        governor=governor,
+        hedge=hedge,
+        router=router,
+    )
+    return ChatServer(services, host, port, client=client)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--db", default="chat_server.db")
+    parser.add_argument("--model", default="gemini-1.5-flash")
+    parser.add_argument("--gemini-endpoint", default=DEFAULT_BASE_URL,
+                        help="Gemini REST base URL, e.g. a local fake_gemini.py")
+    parser.add_argument("--max-in-flight", type=int, default=8)
+    parser.add_argument("--max-queue", type=int, default=40)
+    parser.add_argument("--rpm", type=int, default=15, help="Gemini requests per minute (0: no limit)")
+    parser.add_argument("--tpm", type=int, default=1_000_000, help="Gemini tokens per minute (0: no limit)")
+    parser.add_argument("--shared-quota", action="store_true",
+                        help="take turns with the desktop apps through the shared governor (its limits replace --rpm/--tpm)")
+    parser.add_argument("--hedge", action="store_true",
+                        help="race a duplicate Gemini call against one slow to start (at most one call in ten)")
+    parser.add_argument("--route", action="store_true",
+                        help="pick a model tier and reply length per message instead of always --model")
+    parser.add_argument("--routing-log", help="log --route's decisions to this file for replays (default: no log)")
+    args = parser.parse_args()
+
+    server = create_server(
+        args.db, os.environ["GEMINI_API_KEY"], args.gemini_endpoint, args.model,
+        args.host, args.port, args.max_in_flight, args.max_queue, args.rpm, args.tpm,
+        governor=Governor("server") if args.shared_quota else None,
+        hedge=args.hedge,
+        router=ModelRouter(log_path=args.routing_log) if args.route else None,
+    )
+    port = server.start()
+    print(f"Serving on http://{args.host}:{port}", flush=True)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,228 @@
+"""Multi-turn chat history kept as structured turns for start_chat"""
+import hashlib
+import json
+import math
+import threading
+import time
+import uuid
+
+
+class ChatSession:
+    """Keep the conversation as user/model Content turns and a live chat
+
+    Each exchange is turned into two {"role", "parts"} dicts once, when it
+    completes. chat_for() starts a chat from that history and the SDK appends
+    to it as messages are sent, so later messages send only the new text
+    instead of re-joining the transcript. The chat is restarted only when the
+    history changes under it: another model (mode), a new preamble (summary),
+    turns trimmed from the front, or an exchange it did not produce itself
+    (cache hits, failed sends).
+
+    With a connection, exchanges are saved one row each in a key/value table
+    shaped like context_memory, namespaced by key_prefix, so the history can
+    be rebuilt after a restart. A session's rows are found by key range and
+    key length (prefix plus a 32-digit id), which is exact and uses the key
+    index, unlike LIKE (case-insensitive, _ a wildcard) or a bare range
+    (prefix "turn:a:" would also take "turn:a:b:..."). With a DbWriter,
+    saves are queued for its next group commit. With a store (anything with
+    load(limit) and save(user_message, reply), e.g. a TurnLog), exchanges
+    are loaded from and saved to it instead of the table.
+    """
+
+    KEY_MATCH = "key >= ? AND key < ? AND length(key) = ?"
+
+    def __init__(self, conn=None, table="context_memory", key_prefix="turn:", max_stored=200,
+                 prune_every=50, writer=None, store=None):
+        self.conn = conn
+        self.writer = writer
+        self.store = store
+        self.table = table
+        self.key_prefix = key_prefix
+        self.max_stored = max_stored
+        self.prune_every = prune_every
+        self.history = []
+        self.history_chars = 0
+        self.digest = ""
+        self.chat = None
+        self.chat_model = None
+        self.chat_turns = 0
+        self.preamble = ""
+        self.lock = threading.Lock()
+        self.db_lock = threading.Lock()
+        self.saves_since_prune = 0
+        self.key_range = (key_prefix, key_prefix + "\uffff", len(key_prefix) + 32)
+
+        # Counters
+        self.messages = 0
+        self.rebuilds = 0
+        self.sent_tokens_total = 0
+        self.flat_tokens_total = 0
+
+    def _start_history(self, preamble):
+        history = list(self.history)
+        if preamble and history:
+            # The summary rides along with the oldest user turn
+            history[0] = {"role": "user", "parts": [preamble] + history[0]["parts"]}
+        elif preamble:
+            history = [
+                {"role": "user", "parts": [preamble]},
+                {"role": "model", "parts": ["Understood."]},
+            ]
+        return history
+
+    def turns(self, preamble=""):
+        """The history a chat would start from, e.g. to count its tokens"""
+        with self.lock:
+            return self._start_history(preamble)
+
+    def chat_for(self, model, preamble=""):
+        """Return the live chat for model, restarting it if the history moved on"""
+        with self.lock:
+            if self.chat is None or self.chat_model is not model or self.preamble != preamble:
+                history = self._start_history(preamble)
+                self.chat = model.start_chat(history=history)
+                self.chat_model = model
+                self.chat_turns = len(history)
+                self.preamble = preamble
+                self.rebuilds += 1
+            return self.chat
+
+    def fork(self, model, preamble=""):
+        """A separate chat from the same turns (e.g. for a hedged send); it
+        never becomes the live chat, so record() restarts that if it wins"""
+        with self.lock:
+            return model.start_chat(history=self._start_history(preamble))
+
+    def discard(self, chat):
+        """Drop chat if it is the live one, e.g. after a failed or cancelled send"""
+        with self.lock:
+            if chat is not None and chat is self.chat:
+                self.chat = None
+
+    def record(self, user_message, reply, chat=None, keep=None):
+        """Append a finished exchange, keeping only the newest keep exchanges
+
+        chat is the live chat the message was meant for. If it produced the
+        reply it already has the exchange; otherwise (a cache hit) it is stale
+        and is restarted on next use.
+        """
+        with self.lock:
+            self._append(user_message, reply)
+            if chat is not None and chat is self.chat and self._chat_has(chat, self.chat_turns + 2):
+                self.chat_turns += 2
+            else:
+                self.chat = None
+            if keep is not None and len(self.history) > 2 * keep:
+                drop = len(self.history) - 2 * keep
+                self.history_chars -= sum(len(p) for turn in self.history[:drop] for p in turn["parts"])
+                del self.history[:drop]
+                self.chat = None
+
+    @staticmethod
+    def _chat_has(chat, turns):
+        try:
+            return len(chat.history) == turns
+        except Exception:
+            # An interrupted reply leaves the chat unusable
+            return False
+
+    def extend(self, exchanges):
+        """Append several (user_message, reply) exchanges, oldest first"""
+        with self.lock:
+            for user_message, reply in exchanges:
+                self._append(user_message, reply)
+            self.chat = None
+
+    def _append(self, user_message, reply):
+        self.history.append({"role": "user", "parts": [user_message]})
+        self.history.append({"role": "model", "parts": [reply]})
+        self.history_chars += len(user_message) + len(reply)
+        # Chained fingerprint of the conversation, for response cache keys
+        self.digest = hashlib.sha256(
+            json.dumps([self.digest, user_message, reply]).encode("utf-8")
+        ).hexdigest()
+
+    def __len__(self):
+        with self.lock:
+            return len(self.history) // 2
+
+    def measure(self, user_message, window):
+        """Estimate tokens sent for user_message and what the flattened prompt
+        would have cost, from running totals (nothing is re-joined)
+
+        window is the ContextWindow holding the same exchanges as strings.
+        Returns (sent_tokens, flat_tokens).
+        """
+        with self.lock:
+            extra = len(self.preamble) + len(user_message)
+            sent = math.ceil((self.history_chars + extra) / window.chars_per_token)
+            flat = window.total_tokens + math.ceil(extra / window.chars_per_token)
+            self.messages += 1
+            self.sent_tokens_total += sent
+            self.flat_tokens_total += flat
+        return sent, flat
+
+    def load(self, limit):
+        """Return the newest limit saved exchanges, oldest first"""
+        if self.store is not None:
+            return self.store.load(limit)
+        if self.conn is None:
+            return []
+        with self.db_lock:
+            rows = self.conn.execute(
+                f"SELECT value FROM {self.table} WHERE {self.KEY_MATCH} ORDER BY id DESC LIMIT ?",
+                (*self.key_range, limit),
+            ).fetchall()
+        exchanges = []
+        for (value,) in reversed(rows):
+            try:
+                user_message, reply = json.loads(value)
+            except (TypeError, ValueError):
+                continue
+            exchanges.append((user_message, reply))
+        return exchanges
+
+    def save(self, user_message, reply):
+        """Persist one exchange, pruning to max_stored every prune_every saves"""
+        if self.store is not None:
+            self.store.save(user_message, reply)
+            return
+        value = json.dumps([user_message, reply])
+        if self.writer is not None:
+            self.writer.submit(self._write, value, time.time())
+            return
+        if self.conn is None:
+            return
+        with self.db_lock:
+            self._write(self.conn, value, time.time())
+            self.conn.commit()
+
+    def _write(self, conn, value, now):
+        conn.execute(
+            f"INSERT INTO {self.table} (key, value, timestamp) VALUES (?, ?, ?)",
+            (self.key_prefix + uuid.uuid4().hex, value, now),
+        )
+        self.saves_since_prune += 1
+        if self.saves_since_prune >= self.prune_every:
+            self.saves_since_prune = 0
+            # Everything below the max_stored-th newest id goes
+            conn.execute(
+                f"DELETE FROM {self.table} WHERE {self.KEY_MATCH} AND id < "
+                f"(SELECT id FROM {self.table} WHERE {self.KEY_MATCH} ORDER BY id DESC LIMIT 1 OFFSET ?)",
+                (*self.key_range, *self.key_range, self.max_stored - 1),
+            )
+
+    def stats(self):
+        """History size, chat restarts and prompt size against the flattened prompt"""
+        with self.lock:
+            return {
+                "exchanges": len(self.history) // 2,
+                "history_chars": self.history_chars,
+                "messages": self.messages,
+                "rebuilds": self.rebuilds,
+                "avg_sent_tokens": self.sent_tokens_total / self.messages if self.messages else 0.0,
+                "avg_flat_tokens": self.flat_tokens_total / self.messages if self.messages else 0.0,
+                "savings": (
+                    1 - self.sent_tokens_total / self.flat_tokens_total if self.flat_tokens_total else 0.0
+                ),
+            }
@@ -0,0 +1,130 @@
+"""Token-budgeted window of recent conversation turns"""
+import math
+import threading
+from collections import deque
+
+
+class ContextWindow:
+    """Keep as many recent turns as fit in max_tokens
+
+    Token counts are a local chars-per-token estimate (about 4 for Gemini on
+    English text) that calibrate() can refine from an exact count_tokens
+    result. A running total makes trimming O(1) per dropped turn. The newest
+    turn is always kept, even if it alone is over budget.
+
+    With compact_at set, passing that many tokens moves the oldest turns out
+    until the window is back to half of it, and every turn that leaves the
+    window is kept in overflow for summarization instead of being lost.
+    """
+
+    def __init__(self, max_tokens=2000, chars_per_token=4.0, compact_at=None):
+        self.max_tokens = max_tokens
+        self.chars_per_token = chars_per_token
+        self.compact_at = compact_at
+        self.turns = deque()
+        self.total_tokens = 0
+        self.overflow = []
+        # Bumped whenever the turns change, so prompts built from them can be reused
+        self.version = 0
+        self.lock = threading.Lock()
+
+        # Prompt size stats
+        self.prompts_measured = 0
+        self.prompt_tokens_total = 0
+        self.last_prompt_tokens = 0
+        self.calibrations = 0
+
+    def estimate(self, text):
+        """Estimated token count of text"""
+        return math.ceil(len(text) / self.chars_per_token)
+
+    def append(self, entry):
+        """Add the newest turn and drop the oldest ones that no longer fit"""
+        tokens = self.estimate(entry)
+        with self.lock:
+            self.turns.append((entry, tokens))
+            self.total_tokens += tokens
+            self.version += 1
+            self._trim()
+
+    def _trim(self):
+        target = self.max_tokens
+        if self.compact_at and self.total_tokens > self.compact_at:
+            target = min(target, self.compact_at // 2)
+        while self.total_tokens > target and len(self.turns) > 1:
+            entry, dropped = self.turns.popleft()
+            self.total_tokens -= dropped
+            self.version += 1
+            if self.compact_at:
+                self.overflow.append(entry)
+
+    def has_overflow(self):
+        """Whether turns have left the window since the last drain"""
+        with self.lock:
+            return bool(self.overflow)
+
+    def drain_overflow(self):
+        """Return and forget the turns that left the window, oldest first"""
+        with self.lock:
+            turns, self.overflow = self.overflow, []
+            return turns
+
+    def extend(self, entries):
+        """Append several turns, oldest first"""
+        for entry in entries:
+            self.append(entry)
+
+    def clear(self):
+        with self.lock:
+            self.turns.clear()
+            self.total_tokens = 0
+            self.overflow = []
+            self.version += 1
+
+    def __iter__(self):
+        with self.lock:
+            return iter([entry for entry, _ in self.turns])
+
+    def __len__(self):
+        with self.lock:
+            return len(self.turns)
+
+    def measure(self, prompt):
+        """Estimate the tokens in a full prompt and record it in the stats"""
+        tokens = self.estimate(prompt)
+        with self.lock:
+            self.prompts_measured += 1
+            self.prompt_tokens_total += tokens
+            self.last_prompt_tokens = tokens
+        return tokens
+
+    def calibrate(self, text, exact_tokens):
+        """Blend an exact token count for text into the chars-per-token ratio"""
+        if not text or exact_tokens <= 0:
+            return
+        ratio = len(text) / exact_tokens
+        with self.lock:
+            if self.calibrations:
+                self.chars_per_token = 0.8 * self.chars_per_token + 0.2 * ratio
+            else:
+                self.chars_per_token = ratio
+            self.calibrations += 1
+            # Re-cost stored turns with the new ratio (rare, so O(n) is fine)
+            self.turns = deque((entry, self.estimate(entry)) for entry, _ in self.turns)
+            self.total_tokens = sum(tokens for _, tokens in self.turns)
+            self._trim()
+
+    def stats(self):
+        """Window size and prompt token counters for tuning the budget"""
+        with self.lock:
+            return {
+                "turns": len(self.turns),
+                "context_tokens": self.total_tokens,
+                "max_tokens": self.max_tokens,
+                "chars_per_token": self.chars_per_token,
+                "last_prompt_tokens": self.last_prompt_tokens,
+                "avg_prompt_tokens": (
+                    self.prompt_tokens_total / self.prompts_measured if self.prompts_measured else 0.0
+                ),
+                "calibrations": self.calibrations,
+            }
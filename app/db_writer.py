@@ -0,0 +1,133 @@
+"""Single SQLite writer thread that group-commits queued writes"""
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from memory_store import connect
+
+_STOP = object()
+
+
+class DbWriter:
+    """Own a write connection and apply queued write intents on one thread
+
+    submit(fn, *args) queues fn(conn, *args) and returns a Future. The
+    writer takes everything queued within max_delay of the first intent (up
+    to max_batch), runs it in one transaction and commits once, so callers
+    never wait on the disk. Each intent runs inside its own savepoint: one
+    that raises is rolled back whole, statements it already ran included,
+    and the rest of the batch still commits. flush() is a barrier: it returns once everything
+    queued before it is committed. Reads keep using their own connection;
+    WAL lets them run alongside the writer.
+    """
+
+    def __init__(self, path, max_delay=0.005, max_batch=256, name="db-writer"):
+        self.max_delay = max_delay
+        self.max_batch = max_batch
+        self.conn = connect(path)
+        self.intents = queue.SimpleQueue()
+        self.lock = threading.Lock()
+        self.closed = False
+
+        # Counters
+        self.writes = 0
+        self.batches = 0
+        self.errors = 0
+        self.largest_batch = 0
+        self.total_commit_time = 0.0
+
+        self.thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self.thread.start()
+
+    def submit(self, fn, *args):
+        """Queue fn(conn, *args) for the next group commit"""
+        future = Future()
+        with self.lock:
+            if self.closed:
+                raise RuntimeError("writer is closed")
+            self.intents.put((fn, args, future))
+        return future
+
+    def flush(self, timeout=None):
+        """Block until every write queued so far is committed"""
+        return self.submit(lambda conn: None).result(timeout)
+
+    def close(self, timeout=2.0):
+        """Commit what is queued, stop the thread and close the connection"""
+        with self.lock:
+            if self.closed:
+                return
+            self.closed = True
+            self.intents.put(_STOP)
+        self.thread.join(timeout)
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            first = self.intents.get()
+            if first is _STOP:
+                break
+            batch = [first]
+            deadline = time.monotonic() + self.max_delay
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                try:
+                    intent = self.intents.get(timeout=remaining) if remaining > 0 else self.intents.get_nowait()
+                except queue.Empty:
+                    break
+                if intent is _STOP:
+                    stopping = True
+                    break
+                batch.append(intent)
+            self._apply(batch)
+        self.conn.close()
+
+    def _apply(self, batch):
+        results = []
+        if not self.conn.in_transaction:
+            # Savepoints inside one transaction, or RELEASE would commit
+            self.conn.execute("BEGIN")
+        for fn, args, future in batch:
+            if not future.set_running_or_notify_cancel():
+                continue
+            self.conn.execute("SAVEPOINT intent")
+            try:
+                result = fn(self.conn, *args)
+            except Exception as e:
+                self.conn.execute("ROLLBACK TO intent")
+                results.append((future, None, e))
+            else:
+                results.append((future, result, None))
+            self.conn.execute("RELEASE intent")
+        started = time.perf_counter()
+        try:
+            self.conn.commit()
+        except Exception as e:
+            self.conn.rollback()
+            results = [(future, None, e) for future, _, _ in results]
+        commit_time = time.perf_counter() - started
+        with self.lock:
+            self.batches += 1
+            self.writes += len(results)
+            self.errors += sum(1 for _, _, error in results if error is not None)
+            self.largest_batch = max(self.largest_batch, len(batch))
+            self.total_commit_time += commit_time
+        for future, result, error in results:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+    def stats(self):
+        """Write, batch and commit time counters"""
+        with self.lock:
+            return {
+                "queued": self.intents.qsize(),
+                "writes": self.writes,
+                "batches": self.batches,
+                "avg_batch": self.writes / self.batches if self.batches else 0.0,
+                "largest_batch": self.largest_batch,
+                "errors": self.errors,
+                "avg_commit_time": self.total_commit_time / self.batches if self.batches else 0.0,
+            }
@@ -0,0 +1,178 @@
+"""Local stand-in for the Gemini REST API, for running the chat server offline"""
+import argparse
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+_ROUTE_RE = re.compile(r"^/v1beta/(models/[^/:]+):(generateContent|streamGenerateContent|countTokens)$")
+
+
+class FakeGemini:
+    """generateContent, streamGenerateContent (?alt=sse) and countTokens,
+    answered from the request alone
+
+    The reply echoes the latest user message and says how many turns came
+    with it, so a caller can see the history it sent. Streams go out a word
+    at a time, chunk_delay seconds apart, over chunked keep-alive responses
+    like the real API. Every call is recorded in requests. fail_next() makes
+    the next generate calls fail, for exercising retries, and stall_next()
+    makes them slow to start, for exercising hedging. Each new connection
+    waits connect_delay seconds before its first answer, like the DNS, TLS
+    and channel setup a real endpoint costs.
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, chunk_delay=0.0, connect_delay=0.0):
+        self.chunk_delay = chunk_delay
+        self.connect_delay = connect_delay
+        self.connections = 0
+        self.requests = []
+        self.failures = []
+        self.stalls = []
+        self.hangups = 0
+        self.lock = threading.Lock()
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Headers and body go out in separate writes
+            disable_nagle_algorithm = True
+
+            def log_message(self, format, *args):
+                pass
+
+            def setup(self):
+                super().setup()
+                with fake.lock:
+                    fake.connections += 1
+                if fake.connect_delay:
+                    time.sleep(fake.connect_delay)
+
+            def do_POST(self):
+                fake._handle(self)
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://{host}:{self.server.server_address[1]}"
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, name="fake-gemini", daemon=True)
+        self.thread.start()
+        return self.url
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def fail_next(self, count, status=503):
+        """Answer the next count generate calls with an error status"""
+        with self.lock:
+            self.failures.extend([status] * count)
+
+    def stall_next(self, count, seconds):
+        """Hold the next count generate calls for seconds before answering"""
+        with self.lock:
+            self.stalls.extend([seconds] * count)
+
+    def reply_for(self, body):
+        """The canned reply to a request body"""
+        contents = body.get("contents", [])
+        latest = " ".join(part.get("text", "") for part in contents[-1]["parts"]) if contents else ""
+        return f"Heard ({len(contents)} turns): {latest}"
+
+    def _handle(self, handler):
+        path, _, query = handler.path.partition("?")
+        match = _ROUTE_RE.match(path)
+        length = int(handler.headers.get("Content-Length") or 0)
+        try:
+            body = json.loads(handler.rfile.read(length) or b"{}")
+        except ValueError:
+            return self._send_json(handler, 400, {"error": {"code": 400, "message": "Invalid JSON payload"}})
+        if match is None:
+            return self._send_json(handler, 404, {"error": {"code": 404, "message": f"Not found: {path}"}})
+        if not handler.headers.get("x-goog-api-key"):
+            return self._send_json(handler, 403, {"error": {"code": 403, "message": "Missing API key"}})
+
+        model, method = match.groups()
+        system = " ".join(p.get("text", "") for p in body.get("systemInstruction", {}).get("parts", []))
+        with self.lock:
+            self.requests.append({
+                "model": model, "method": method, "system": system, "turns": len(body.get("contents", [])),
+                "max_output_tokens": body.get("generationConfig", {}).get("maxOutputTokens"),
+            })
+
+        if method == "countTokens":
+            chars = sum(len(p.get("text", "")) for turn in body.get("contents", []) for p in turn["parts"])
+            return self._send_json(handler, 200, {"totalTokens": max(1, chars // 4)})
+        with self.lock:
+            failure = self.failures.pop(0) if self.failures else None
+            stall = self.stalls.pop(0) if self.stalls else 0
+        if stall:
+            time.sleep(stall)
+        if failure:
+            message = "Resource has been exhausted" if failure == 429 else "The model is overloaded"
+            return self._send_json(handler, failure, {"error": {"code": failure, "message": message}})
+        reply = self.reply_for(body)
+        if method == "generateContent":
+            return self._send_json(handler, 200, _candidate(reply))
+        if query != "alt=sse":
+            return self._send_json(handler, 400, {"error": {"code": 400, "message": "Only alt=sse streams"}})
+
+        handler.send_response(200)
+        handler.send_header("Content-Type", "text/event-stream")
+        handler.send_header("Transfer-Encoding", "chunked")
+        handler.end_headers()
+        words = re.findall(r"\S+\s*", reply)
+        try:
+            for i, word in enumerate(words):
+                if i and self.chunk_delay:
+                    time.sleep(self.chunk_delay)
+                data = f"data: {json.dumps(_candidate(word, last=i == len(words) - 1))}\r\n\r\n".encode("utf-8")
+                handler.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+                handler.wfile.flush()
+            handler.wfile.write(b"0\r\n\r\n")
+            handler.wfile.flush()
+        except ConnectionError:
+            # The client hung up mid-stream (a cancelled reply)
+            with self.lock:
+                self.hangups += 1
+            handler.close_connection = True
+
+    def _send_json(self, handler, status, data):
+        body = json.dumps(data).encode("utf-8")
+        handler.send_response(status)
+        handler.send_header("Content-Type", "application/json")
+        handler.send_header("Content-Length", str(len(body)))
+        handler.end_headers()
+        handler.wfile.write(body)
+
+
+def _candidate(text, last=True):
+    candidate = {"content": {"role": "model", "parts": [{"text": text}]}, "index": 0}
+    if last:
+        candidate["finishReason"] = "STOP"
+    return {"candidates": [candidate]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--chunk-delay", type=float, default=0.02, help="seconds between streamed words")
+    parser.add_argument("--connect-delay", type=float, default=0.0, help="seconds each new connection takes to set up")
+    args = parser.parse_args()
+
+    fake = FakeGemini(args.host, args.port, args.chunk_delay, args.connect_delay)
+    print(f"Fake Gemini on {fake.url}", flush=True)
+    try:
+        fake.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        fake.server.server_close()
+
+
+if __name__ == "__main__":
+    main()
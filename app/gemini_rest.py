@@ -0,0 +1,364 @@
+"""Asyncio Gemini REST client with the slice of the SDK's model API the chat core uses"""
+import asyncio
+import json
+import ssl
+import time
+from urllib.parse import urlsplit
+
+DEFAULT_BASE_URL = "https://generativelanguage.googleapis.com"
+
+
+class GeminiError(Exception):
+    """A non-200 answer from the API"""
+
+    def __init__(self, status, message):
+        super().__init__(f"{status}: {message}")
+        self.status = status
+        self.message = message
+
+
+class HttpResponse:
+    """Status, headers and a body read lazily from the connection
+
+    The connection goes back to the client's idle pool once the body has
+    been read to the end, unless the server asked to close it.
+    """
+
+    def __init__(self, client, origin, status, headers, reader, writer):
+        self.client = client
+        self.origin = origin
+        self.status = status
+        self.headers = headers
+        self.reader = reader
+        self.writer = writer
+        self.done = False
+        length = headers.get("content-length")
+        self.length = int(length) if length is not None else None
+        self.chunked = "chunked" in headers.get("transfer-encoding", "").lower()
+        self.keep_alive = headers.get("connection", "").lower() != "close"
+
+    async def iter_chunks(self):
+        """Yield the body as it arrives (chunked, sized or until EOF)"""
+        if self.chunked:
+            while True:
+                size = int((await self.reader.readline()).split(b";")[0], 16)
+                if size == 0:
+                    # Trailers end with an empty line
+                    while (await self.reader.readline()).strip():
+                        pass
+                    break
+                data = await self.reader.readexactly(size)
+                await self.reader.readexactly(2)
+                yield data
+        elif self.length is not None:
+            remaining = self.length
+            while remaining:
+                data = await self.reader.read(min(65536, remaining))
+                if not data:
+                    raise asyncio.IncompleteReadError(b"", remaining)
+                remaining -= len(data)
+                yield data
+        else:
+            self.keep_alive = False
+            while data := await self.reader.read(65536):
+                yield data
+        self.done = True
+        self.release()
+
+    async def iter_lines(self):
+        """Yield the body line by line, decoded, without line endings"""
+        pending = b""
+        async for data in self.iter_chunks():
+            pending += data
+            *lines, pending = pending.split(b"\n")
+            for line in lines:
+                yield line.rstrip(b"\r").decode("utf-8")
+        if pending:
+            yield pending.rstrip(b"\r").decode("utf-8")
+
+    async def read(self):
+        return b"".join([data async for data in self.iter_chunks()])
+
+    async def json(self):
+        return json.loads(await self.read() or b"null")
+
+    def release(self):
+        """Hand the connection back for reuse, or close it"""
+        if self.writer is None:
+            return
+        if self.done and self.keep_alive:
+            self.client.put_idle(self.origin, self.reader, self.writer)
+        else:
+            self.writer.close()
+        self.writer = None
+
+    close = release
+
+
+class HttpClient:
+    """Minimal HTTP/1.1 client on asyncio streams, reusing keep-alive connections
+
+    Connections belong to the event loop they were opened on, so one client
+    serves one loop (the engine's). A request on a pooled connection the
+    server has meanwhile closed is retried once on a fresh one.
+    """
+
+    def __init__(self, connect_timeout=10.0, max_idle=8):
+        self.connect_timeout = connect_timeout
+        self.max_idle = max_idle
+        self.idle = {}
+        self.ssl_context = ssl.create_default_context()
+
+        # Counters
+        self.requests = 0
+        self.connections = 0
+        self.reused = 0
+
+    def put_idle(self, origin, reader, writer):
+        idle = self.idle.setdefault(origin, [])
+        if len(idle) < self.max_idle and not writer.is_closing():
+            idle.append((reader, writer))
+        else:
+            writer.close()
+
+    async def _connect(self, origin, fresh=False):
+        idle = self.idle.get(origin)
+        while idle and not fresh:
+            reader, writer = idle.pop()
+            if not writer.is_closing() and not reader.at_eof():
+                self.reused += 1
+                return reader, writer, True
+            writer.close()
+        scheme, host, port = origin
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(host, port, ssl=self.ssl_context if scheme == "https" else None),
+            self.connect_timeout,
+        )
+        self.connections += 1
+        return reader, writer, False
+
+    async def request(self, method, url, body=None, headers=None):
+        """Send one request; returns an HttpResponse once the headers are in"""
+        parts = urlsplit(url)
+        origin = (parts.scheme, parts.hostname, parts.port or (443 if parts.scheme == "https" else 80))
+        target = parts.path + (f"?{parts.query}" if parts.query else "")
+        data = b"" if body is None else body if isinstance(body, bytes) else json.dumps(body).encode("utf-8")
+        lines = [f"{method} {target} HTTP/1.1", f"Host: {parts.netloc}", f"Content-Length: {len(data)}"]
+        lines += [f"{name}: {value}" for name, value in (headers or {}).items()]
+        head = ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+        self.requests += 1
+
+        for fresh in (False, True):
+            reader, writer, reused = await self._connect(origin, fresh)
+            try:
+                writer.write(head + data)
+                await writer.drain()
+                status_line = await reader.readline()
+                if not status_line:
+                    raise ConnectionResetError("connection closed before the response")
+            except (ConnectionError, asyncio.IncompleteReadError):
+                writer.close()
+                if reused and not fresh:
+                    continue
+                raise
+            break
+
+        status = int(status_line.split()[1])
+        response_headers = {}
+        while (line := await reader.readline()).strip():
+            name, _, value = line.decode("latin-1").partition(":")
+            response_headers[name.strip().lower()] = value.strip()
+        return HttpResponse(self, origin, status, response_headers, reader, writer)
+
+    def close(self):
+        for idle in self.idle.values():
+            for _, writer in idle:
+                writer.close()
+        self.idle.clear()
+
+
+def _contents(contents):
+    """SDK-style contents (a string, or turns whose parts are strings) as REST JSON"""
+    if isinstance(contents, str):
+        contents = [{"role": "user", "parts": [contents]}]
+    return [
+        {"role": turn["role"], "parts": [{"text": p} if isinstance(p, str) else p for p in turn["parts"]]}
+        for turn in contents
+    ]
+
+
+class Response:
+    """One generateContent answer or streamed chunk; .text like the SDK's"""
+
+    def __init__(self, data):
+        self.data = data
+
+    @property
+    def text(self):
+        candidates = self.data.get("candidates") or []
+        parts = candidates[0].get("content", {}).get("parts", []) if candidates else []
+        texts = [part["text"] for part in parts if "text" in part]
+        if not texts:
+            reason = candidates[0].get("finishReason") if candidates else "no candidates"
+            raise ValueError(f"response has no text (finish reason: {reason})")
+        return "".join(texts)
+
+
+class TokenCount:
+    def __init__(self, total_tokens):
+        self.total_tokens = total_tokens
+
+
+class StreamedResponse:
+    """Async iterator over the chunks of a server-sent-events stream
+
+    on_complete(text) runs once the stream has been read to the end.
+    """
+
+    def __init__(self, http_response, on_complete=None):
+        self.http_response = http_response
+        self.on_complete = on_complete
+
+    def __aiter__(self):
+        return self._chunks()
+
+    async def _chunks(self):
+        texts, data = [], []
+        try:
+            async for line in self.http_response.iter_lines():
+                if line.startswith("data:"):
+                    data.append(line[5:].strip())
+                elif not line and data:
+                    chunk = Response(json.loads("".join(data)))
+                    data = []
+                    texts.append(_chunk_text(chunk))
+                    yield chunk
+            if data:
+                chunk = Response(json.loads("".join(data)))
+                texts.append(_chunk_text(chunk))
+                yield chunk
+        finally:
+            self.http_response.close()
+        if self.on_complete is not None:
+            self.on_complete("".join(texts))
+
+
+def _chunk_text(chunk):
+    try:
+        return chunk.text
+    except ValueError:
+        return ""
+
+
+def _camel(name):
+    first, *rest = name.split("_")
+    return first + "".join(word.title() for word in rest)
+
+
+class GenerativeModel:
+    """Model bound to a system instruction, like genai.GenerativeModel"""
+
+    def __init__(self, client, model_name, system_instruction=None, generation_config=None):
+        self.client = client
+        self.model_name = model_name if model_name.startswith("models/") else f"models/{model_name}"
+        self.system_instruction = system_instruction
+        self.generation_config = generation_config
+
+    def _request(self, contents):
+        body = {"contents": _contents(contents)}
+        if self.system_instruction:
+            body["systemInstruction"] = {"parts": [{"text": self.system_instruction}]}
+        if self.generation_config:
+            # The SDK's snake_case keys, as the REST API spells them
+            body["generationConfig"] = {_camel(key): value for key, value in self.generation_config.items()}
+        return body
+
+    async def generate_content_async(self, contents, stream=False, on_complete=None):
+        """Response, or with stream=True a StreamedResponse to iterate"""
+        if stream:
+            http_response = await self.client.call(self.model_name, "streamGenerateContent", self._request(contents), stream=True)
+            return StreamedResponse(http_response, on_complete)
+        return Response(await self.client.call(self.model_name, "generateContent", self._request(contents)))
+
+    async def count_tokens_async(self, contents):
+        data = await self.client.call(self.model_name, "countTokens", {"contents": _contents(contents)})
+        return TokenCount(data.get("totalTokens", 0))
+
+    def start_chat(self, history=None):
+        return Chat(self, history)
+
+
+class Chat:
+    """Multi-turn chat like the SDK's ChatSession: history grows by one
+    exchange per completed send"""
+
+    def __init__(self, model, history=None):
+        self.model = model
+        self.history = list(history or [])
+
+    def _record(self, content, reply):
+        self.history.append({"role": "user", "parts": [content]})
+        self.history.append({"role": "model", "parts": [reply]})
+
+    async def send_message_async(self, content, stream=False):
+        contents = self.history + [{"role": "user", "parts": [content]}]
+        if stream:
+            return await self.model.generate_content_async(
+                contents, stream=True, on_complete=lambda reply: self._record(content, reply)
+            )
+        response = await self.model.generate_content_async(contents)
+        self._record(content, response.text)
+        return response
+
+
+class GeminiClient:
+    """Calls the Gemini REST API (or anything that speaks it, such as a local
+    fake) at base_url"""
+
+    def __init__(self, api_key, base_url=DEFAULT_BASE_URL, api_version="v1beta", http=None):
+        self.api_key = api_key
+        self.base_url = base_url.rstrip("/")
+        self.api_version = api_version
+        self.http = http or HttpClient()
+
+        # Counters
+        self.calls = 0
+        self.errors = 0
+        self.total_header_time = 0.0
+
+    def GenerativeModel(self, model_name, system_instruction=None, generation_config=None):
+        return GenerativeModel(self, model_name, system_instruction, generation_config)
+
+    async def call(self, model_name, method, body, stream=False):
+        """POST to models/{name}:{method}; JSON for plain calls, the open
+        HttpResponse for streams"""
+        url = f"{self.base_url}/{self.api_version}/{model_name}:{method}" + ("?alt=sse" if stream else "")
+        headers = {"Content-Type": "application/json", "x-goog-api-key": self.api_key}
+        started = time.perf_counter()
+        self.calls += 1
+        response = await self.http.request("POST", url, body, headers)
+        self.total_header_time += time.perf_counter() - started
+        if response.status != 200:
+            self.errors += 1
+            data = await response.read()
+            try:
+                message = json.loads(data)["error"]["message"]
+            except (ValueError, KeyError, TypeError):
+                message = data.decode("utf-8", "replace")[:200]
+            raise GeminiError(response.status, message)
+        if stream:
+            return response
+        return await response.json()
+
+    def stats(self):
+        """Call, error and connection counters"""
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "avg_header_time": self.total_header_time / self.calls if self.calls else 0.0,
+            "connections": self.http.connections,
+            "reused": self.http.reused,
+        }
+
+    def close(self):
+        self.http.close()
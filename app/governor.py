@@ -0,0 +1,388 @@
+"""Share one API key's quota between every chat app running on the machine"""
+import argparse
+import asyncio
+import json
+import os
+import threading
+import time
+
+from memory_store import connect
+
+DEFAULT_PATH = os.environ.get("GEMINI_GOVERNOR_DB") or os.path.join(os.path.expanduser("~"), ".gemini_governor.db")
+
+# Seconds between a waiter's polls, and after which a silent waiter is dropped
+POLL_INTERVAL = 0.1
+WAITER_STALE = 5.0
+
+
+class Governor:
+    """Cross-process request and token buckets and concurrency slots in one
+    SQLite file
+
+    Every process that calls the model with the shared key opens the same
+    file (DEFAULT_PATH: $GEMINI_GOVERNOR_DB or ~/.gemini_governor.db) and
+    acquires before each call. A caller takes a ticket and polls; it is
+    granted once it is next in line, a concurrency slot is free and both
+    buckets have room. Next in line is the waiter whose app was granted the
+    fewest requests in the last minute, oldest ticket first, so an app with
+    a long queue takes turns with the others instead of starving them.
+
+    A grant is a lease on a slot, released after the call. Leases expire
+    after lease seconds and waiters that stop polling are dropped, so a
+    crashed process frees what it held. Every step is one BEGIN IMMEDIATE
+    transaction; the limits live in the file, so the CLI can change them
+    for every running app at once.
+    """
+
+    def __init__(self, app, path=DEFAULT_PATH, requests_per_minute=15, tokens_per_minute=1_000_000,
+                 max_concurrent=4, lease=120.0, clock=time.time):
+        self.app = app
+        self.pid = os.getpid()
+        self.path = path
+        self.lease = lease
+        self.clock = clock
+        self.conn = connect(path)
+        self.lock = threading.Lock()
+        self.create_tables()
+        # The first process to create the file sets the limits; the CLI changes them
+        self.conn.execute(
+            "INSERT OR IGNORE INTO governor_limits (id, requests_per_minute, tokens_per_minute, max_concurrent) "
+            "VALUES (1, ?, ?, ?)",
+            (requests_per_minute or 0, tokens_per_minute or 0, max_concurrent or 0),
+        )
+        self.conn.commit()
+
+        # Counters
+        self.granted = 0
+        self.waited = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def create_tables(self):
+        self.conn.executescript('''
+            CREATE TABLE IF NOT EXISTS governor_limits (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                requests_per_minute REAL,
+                tokens_per_minute REAL,
+                max_concurrent INTEGER
+            );
+            CREATE TABLE IF NOT EXISTS governor_buckets (
+                name TEXT PRIMARY KEY,
+                level REAL,
+                updated REAL
+            );
+            CREATE TABLE IF NOT EXISTS governor_waiters (
+                ticket INTEGER PRIMARY KEY AUTOINCREMENT,
+                app TEXT,
+                pid INTEGER,
+                since REAL,
+                seen REAL
+            );
+            CREATE TABLE IF NOT EXISTS governor_leases (
+                ticket INTEGER PRIMARY KEY,
+                app TEXT,
+                pid INTEGER,
+                acquired REAL,
+                expires REAL
+            );
+            CREATE TABLE IF NOT EXISTS governor_usage (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                app TEXT,
+                at REAL,
+                requests INTEGER,
+                tokens REAL
+            );
+            CREATE INDEX IF NOT EXISTS idx_governor_usage_at ON governor_usage(at);
+        ''')
+
+    def _transaction(self, fn, *args):
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = fn(*args)
+            except BaseException:
+                self.conn.rollback()
+                raise
+            self.conn.commit()
+            return result
+
+    def _limits(self):
+        return self.conn.execute(
+            "SELECT requests_per_minute, tokens_per_minute, max_concurrent FROM governor_limits WHERE id = 1"
+        ).fetchone()
+
+    def _purge(self, now):
+        """Drop silent waiters, expired leases and usage older than a minute"""
+        self.conn.execute("DELETE FROM governor_waiters WHERE seen < ?", (now - WAITER_STALE,))
+        self.conn.execute("DELETE FROM governor_leases WHERE expires < ?", (now,))
+        self.conn.execute("DELETE FROM governor_usage WHERE at < ?", (now - 60,))
+
+    def _level(self, name, per_minute, now):
+        """The bucket's level refilled up to now (a full bucket holds per_minute)"""
+        row = self.conn.execute("SELECT level, updated FROM governor_buckets WHERE name = ?", (name,)).fetchone()
+        if row is None:
+            return per_minute
+        level, updated = row
+        return min(per_minute, level + max(0.0, now - updated) * per_minute / 60)
+
+    def _store_level(self, name, level, now):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO governor_buckets (name, level, updated) VALUES (?, ?, ?)", (name, level, now)
+        )
+
+    def enqueue(self):
+        """Take a ticket in the shared line"""
+        def run():
+            now = self.clock()
+            return self.conn.execute(
+                "INSERT INTO governor_waiters (app, pid, since, seen) VALUES (?, ?, ?, ?)",
+                (self.app, self.pid, now, now),
+            ).lastrowid
+        return self._transaction(run)
+
+    def try_acquire(self, ticket, tokens=0):
+        """(granted, seconds to wait before asking again, why not)"""
+        def run():
+            now = self.clock()
+            self._purge(now)
+            if not self.conn.execute("UPDATE governor_waiters SET seen = ? WHERE ticket = ?", (now, ticket)).rowcount:
+                # Dropped as silent (a long pause); back in line at the same place
+                self.conn.execute(
+                    "INSERT INTO governor_waiters (ticket, app, pid, since, seen) VALUES (?, ?, ?, ?, ?)",
+                    (ticket, self.app, self.pid, now, now),
+                )
+            first = self.conn.execute('''
+                SELECT ticket FROM governor_waiters w
+                ORDER BY (SELECT COUNT(*) FROM governor_usage u WHERE u.app = w.app AND u.requests), ticket
+                LIMIT 1
+            ''').fetchone()[0]
+            if first != ticket:
+                return False, POLL_INTERVAL, "turn"
+            requests_per_minute, tokens_per_minute, max_concurrent = self._limits()
+            if max_concurrent and self.conn.execute("SELECT COUNT(*) FROM governor_leases").fetchone()[0] >= max_concurrent:
+                return False, POLL_INTERVAL, "busy"
+
+            wait = 0.0
+            if requests_per_minute:
+                requests = self._level("requests", requests_per_minute, now)
+                wait = max(wait, (1 - requests) * 60 / requests_per_minute)
+            if tokens_per_minute:
+                level = self._level("tokens", tokens_per_minute, now)
+                wait = max(wait, (min(tokens, tokens_per_minute) - level) * 60 / tokens_per_minute)
+            if wait > 0:
+                return False, wait, "rate"
+
+            if requests_per_minute:
+                self._store_level("requests", requests - 1, now)
+            if tokens_per_minute:
+                self._store_level("tokens", level - tokens, now)
+            self.conn.execute("DELETE FROM governor_waiters WHERE ticket = ?", (ticket,))
+            self.conn.execute(
+                "INSERT INTO governor_leases (ticket, app, pid, acquired, expires) VALUES (?, ?, ?, ?, ?)",
+                (ticket, self.app, self.pid, now, now + self.lease),
+            )
+            self.conn.execute(
+                "INSERT INTO governor_usage (app, at, requests, tokens) VALUES (?, ?, 1, ?)", (self.app, now, tokens)
+            )
+            return True, 0.0, None
+        return self._transaction(run)
+
+    def withdraw(self, ticket):
+        """Leave the line, giving back the slot if the ticket was granted meanwhile"""
+        def run():
+            self.conn.execute("DELETE FROM governor_waiters WHERE ticket = ?", (ticket,))
+            self.conn.execute("DELETE FROM governor_leases WHERE ticket = ?", (ticket,))
+        self._transaction(run)
+
+    def release(self, ticket):
+        """Give back the slot a grant holds"""
+        self._transaction(lambda: self.conn.execute("DELETE FROM governor_leases WHERE ticket = ?", (ticket,)))
+
+    def charge(self, tokens):
+        """Count tokens spent after the fact (the reply) against the shared token limit"""
+        def run():
+            now = self.clock()
+            tokens_per_minute = self._limits()[1]
+            if tokens_per_minute:
+                self._store_level("tokens", self._level("tokens", tokens_per_minute, now) - tokens, now)
+            self.conn.execute(
+                "INSERT INTO governor_usage (app, at, requests, tokens) VALUES (?, ?, 0, ?)", (self.app, now, tokens)
+            )
+        self._transaction(run)
+
+    async def acquire(self, tokens=0, notify=lambda text: None):
+        """Wait in the shared line until granted; returns (ticket, seconds waited)
+
+        The blocking SQLite steps run on the default executor so the loop
+        keeps serving other chats. They are shielded: cancelled mid-step
+        (a hedge that lost, a superseded send), the step still finishes,
+        and then the ticket is withdrawn, lease and all, so a grant made
+        after the cancel never holds a shared slot.
+        """
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        reason = None
+        ticket = None
+        pending = loop.run_in_executor(None, self.enqueue)
+        try:
+            ticket = await asyncio.shield(pending)
+            while True:
+                pending = loop.run_in_executor(None, self.try_acquire, ticket, tokens)
+                granted, wait, why = await asyncio.shield(pending)
+                if granted:
+                    break
+                if why != reason:
+                    reason = why
+                    notify({
+                        "turn": "Waiting for other chat apps' requests",
+                        "busy": "Waiting for a free request slot",
+                        "rate": f"Rate limited, waiting {wait:.1f}s",
+                    }[why])
+                await asyncio.sleep(wait)
+        except BaseException:
+            pending.add_done_callback(lambda step: self._abandon(loop, step, ticket))
+            raise
+        waited = time.perf_counter() - started
+        self.granted += 1
+        if reason is not None:
+            self.waited += 1
+            self.total_wait += waited
+            self.max_wait = max(self.max_wait, waited)
+        return ticket, waited if reason is not None else 0.0
+
+    def _abandon(self, loop, step, ticket):
+        """Withdraw once the step under way when acquire() stopped is done"""
+        if ticket is None:
+            if step.cancelled() or step.exception() is not None:
+                return
+            # Stopped while taking the ticket
+            ticket = step.result()
+        loop.run_in_executor(None, self.withdraw, ticket)
+
+    def usage(self):
+        """Limits, bucket levels, leases, waiters and the last minute's use per app"""
+        def run():
+            now = self.clock()
+            self._purge(now)
+            requests_per_minute, tokens_per_minute, max_concurrent = self._limits()
+            per_app = {}
+            for app, requests, tokens in self.conn.execute(
+                "SELECT app, SUM(requests), SUM(tokens) FROM governor_usage GROUP BY app ORDER BY app"
+            ):
+                per_app[app] = {"requests": requests, "tokens": tokens}
+            return {
+                "limits": {
+                    "requests_per_minute": requests_per_minute,
+                    "tokens_per_minute": tokens_per_minute,
+                    "max_concurrent": max_concurrent,
+                },
+                "buckets": {
+                    "requests": self._level("requests", requests_per_minute, now) if requests_per_minute else None,
+                    "tokens": self._level("tokens", tokens_per_minute, now) if tokens_per_minute else None,
+                },
+                "in_flight": [
+                    {"app": app, "pid": pid, "for": now - acquired}
+                    for app, pid, acquired in self.conn.execute(
+                        "SELECT app, pid, acquired FROM governor_leases ORDER BY acquired"
+                    )
+                ],
+                "waiting": [
+                    {"app": app, "pid": pid, "for": now - since}
+                    for app, pid, since in self.conn.execute(
+                        "SELECT app, pid, since FROM governor_waiters ORDER BY ticket"
+                    )
+                ],
+                "last_minute": per_app,
+            }
+        return self._transaction(run)
+
+    def set_limits(self, requests_per_minute=None, tokens_per_minute=None, max_concurrent=None):
+        """Change the shared limits (0 turns one off); None leaves it as it is"""
+        def run():
+            for column, value in (
+                ("requests_per_minute", requests_per_minute),
+                ("tokens_per_minute", tokens_per_minute),
+                ("max_concurrent", max_concurrent),
+            ):
+                if value is not None:
+                    self.conn.execute(f"UPDATE governor_limits SET {column} = ? WHERE id = 1", (value,))
+        self._transaction(run)
+
+    def reset(self):
+        """Forget leases, waiters, usage and bucket levels (keeps the limits)"""
+        def run():
+            for table in ("governor_buckets", "governor_waiters", "governor_leases", "governor_usage"):
+                self.conn.execute(f"DELETE FROM {table}")
+        self._transaction(run)
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+    def stats(self):
+        """This process's grants and time spent waiting for them"""
+        return {
+            "app": self.app,
+            "path": self.path,
+            "granted": self.granted,
+            "waited": self.waited,
+            "total_wait": self.total_wait,
+            "max_wait": self.max_wait,
+        }
+
+
+def _print_usage(usage):
+    limits = usage["limits"]
+    print(
+        f"Limits: {limits['requests_per_minute'] or 'no'} requests/min, "
+        f"{limits['tokens_per_minute'] or 'no'} tokens/min, {limits['max_concurrent'] or 'no'} concurrent"
+    )
+    buckets = usage["buckets"]
+    if buckets["requests"] is not None:
+        print(f"Requests available: {buckets['requests']:.1f} of {limits['requests_per_minute']:.0f}")
+    if buckets["tokens"] is not None:
+        print(f"Tokens available: {buckets['tokens']:.0f} of {limits['tokens_per_minute']:.0f}")
+    for title, entries in (("In flight", usage["in_flight"]), ("Waiting", usage["waiting"])):
+        print(f"{title}: {len(entries)}")
+        for entry in entries:
+            print(f"  {entry['app']} (pid {entry['pid']}) for {entry['for']:.1f}s")
+    print("Last minute:")
+    for app, used in usage["last_minute"].items():
+        print(f"  {app}: {used['requests']} requests, {used['tokens']:.0f} tokens")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--db", default=DEFAULT_PATH, help="governor file shared by the apps")
+    parser.add_argument("--rpm", type=float, help="set the shared requests per minute (0: no limit)")
+    parser.add_argument("--tpm", type=float, help="set the shared tokens per minute (0: no limit)")
+    parser.add_argument("--concurrency", type=int, help="set the shared concurrent requests (0: no limit)")
+    parser.add_argument("--reset", action="store_true", help="forget leases, waiters and usage")
+    parser.add_argument("--json", action="store_true", help="print usage as JSON")
+    parser.add_argument("--watch", type=float, metavar="SECONDS", help="print usage every SECONDS")
+    args = parser.parse_args()
+
+    governor = Governor("cli", args.db)
+    governor.set_limits(args.rpm, args.tpm, args.concurrency)
+    if args.reset:
+        governor.reset()
+    try:
+        while True:
+            usage = governor.usage()
+            if args.json:
+                print(json.dumps(usage), flush=True)
+            else:
+                _print_usage(usage)
+            if not args.watch:
+                break
+            time.sleep(args.watch)
+            if not args.json:
+                print()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        governor.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+"""Hedged model calls: a second request when the first is slow to start"""
+import asyncio
+import time
+from collections import deque
+
+
+class _Race:
+    """Two calls for one reply; the first to produce text writes to sink"""
+
+    def __init__(self, sink):
+        self.sink = sink
+        self.started = time.perf_counter()
+        self.winner = None
+        self.won = asyncio.Event()
+
+
+class _Leg:
+    """Where one call streams to: forwarded to the sink if it wins, dropped if not"""
+
+    def __init__(self, race, number):
+        self.race = race
+        self.number = number
+        self.parts = []
+        self.first_token_latency = None
+        self.task = None
+
+    @property
+    def text(self):
+        return "".join(self.parts)
+
+    def append(self, text):
+        if not text:
+            return
+        race = self.race
+        if self.first_token_latency is None:
+            self.first_token_latency = time.perf_counter() - race.started
+            if race.winner is None:
+                race.winner = self
+                race.won.set()
+        self.parts.append(text)
+        if race.winner is self:
+            race.sink.append(text)
+
+    def start(self, coro):
+        self.task = asyncio.ensure_future(coro)
+        self.task.add_done_callback(self._done)
+
+    def _done(self, task):
+        # Retrieving the error also keeps a losing call's failure out of the log
+        if self.first_token_latency is None and not task.cancelled() and task.exception() is None:
+            # Nothing streamed: the whole answer is its first token
+            self.first_token_latency = time.perf_counter() - self.race.started
+
+
+class Hedger:
+    """Race a duplicate call against one that has not started answering
+
+    Every call's time to first token (or to the whole reply, for calls that
+    do not stream) goes into a rolling window of the last window samples.
+    With enabled, once min_samples are in, a call still silent at the
+    window's percentile (p90 by default, never under min_delay) gets a
+    duplicate; the first of the two to produce text is shown and the other
+    is cancelled.
+
+    Hedges are capped at max_rate of calls: each call earns max_rate of a
+    hedge, up to burst saved, and a hedge spends one.
+
+    The losing call is cancelled as soon as the winner's first token
+    arrives, so it spends no more quota and frees its guard and governor
+    slot. What a winning hedge saved is estimated from the window instead:
+    the mean of the samples slower than the hedge's answer, minus that
+    answer's time (unknown when no sample was that slow).
+
+    Runs on the engine's loop thread.
+    """
+
+    def __init__(self, enabled=False, percentile=0.9, window=100, min_samples=20, min_delay=0.25,
+                 max_rate=0.1, burst=2.0):
+        self.enabled = enabled
+        self.percentile = percentile
+        self.samples = deque(maxlen=window)
+        self.min_samples = min_samples
+        self.min_delay = min_delay
+        self.max_rate = max_rate
+        self.burst = burst
+        self.credit = burst
+
+        # Counters
+        self.calls = 0
+        self.hedges = 0
+        self.capped = 0
+        self.hedge_wins = 0
+        self.saved_estimated = 0
+        self.saved_unknown = 0
+        self.total_saved = 0.0
+        self.max_saved = 0.0
+
+    def threshold(self):
+        """Seconds of silence after which a call is hedged, or None when not yet known"""
+        if len(self.samples) < self.min_samples:
+            return None
+        ordered = sorted(self.samples)
+        return max(self.min_delay, ordered[min(len(ordered) - 1, int(self.percentile * len(ordered)))])
+
+    def _spend(self):
+        if self.credit >= 1:
+            self.credit -= 1
+            return True
+        self.capped += 1
+        return False
+
+    async def race(self, run, sink):
+        """Await run(sink, hedge) once, or twice when hedged; return
+        (result, hedged) for the call that answered first
+
+        run makes one call, streaming into sink (append() and
+        first_token_latency, like a StreamBuffer) if it streams; hedge is
+        True for the duplicate. hedged is True when the duplicate won.
+        """
+        self.calls += 1
+        self.credit = min(self.burst, self.credit + self.max_rate)
+        race = _Race(sink)
+        legs = [_Leg(race, 0)]
+        legs[0].start(run(legs[0], False))
+        delay = self.threshold() if self.enabled else None
+        won = asyncio.ensure_future(race.won.wait())
+        try:
+            winner = await self._first(race, legs, run, won, delay)
+        except BaseException:
+            for leg in legs:
+                leg.task.cancel()
+            raise
+        finally:
+            won.cancel()
+
+        for leg in legs:
+            if leg is not winner:
+                leg.task.cancel()
+        if winner.number == 1:
+            self.hedge_wins += 1
+            self._estimate_saved(winner.first_token_latency)
+        result = await winner.task
+        self.samples.append(winner.first_token_latency)
+        return result, winner.number == 1
+
+    async def _first(self, race, legs, run, won, delay):
+        """The leg whose call produced text first (or finished first, without streaming)"""
+        while race.winner is None:
+            live = [leg.task for leg in legs if not leg.task.done()]
+            if not live:
+                break
+            timeout = None
+            if delay is not None:
+                timeout = max(0.0, delay - (time.perf_counter() - race.started))
+            done, _ = await asyncio.wait(live + [won], timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                delay = None
+                if self._spend():
+                    self.hedges += 1
+                    hedge = _Leg(race, 1)
+                    hedge.start(run(hedge, True))
+                    legs.append(hedge)
+                continue
+            for leg in legs:
+                if race.winner is None and leg.task.done() and not leg.task.cancelled() and leg.task.exception() is None:
+                    # Finished without streaming anything
+                    race.winner = leg
+        if race.winner is not None:
+            return race.winner
+        # Every call failed; raise the first call's error
+        return legs[0]
+
+    def _estimate_saved(self, answered):
+        """Count what a winning hedge likely saved: the mean of the window's
+        samples slower than answered, less answered"""
+        slower = [sample for sample in self.samples if sample > answered]
+        if not slower:
+            self.saved_unknown += 1
+            return
+        saved = sum(slower) / len(slower) - answered
+        self.saved_estimated += 1
+        self.total_saved += saved
+        self.max_saved = max(self.max_saved, saved)
+
+    def stats(self):
+        """Hedge rate, wins and latency saved"""
+        threshold = self.threshold()
+        return {
+            "enabled": self.enabled,
+            "threshold": threshold,
+            "samples": len(self.samples),
+            "calls": self.calls,
+            "hedges": self.hedges,
+            "hedge_rate": self.hedges / self.calls if self.calls else 0.0,
+            "capped": self.capped,
+            "hedge_wins": self.hedge_wins,
+            "saved_estimated": self.saved_estimated,
+            "saved_unknown": self.saved_unknown,
+            "avg_saved": self.total_saved / self.saved_estimated if self.saved_estimated else 0.0,
+            "total_saved": self.total_saved,
+            "max_saved": self.max_saved,
+        }
+
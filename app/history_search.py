@@ -0,0 +1,180 @@
+"""FTS5 full-text search over the stored conversation history"""
+import re
+import sqlite3
+import threading
+import time
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+# snippet() markers around matched words, split back out by the UI
+MATCH_START = "\x02"
+MATCH_END = "\x03"
+
+MIN_PREFIX = 3
+
+
+def match_query(text):
+    """Turn free text into a safe FTS5 query: every word must appear, the
+    last one as a prefix so a half-typed word still matches (from
+    MIN_PREFIX characters; shorter prefixes expand to too many terms)"""
+    words = _TOKEN_RE.findall(text)
+    if not words:
+        return None
+    terms = [f'"{word}"' for word in words]
+    if len(words[-1]) >= MIN_PREFIX:
+        terms[-1] += "*"
+    return " ".join(terms)
+
+
+class HistorySearch:
+    """Ranked full-text search over a table of stored turns
+
+    An external-content FTS5 table mirrors the turns table (scope, row,
+    value) and is kept in sync by insert/update/delete triggers, so the text
+    is stored once. Rows that existed before the index are indexed by
+    backfill_batch() in rowid ranges, each its own short transaction, with
+    progress kept in a search_backfill table so a restart resumes where it
+    stopped. Without FTS5 in the SQLite build, search() returns nothing.
+
+    Ranking (bm25) scores every match, so a query made of common words
+    only ranks its newest max_ranked matches; rare words are ranked over
+    the whole history.
+    """
+
+    def __init__(self, conn, table="long_term_memory", batch_size=5000, max_ranked=5000):
+        self.conn = conn
+        self.table = table
+        self.fts = f"{table}_fts"
+        self.batch_size = batch_size
+        self.max_ranked = max_ranked
+        self.available = True
+        self.db_lock = threading.Lock()
+
+        # Counters
+        self.searches = 0
+        self.total_search_time = 0.0
+        self.backfilled = 0
+
+    def create_tables(self):
+        """Create the FTS table and triggers; rows already stored are queued for backfill"""
+        with self.db_lock:
+            exists = self.conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (self.fts,)
+            ).fetchone()
+            if exists:
+                return
+            if self.conn.in_transaction:
+                self.conn.commit()
+            # Table, triggers and the backfill range are created atomically
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                self.conn.execute(
+                    f"CREATE VIRTUAL TABLE {self.fts} USING fts5("
+                    f"value, scope UNINDEXED, content='{self.table}', content_rowid='rowid', "
+                    f"tokenize='porter unicode61')"
+                )
+            except sqlite3.OperationalError:
+                # This SQLite build has no FTS5
+                self.conn.rollback()
+                self.available = False
+                return
+            self.conn.execute(f'''
+                CREATE TRIGGER {self.fts}_ai AFTER INSERT ON {self.table} BEGIN
+                    INSERT INTO {self.fts} (rowid, value, scope) VALUES (new.rowid, new.value, new.scope);
+                END
+            ''')
+            self.conn.execute(f'''
+                CREATE TRIGGER {self.fts}_ad AFTER DELETE ON {self.table} BEGIN
+                    INSERT INTO {self.fts} ({self.fts}, rowid, value, scope)
+                    VALUES ('delete', old.rowid, old.value, old.scope);
+                END
+            ''')
+            self.conn.execute(f'''
+                CREATE TRIGGER {self.fts}_au AFTER UPDATE ON {self.table} BEGIN
+                    INSERT INTO {self.fts} ({self.fts}, rowid, value, scope)
+                    VALUES ('delete', old.rowid, old.value, old.scope);
+                    INSERT INTO {self.fts} (rowid, value, scope) VALUES (new.rowid, new.value, new.scope);
+                END
+            ''')
+            self.conn.execute('''
+                CREATE TABLE IF NOT EXISTS search_backfill (
+                    name TEXT PRIMARY KEY,
+                    next_rowid INTEGER,
+                    last_rowid INTEGER
+                )
+            ''')
+            # Everything up to the current last rowid predates the triggers
+            self.conn.execute(
+                f"INSERT OR REPLACE INTO search_backfill (name, next_rowid, last_rowid) "
+                f"SELECT ?, IFNULL(MIN(rowid), 1), IFNULL(MAX(rowid), 0) FROM {self.table}",
+                (self.fts,),
+            )
+            self.conn.commit()
+
+    def backfill_batch(self, conn):
+        """Index the next batch of pre-existing rows on conn; returns True while more remain
+
+        Runs inside the caller's transaction (a DbWriter intent).
+        """
+        if not self.available:
+            return False
+        try:
+            progress = conn.execute(
+                "SELECT next_rowid, last_rowid FROM search_backfill WHERE name = ?", (self.fts,)
+            ).fetchone()
+        except sqlite3.OperationalError:
+            return False
+        if progress is None or progress[0] > progress[1]:
+            return False
+        start, last = progress
+        end = min(start + self.batch_size, last + 1)
+        cursor = conn.execute(
+            f"INSERT INTO {self.fts} (rowid, value, scope) "
+            f"SELECT rowid, value, scope FROM {self.table} WHERE rowid >= ? AND rowid < ?",
+            (start, end),
+        )
+        conn.execute("UPDATE search_backfill SET next_rowid = ? WHERE name = ?", (end, self.fts))
+        self.backfilled += max(cursor.rowcount, 0)
+        return end <= last
+
+    def search(self, text, scope=None, limit=20, offset=0):
+        """Return (hits, more): up to limit (rowid, snippet) pairs, best first
+
+        Matched words in a snippet are wrapped in MATCH_START / MATCH_END.
+        """
+        query = match_query(text)
+        if not self.available or query is None:
+            return [], False
+        started = time.perf_counter()
+        scoped = " AND scope = :scope" if scope is not None else ""
+        # Rank within the newest max_ranked matches; one extra row tells
+        # whether there is a next page
+        sql = (
+            f"SELECT rowid, snippet({self.fts}, 0, :start, :end, '…', 16) FROM {self.fts} "
+            f"WHERE {self.fts} MATCH :query{scoped} AND rowid >= IFNULL(("
+            f"SELECT rowid FROM {self.fts} WHERE {self.fts} MATCH :query{scoped} "
+            f"ORDER BY rowid DESC LIMIT 1 OFFSET :window), 0) "
+            f"ORDER BY rank LIMIT :limit OFFSET :offset"
+        )
+        params = {
+            "start": MATCH_START, "end": MATCH_END, "query": query, "scope": scope,
+            "window": self.max_ranked - 1, "limit": limit + 1, "offset": offset,
+        }
+        with self.db_lock:
+            try:
+                rows = self.conn.execute(sql, params).fetchall()
+            except sqlite3.OperationalError:
+                rows = []
+            self.searches += 1
+            self.total_search_time += time.perf_counter() - started
+        return rows[:limit], len(rows) > limit
+
+    def stats(self):
+        """Search count, average search time and rows backfilled"""
+        with self.db_lock:
+            return {
+                "available": self.available,
+                "searches": self.searches,
+                "avg_search_time": self.total_search_time / self.searches if self.searches else 0.0,
+                "backfilled": self.backfilled,
+            }
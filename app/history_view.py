@@ -0,0 +1,147 @@
+"""Chat history view that keeps only the newest messages in the Text widget"""
+import time
+
+
+class HistoryView:
+    """Render at most max_rendered messages of a chat into a Text widget
+
+    Every message goes into a plain log, [tag, text] per message, that is
+    the backing store. The widget only holds a window of it: while the view
+    follows the conversation, adding a message past max_rendered deletes the
+    oldest rendered one, so an insert (and see(), and relayout on resize)
+    costs the same after ten thousand replies as after ten. Scrolling to the
+    top pages page_size older messages back in above the current view;
+    returning to the bottom trims the window again.
+
+    A message is either added whole with add(), or started with start() and
+    grown with extend() while a reply streams in. Each rendered message
+    starts at a left-gravity mark, so eviction and paging never depend on
+    how the text wraps or how many lines a message has.
+    """
+
+    def __init__(self, text, max_rendered=200, page_size=50, scrollbar=None):
+        self.text = text
+        self.max_rendered = max_rendered
+        self.page_size = page_size
+        self.scrollbar = scrollbar or getattr(text, "vbar", None)
+        self.log = []
+        # Log indices rendered: [first, len(log))
+        self.first = 0
+        self.following = True
+        self.page_pending = False
+        self.trim_pending = False
+        text.configure(yscrollcommand=self._on_yscroll)
+
+        # Counters
+        self.inserts = 0
+        self.total_insert_time = 0.0
+        self.max_insert_time = 0.0
+        self.evicted = 0
+        self.paged_in = 0
+
+    def _mark(self, index):
+        return f"history{index}"
+
+    @property
+    def rendered(self):
+        return len(self.log) - self.first
+
+    def add(self, text, tag=None):
+        """Append a whole message"""
+        self._append([tag, text])
+
+    def start(self, text, tag=None):
+        """Append a message that extend() will grow (a streamed reply)"""
+        self._append([tag, text])
+
+    def extend(self, text):
+        """Add text to the newest message"""
+        if not self.log:
+            return self.add(text)
+        started = time.perf_counter()
+        message = self.log[-1]
+        message[1] += text
+        self.text.insert("end", text, message[0] or ())
+        self._follow()
+        self._timed(started)
+
+    def _append(self, message):
+        started = time.perf_counter()
+        index = len(self.log)
+        self.log.append(message)
+        mark = self._mark(index)
+        self.text.mark_set(mark, "end-1c")
+        self.text.mark_gravity(mark, "left")
+        self.text.insert("end", message[1], message[0] or ())
+        if self.following:
+            self._trim()
+        self._follow()
+        self._timed(started)
+
+    def _timed(self, started):
+        elapsed = time.perf_counter() - started
+        self.inserts += 1
+        self.total_insert_time += elapsed
+        self.max_insert_time = max(self.max_insert_time, elapsed)
+
+    def _follow(self):
+        if self.following:
+            self.text.see("end")
+
+    def _trim(self):
+        """Drop the oldest rendered messages down to max_rendered"""
+        while self.rendered > self.max_rendered:
+            mark, following = self._mark(self.first), self._mark(self.first + 1)
+            self.text.delete(mark, following)
+            self.text.mark_unset(mark)
+            self.first += 1
+            self.evicted += 1
+
+    def _page_in(self):
+        """Render up to page_size older messages above the current ones"""
+        self.page_pending = False
+        if not self.first:
+            return
+        shown = top = self._mark(self.first)
+        for index in range(self.first - 1, max(0, self.first - self.page_size) - 1, -1):
+            tag, text = self.log[index]
+            # Let the current top mark move down past the inserted text
+            self.text.mark_gravity(top, "right")
+            self.text.insert("1.0", text, tag or ())
+            self.text.mark_gravity(top, "left")
+            top = self._mark(index)
+            self.text.mark_set(top, "1.0")
+            self.text.mark_gravity(top, "left")
+            self.first = index
+            self.paged_in += 1
+        # Keep what was on screen where it was
+        self.text.yview(shown)
+
+    def _trim_now(self):
+        self.trim_pending = False
+        if self.following:
+            self._trim()
+
+    def _on_yscroll(self, first, last):
+        if self.scrollbar is not None:
+            self.scrollbar.set(first, last)
+        first, last = float(first), float(last)
+        self.following = last >= 1.0
+        # Changing the text from inside a scroll callback is left to idle time
+        if first <= 0.0 and last < 1.0 and self.first and not self.page_pending:
+            self.page_pending = True
+            self.text.after_idle(self._page_in)
+        elif self.following and self.rendered > self.max_rendered and not self.trim_pending:
+            self.trim_pending = True
+            self.text.after_idle(self._trim_now)
+
+    def stats(self):
+        """Messages kept and rendered, and insert timings"""
+        return {
+            "messages": len(self.log),
+            "rendered": self.rendered,
+            "evicted": self.evicted,
+            "paged_in": self.paged_in,
+            "avg_insert_time": self.total_insert_time / self.inserts if self.inserts else 0.0,
+            "max_insert_time": self.max_insert_time,
+        }
@@ -1,10 +1,18 @@
 import tkinter as tk
 from tkinter import ttk, messagebox, scrolledtext
-import sqlite3
-import google.generativeai as genai
 import os
+import sys
 from datetime import datetime
-import threading
+from worker_pool import QueueFull
+from personas import PERSONAS
+from search_window import SearchWindow
+from history_view import HistoryView
+from startup import BackgroundInit, mark, profile_startup
+
+# Kaito, under the scope this app has always kept its long-term memory and
+# search index under
+PERSONA = dict(PERSONAS["kaito"], scope="kaito-memory")
+
 
 class KaitoChatApp:
     def __init__(self, master):
@@ -28,100 +36,111 @@ class KaitoChatApp:
         self.SYSTEM_FONT_BOLD = ('Roboto', 12, 'bold')
         self.CHAT_FONT = ('Consolas', 11)
 
-        # Database setup
-        self.conn = sqlite3.connect('kaito_context_memory.db', check_same_thread=False)
-        self.create_tables()
+        # Chat core: prompt, context, memory and model logic, shared with the
+        # other apps and the HTTP server. This window only shows its events.
+        # The turns stay in kaito_context_memory.db's context_memory turn log,
+        # the newest MAX_STORED_TURNS of them; the core's own state (caches,
+        # summary, snapshot) goes in a chat_state table next to it.
+        self.DB_PATH = 'kaito_context_memory.db'
+        self.MAX_STORED_TURNS = 50
+        self.MODEL_NAME = "gemini-1.5-flash"
+        self.SUMMARY_MODEL = None
+        self.MAX_IN_FLIGHT = 1
+        self.MAX_QUEUED_MESSAGES = 5
+        # Race a second call against one slow to start (costs extra quota)
+        self.HEDGE_SLOW_CALLS = False
+        # Pick a model tier and reply length per message (see model_router.py;
+        # short messages get the smallest model and 256-token replies)
+        self.ROUTE_MODELS = False
+        # Log each pick to ~/.gemini_routing.jsonl for model_router.py replays
+        self.LOG_ROUTING = False
+        # Warm the connection and the prompt up as the user focuses the input or types
+        self.PREWARM_ON_TYPING = True
+        self.services = self.core = self.bridge = self.listener = None
+        master.protocol("WM_DELETE_WINDOW", self.on_close)
+        self.search_window = None
+        master.bind("<Control-f>", self.open_search)
+
+        # UI setup
+        self.create_ui()
+
+        # The window paints first: the Gemini SDK import, the database, the
+        # memory and the saved context load on a background thread, and
+        # messages sent meanwhile wait for them
+        self.startup = BackgroundInit(
+            master, self._start_services, self._services_ready, self._startup_failed,
+            dispose=lambda built: built[0].close(timeout=2),
+        )
+        self.startup.start()
+
+    def _start_services(self):
+        """Import the SDK, open the chat core and load the memory (on the startup thread)."""
+        import google.generativeai as genai
+        from chat_core import ChatServices
+        from governor import Governor
+        from model_router import DEFAULT_LOG, ModelRouter
+        mark("sdk")
 
-        # Gemini API setup
         genai.configure(api_key=os.environ["GEMINI_API_KEY"])
-        self.model = genai.GenerativeModel(model_name="gemini-1.5-flash")
+        services = ChatServices(
+            self.DB_PATH,
+            lambda instruction, name=None, config=None: genai.GenerativeModel(
+                model_name=name or self.MODEL_NAME, system_instruction=instruction, generation_config=config,
+            ),
+            max_in_flight=self.MAX_IN_FLIGHT,
+            max_queue=self.MAX_QUEUED_MESSAGES,
+            summary_model=genai.GenerativeModel(model_name=self.SUMMARY_MODEL) if self.SUMMARY_MODEL else None,
+            # Shared with every other chat app using the key
+            governor=Governor("kaito-memory"),
+            hedge=self.HEDGE_SLOW_CALLS,
+            router=ModelRouter(log_path=DEFAULT_LOG if self.LOG_ROUTING else None) if self.ROUTE_MODELS else None,
+            prewarm=self.PREWARM_ON_TYPING,
+            table="chat_state",
+            turn_log="context_memory",
+            turn_log_size=self.MAX_STORED_TURNS,
+        )
+        try:
+            self._move_memory_files(services.memory_path(PERSONA["scope"]))
+            core = services.core(PERSONA)
+        except BaseException:
+            services.close(timeout=2)
+            raise
+        mark("services")
+        return services, core
 
-        # Context memory
-        self.context_window = []
-        self.MAX_CONTEXT_LENGTH = 5
-        self.load_context()
+    def _move_memory_files(self, path):
+        """Give long-term memory files from before the chat core the name the core looks for."""
+        old = os.path.splitext(self.DB_PATH)[0] + ".vectors"
+        for suffix in (".npz", ".log"):
+            if os.path.exists(old + suffix) and not os.path.exists(path + suffix):
+                os.replace(old + suffix, path + suffix)
 
-        # UI setup
-        self.create_ui()
+    def _services_ready(self, built):
+        """Hook the chat core up to the window (on the Tk thread)."""
+        from async_engine import TkBridge
+        from chat_core import ViewListener
 
-    def create_tables(self):
-        """Create SQLite tables for context memory."""
-        cursor = self.conn.cursor()
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS context_memory (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                value TEXT,
-                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        self.conn.commit()
-
-    def load_context(self):
-        """Load saved context from the database."""
-        cursor = self.conn.cursor()
-        cursor.execute("SELECT value FROM context_memory ORDER BY timestamp ASC LIMIT ?", (self.MAX_CONTEXT_LENGTH,))
-        rows = cursor.fetchall()
-        self.context_window = [row[0] for row in rows]
-
-    def prune_old_context(self):
-        """Remove old context entries from the database."""
-        cursor = self.conn.cursor()
-        cursor.execute(
-            "DELETE FROM context_memory WHERE id NOT IN (SELECT id FROM context_memory ORDER BY timestamp DESC LIMIT ?)",
-            (self.MAX_CONTEXT_LENGTH,)
+        self.services, self.core = built
+        # Core events come back to Tk through the bridge's single after() pump
+        self.bridge = TkBridge(self.master)
+        self.listener = ViewListener(
+            self.bridge,
+            user_message=self._display_user_message,
+            status=self.update_status,
+            reply=self._display_ai_response,
+            reply_start=self._begin_ai_response,
+            reply_text=self._append_ai_response,
+            reply_end=self._end_ai_response,
+            error=self._display_error,
         )
-        self.conn.commit()
-
-    def _update_context(self, user_message, response_text):
-        """Update context with a new conversation entry."""
-        context_entry = f"User said: {user_message}\nKaito responded: {response_text}"
-        self.context_window.append(context_entry)
-
-        if len(self.context_window) > self.MAX_CONTEXT_LENGTH:
-            self.context_window.pop(0)
-
-        # Save to database
-        cursor = self.conn.cursor()
-        cursor.execute("INSERT INTO context_memory (value) VALUES (?)", (context_entry,))
-        self.conn.commit()
-
-        # Prune old entries
-        self.prune_old_context()
-
-    def build_contextual_prompt(self, user_message):
-        """Build a contextual prompt for the AI."""
-        context_str = "\n".join(self.context_window)
-        context_type = self.context_var.get()
-        context_mapping = {
-            "Harsh Critique": "Respond with maximum criticism and zero sugar-coating.",
-            "Tough Love": "Provide harsh but constructive feedback.",
-            "Raw Honesty": "Be brutally direct, hold nothing back.",
-            "Direct Mode": "Give unfiltered, straightforward advice."
-        }
-
-        return f"""
-You are N25 Kaito, an entity from the Empty Sekai who embodies brutal honesty and unfiltered truth.
-Interaction Mode: {context_type}
-Special Instructions: {context_mapping.get(context_type, '')}
-
-Core Personality Traits:
-- Always speak with harsh, cold honesty
-- Do not sugarcoat anything
-- Prioritize truth over feelings
-- Encourage growth through direct criticism
-- Maintain an emotionally detached demeanor
-
-Recent Context:
-{context_str}
-
-User's Latest Message: {user_message}
-
-Respond with:
-1. Absolute directness
-2. No emotional padding
-3. Harsh but potentially constructive insights
-4. A tone that suggests you don't care about being liked
-"""
+        self.update_status("")
+        # A message usually follows soon after startup
+        self._prewarm(focus=True)
+
+    def _startup_failed(self, error):
+        """Show why startup failed; messages stay unsent."""
+        self.history.add(f"Error: could not start: {error}\n\n", "system")
+        self.update_status("Startup failed")
 
     def create_ui(self):
         """Set up the user interface."""
@@ -138,13 +157,17 @@ Respond with:
         )
         self.chat_history.pack(fill=tk.BOTH, expand=True, pady=(0, 20))
 
+        # Only the newest messages stay in the widget; older ones page back in
+        # when scrolled to the top
+        self.history = HistoryView(self.chat_history)
+
         input_frame = ttk.Frame(self.master, style='Input.TFrame')
         input_frame.pack(fill=tk.X, pady=(0, 15))
 
         self.context_var = tk.StringVar(value="Direct Mode")
         context_dropdown = ttk.Combobox(
-            input_frame, 
-            textvariable=self.context_var, 
+            input_frame,
+            textvariable=self.context_var,
             values=["Direct Mode", "Harsh Critique", "Tough Love", "Raw Honesty"],
             width=15
         )
@@ -153,34 +176,97 @@ Respond with:
         self.input_entry = ttk.Entry(input_frame, width=50, font=self.SYSTEM_FONT)
         self.input_entry.pack(side=tk.LEFT, expand=True, fill=tk.X, padx=(0, 10))
         self.input_entry.bind("<Return>", self.send_message)
+        self.input_entry.bind("<FocusIn>", self.on_entry_focus)
+        self.input_entry.bind("<Key>", self._prewarm)
 
         send_button = ttk.Button(input_frame, text="SEND", command=self.send_message)
         send_button.pack(side=tk.LEFT)
 
+        search_button = ttk.Button(input_frame, text="SEARCH", command=self.open_search)
+        search_button.pack(side=tk.LEFT, padx=(10, 0))
+
+        # Startup, queue depth and the rate limit's cooldown
+        self.status_var = tk.StringVar(value="Starting up...")
+        status_bar = ttk.Label(self.master, textvariable=self.status_var, anchor=tk.W, font=('Consolas', 9))
+        status_bar.pack(fill=tk.X)
+
+    def on_entry_focus(self, event):
+        """Warm up as soon as the input gets focus."""
+        self._prewarm(focus=True)
+
+    def _prewarm(self, event=None, focus=False):
+        """Get the chat ready for the message being typed (see ChatCore.prewarm)."""
+        if self.core is not None:
+            self.core.prewarm(self.context_var.get(), self.input_entry.get(), focus)
+
     def send_message(self, event=None):
         user_message = self.input_entry.get().strip()
-        if user_message:
-            threading.Thread(target=self._process_message, args=(user_message,), daemon=True).start()
+        if not user_message:
+            return
+        if not self.startup.done:
+            # Still starting up: sent once the memory is loaded
+            self.startup.when_ready(self._send, user_message, self.context_var.get())
+            self.input_entry.delete(0, tk.END)
+        elif self.core is not None and self._send(user_message, self.context_var.get()):
+            self.input_entry.delete(0, tk.END)
 
-    def _process_message(self, user_message):
-        """Handle user input and generate AI response."""
-        self.chat_history.insert(tk.END, f"You: {user_message}\n", "user")
-        self.input_entry.delete(0, tk.END)
-
-        contextual_prompt = self.build_contextual_prompt(user_message)
+    def _send(self, user_message, mode):
+        """Hand a message to the core; False if its queue is full."""
         try:
-            response = self.model.generate_content(contextual_prompt)
-            ai_response = response.text
-            self.chat_history.insert(tk.END, f"Kaito: {ai_response}\n\n", "ai")
-            self._update_context(user_message, ai_response)
-        except Exception as e:
-            self.chat_history.insert(tk.END, f"Error: {str(e)}\n\n", "system")
+            self.core.send(user_message, mode, self.listener)
+        except QueueFull:
+            self.history.add("Busy: too many messages queued, try again shortly.\n\n", "system")
+            return False
+        return True
+
+    def _display_user_message(self, user_message):
+        self.history.add(f"You: {user_message}\n", "user")
+
+    def _display_ai_response(self, response_text):
+        self.history.add(f"Kaito: {response_text}\n\n", "ai")
+
+    def _begin_ai_response(self):
+        self.history.start("Kaito: ", "ai")
+
+    def _append_ai_response(self, text):
+        """Append streamed text to the chat history."""
+        self.history.extend(text)
+
+    def _end_ai_response(self):
+        self.history.extend("\n\n")
+
+    def _display_error(self, error_message):
+        self.history.add(f"Error: {error_message}\n\n", "system")
+
+    def update_status(self, message):
+        self.status_var.set(message)
+
+    def open_search(self, event=None):
+        """Open the history search window, or raise it if it is already open."""
+        if self.services is None:
+            return self.startup.when_ready(self.open_search)
+        if self.search_window is not None and self.search_window.exists():
+            self.search_window.lift()
+            return
+        self.search_window = SearchWindow(
+            self.master, self.services.search_index, self.services.pool.submit, self.bridge,
+            scope=self.core.scope,
+            font=self.CHAT_FONT, bg=self.BACKGROUND_COLOR, fg=self.TEXT_COLOR, accent=self.BORDER_COLOR,
+        )
 
-    def __del__(self):
-        """Close database connection."""
-        self.conn.close()
+    def on_close(self):
+        """Cancel outstanding requests, commit queued writes and close the window."""
+        if self.services is not None:
+            self.services.close(timeout=2)
+            self.bridge.stop()
+        else:
+            # Whatever startup opens is closed once it has
+            self.startup.cancel()
+        self.master.destroy()
 
 def main():
+    if "--profile-startup" in sys.argv:
+        return profile_startup(__file__, KaitoChatApp)
     root = tk.Tk()
     app = KaitoChatApp(root)
     root.mainloop()
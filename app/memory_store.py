@@ -0,0 +1,216 @@
+"""SQLite store for conversation turns: WAL mode and batched, indexed pruning"""
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+
+def connect(path, busy_timeout=5.0):
+    """Open a connection in WAL mode with a busy timeout, usable from any thread"""
+    conn = sqlite3.connect(path, timeout=busy_timeout, check_same_thread=False, cached_statements=128)
+    conn.execute("PRAGMA journal_mode=WAL")
+    # With WAL, NORMAL only syncs at checkpoints: a crash can lose the last
+    # commits but never corrupts the database
+    conn.execute("PRAGMA synchronous=NORMAL")
+    # INSERT OR REPLACE then fires delete triggers too (keeps FTS mirrors in sync)
+    conn.execute("PRAGMA recursive_triggers=ON")
+    return conn
+
+
+class MemoryStore:
+    """Append-only log of turns that keeps roughly the newest max_stored rows
+
+    Pruning deletes every row below an id watermark (the id of the
+    max_stored-th newest row), a range delete on the rowid instead of a
+    NOT IN over a sorted subquery, and only runs every prune_every inserts,
+    inside that insert's transaction. The SQL is fixed per store so
+    sqlite3's statement cache keeps each statement prepared. The store owns
+    its whole table, so the watermark and prune only ever see its own rows;
+    create_tables refuses a key/value table shared through ChatServices.
+
+    With a DbWriter, inserts are queued for its next group commit instead of
+    being committed by the caller; conn is then only used for reads.
+    """
+
+    def __init__(self, conn, max_stored=50, prune_every=20, table="context_memory", writer=None):
+        self.conn = conn
+        self.writer = writer
+        self.max_stored = max_stored
+        self.prune_every = prune_every
+        self.table = table
+        self.lock = threading.Lock()
+        self.inserts_since_prune = 0
+
+        self.sql_insert = f"INSERT INTO {table} (value) VALUES (?)"
+        self.sql_recent = f"SELECT value FROM {table} ORDER BY id DESC LIMIT ?"
+        self.sql_watermark = f"SELECT id FROM {table} ORDER BY id DESC LIMIT 1 OFFSET ?"
+        self.sql_prune = f"DELETE FROM {table} WHERE id < ?"
+
+        # Counters
+        self.inserts = 0
+        self.prunes = 0
+        self.rows_pruned = 0
+
+    def create_tables(self):
+        with self.lock:
+            self.conn.execute(f'''
+                CREATE TABLE IF NOT EXISTS {self.table} (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    value TEXT,
+                    timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            columns = {row[1] for row in self.conn.execute(f"PRAGMA table_info({self.table})")}
+            if "key" in columns:
+                # A ChatServices key/value table: the id watermark would
+                # prune its responses and sessions along with our turns
+                raise RuntimeError(f"{self.table} is a key/value table; use another database file or table")
+            self.conn.execute(
+                f"CREATE INDEX IF NOT EXISTS {self.table}_timestamp ON {self.table} (timestamp)"
+            )
+            self.conn.commit()
+
+    def recent(self, limit=None):
+        """Return the newest limit values (max_stored by default), oldest first"""
+        with self.lock:
+            rows = self.conn.execute(self.sql_recent, (limit or self.max_stored,)).fetchall()
+        return [row[0] for row in reversed(rows)]
+
+    def append(self, value):
+        """Insert one value, pruning every prune_every inserts"""
+        if self.writer is not None:
+            return self.writer.submit(self._append, value)
+        with self.lock:
+            self._append(self.conn, value)
+            self.conn.commit()
+
+    def _append(self, conn, value):
+        conn.execute(self.sql_insert, (value,))
+        self.inserts += 1
+        self.inserts_since_prune += 1
+        if self.inserts_since_prune >= self.prune_every:
+            self.inserts_since_prune = 0
+            self._prune(conn)
+
+    def prune(self):
+        """Drop everything but the newest max_stored rows now"""
+        if self.writer is not None:
+            return self.writer.submit(self._prune)
+        with self.lock:
+            self._prune(self.conn)
+            self.conn.commit()
+
+    def _prune(self, conn):
+        row = conn.execute(self.sql_watermark, (self.max_stored - 1,)).fetchone()
+        if row is None:
+            return
+        deleted = conn.execute(self.sql_prune, (row[0],)).rowcount
+        self.prunes += 1
+        self.rows_pruned += max(deleted, 0)
+
+    def stats(self):
+        with self.lock:
+            return {
+                "inserts": self.inserts,
+                "prunes": self.prunes,
+                "rows_pruned": self.rows_pruned,
+            }
+
+
+class TurnLog:
+    """ChatSession storage on a MemoryStore: one row per exchange, holding
+    its context entry
+
+    entry_format has {user} and {reply} (a persona's context_entry), and
+    rows are split back into exchanges on the text between the two, so a
+    turn log written before the chat core loads as is. Rows not in that
+    format are skipped.
+    """
+
+    def __init__(self, store, entry_format):
+        self.store = store
+        self.entry_format = entry_format
+        head, _, rest = entry_format.partition("{user}")
+        middle, _, tail = rest.partition("{reply}")
+        self.head, self.middle, self.tail = head, middle, tail
+
+    def load(self, limit):
+        """Return the newest limit exchanges, oldest first"""
+        exchanges = []
+        for entry in self.store.recent(limit):
+            if not entry.startswith(self.head) or not entry.endswith(self.tail):
+                continue
+            user_message, found, reply = entry[len(self.head):len(entry) - len(self.tail)].partition(self.middle)
+            if found:
+                exchanges.append((user_message, reply))
+        return exchanges
+
+    def save(self, user_message, reply):
+        """Append one exchange (queued for the writer's next commit when the store has one)"""
+        self.store.append(self.entry_format.format(user=user_message, reply=reply))
+
+
+def benchmark(inserts=2000, max_stored=50, prune_every=20, value_size=400):
+    """Inserts per second for the old per-message insert/prune/commit pattern,
+    for MemoryStore and for MemoryStore behind a DbWriter, each on a fresh
+    database file"""
+    value = "x" * value_size
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        # Before: default journal, commit after the insert and after a
+        # NOT IN prune on every message
+        conn = sqlite3.connect(os.path.join(directory, "before.db"))
+        conn.execute(
+            "CREATE TABLE context_memory (id INTEGER PRIMARY KEY AUTOINCREMENT, value TEXT, "
+            "timestamp DATETIME DEFAULT CURRENT_TIMESTAMP)"
+        )
+        started = time.perf_counter()
+        for _ in range(inserts):
+            conn.execute("INSERT INTO context_memory (value) VALUES (?)", (value,))
+            conn.commit()
+            conn.execute(
+                "DELETE FROM context_memory WHERE id NOT IN "
+                "(SELECT id FROM context_memory ORDER BY timestamp DESC LIMIT ?)",
+                (max_stored,),
+            )
+            conn.commit()
+        results["before"] = inserts / (time.perf_counter() - started)
+        conn.close()
+
+        # After: WAL, one commit per message, watermark prune every prune_every
+        conn = connect(os.path.join(directory, "after.db"))
+        store = MemoryStore(conn, max_stored, prune_every)
+        store.create_tables()
+        started = time.perf_counter()
+        for _ in range(inserts):
+            store.append(value)
+        results["after"] = inserts / (time.perf_counter() - started)
+        conn.close()
+
+        # With a DbWriter: appends only queue, commits are grouped
+        from db_writer import DbWriter
+        path = os.path.join(directory, "writer.db")
+        conn = connect(path)
+        writer = DbWriter(path)
+        store = MemoryStore(conn, max_stored, prune_every, writer=writer)
+        store.create_tables()
+        started = time.perf_counter()
+        for _ in range(inserts):
+            store.append(value)
+        queued = time.perf_counter() - started
+        writer.flush()
+        results["writer"] = inserts / (time.perf_counter() - started)
+        results["writer_append_us"] = queued / inserts * 1e6
+        results["writer_batches"] = writer.stats()["batches"]
+        writer.close()
+        conn.close()
+    return results
+
+
+if __name__ == "__main__":
+    results = benchmark()
+    print(f"before: {results['before']:.0f} inserts/s")
+    print(f"after:  {results['after']:.0f} inserts/s ({results['after'] / results['before']:.1f}x)")
+    print(f"writer: {results['writer']:.0f} inserts/s in {results['writer_batches']} commits, "
+          f"{results['writer_append_us']:.1f} us per append on the caller")
@@ -0,0 +1,133 @@
+"""Rolling summary of conversation turns that left the context window"""
+import asyncio
+import re
+import threading
+import time
+from collections import Counter
+
+_SENTENCE_RE = re.compile(r"[^.!?\n]+[.!?]?")
+_WORD_RE = re.compile(r"[a-z0-9']+")
+_STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "but", "by", "for", "from", "has",
+    "have", "i", "in", "is", "it", "its", "me", "my", "not", "of", "on", "or",
+    "so", "that", "the", "this", "to", "was", "were", "with", "you", "your",
+}
+
+
+def extractive_summary(text, max_chars=1200):
+    """Keep the highest-scoring sentences of text, in their original order
+
+    Sentences are scored by the average corpus frequency of their content
+    words, which favours whatever the conversation keeps coming back to.
+    """
+    sentences = [s.strip() for s in _SENTENCE_RE.findall(text) if s.strip()]
+    if sum(len(s) + 1 for s in sentences) <= max_chars:
+        return " ".join(sentences)
+
+    def content_words(sentence):
+        return [w for w in _WORD_RE.findall(sentence.lower()) if w not in _STOPWORDS]
+
+    frequencies = Counter(w for s in sentences for w in content_words(s))
+    scored = []
+    for index, sentence in enumerate(sentences):
+        words = content_words(sentence)
+        if words:
+            scored.append((sum(frequencies[w] for w in words) / len(words), index))
+    kept, used = [], 0
+    for _, index in sorted(scored, reverse=True):
+        length = len(sentences[index]) + 1
+        if used + length <= max_chars:
+            kept.append(index)
+            used += length
+    return " ".join(sentences[i] for i in sorted(kept))
+
+
+class RollingSummary:
+    """Fold old turns into one summary, persisted as a key/value row
+
+    With a model the summary is rewritten by that (cheaper) model, falling
+    back to the local extractive summarizer if the call fails; without one
+    it is always extractive. Folds are serialized so they apply in order.
+    With a DbWriter, saves are queued for its next group commit.
+    """
+
+    def __init__(self, conn=None, table="context_memory", key="summary", model=None,
+                 max_chars=1200, writer=None):
+        self.conn = conn
+        self.writer = writer
+        self.table = table
+        self.key = key
+        self.model = model
+        self.max_chars = max_chars
+        self.text = ""
+        self.fold_lock = asyncio.Lock()
+        self.db_lock = threading.Lock()
+
+        # Counters
+        self.folds = 0
+        self.turns_folded = 0
+        self.model_failures = 0
+        self.last_fold_time = 0.0
+
+    def load(self):
+        """Load the saved summary, if any"""
+        if self.conn is None:
+            return self.text
+        with self.db_lock:
+            row = self.conn.execute(
+                f"SELECT value FROM {self.table} WHERE key = ?", (self.key,)
+            ).fetchone()
+        self.text = row[0] if row else ""
+        return self.text
+
+    def save(self, text):
+        if self.writer is not None:
+            self.writer.submit(self._write, text, time.time())
+            return
+        if self.conn is None:
+            return
+        with self.db_lock:
+            self._write(self.conn, text, time.time())
+            self.conn.commit()
+
+    def _write(self, conn, text, now):
+        conn.execute(
+            f"INSERT OR REPLACE INTO {self.table} (key, value, timestamp) VALUES (?, ?, ?)",
+            (self.key, text, now),
+        )
+
+    async def fold(self, turns, run_blocking):
+        """Merge turns into the summary and persist it via run_blocking"""
+        if not turns:
+            return self.text
+        async with self.fold_lock:
+            started = time.perf_counter()
+            material = "\n".join([self.text] + list(turns)).strip()
+            summary = None
+            if self.model is not None:
+                try:
+                    response = await self.model.generate_content_async(
+                        "Summarize this conversation history in under "
+                        f"{self.max_chars} characters. Keep names, facts, preferences "
+                        f"and open questions; drop small talk.\n\n{material}"
+                    )
+                    summary = response.text.strip()[:self.max_chars]
+                except Exception:
+                    self.model_failures += 1
+            if not summary:
+                summary = await run_blocking(extractive_summary, material, self.max_chars)
+            self.text = summary
+            await run_blocking(self.save, summary)
+            self.folds += 1
+            self.turns_folded += len(turns)
+            self.last_fold_time = time.perf_counter() - started
+            return summary
+
+    def stats(self):
+        return {
+            "summary_chars": len(self.text),
+            "folds": self.folds,
+            "turns_folded": self.turns_folded,
+            "model_failures": self.model_failures,
+            "last_fold_time": self.last_fold_time,
+        }
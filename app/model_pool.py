@@ -0,0 +1,43 @@
+"""GenerativeModel objects pre-built per (persona, mode)"""
+import threading
+from collections import OrderedDict
+
+
+class ModelPool:
+    """Build one model per (persona, mode) with its system instruction, once
+
+    factory(system_instruction) returns a configured model; options given
+    to add() or get() are passed on after the instruction (a routed model
+    name and generation config). Known modes are added up front; a mode
+    typed into the combobox is built on first use and the least recently
+    used extras are dropped past max_models.
+    """
+
+    def __init__(self, factory, max_models=16):
+        self.factory = factory
+        self.max_models = max_models
+        self.models = OrderedDict()
+        self.lock = threading.Lock()
+        self.builds = 0
+
+    def add(self, key, system_instruction, *options):
+        """Build and keep the model for key; returns (model, system_instruction)"""
+        model = self.factory(system_instruction, *options)
+        with self.lock:
+            self.builds += 1
+            self.models[key] = (model, system_instruction)
+            self.models.move_to_end(key)
+            while len(self.models) > self.max_models:
+                self.models.popitem(last=False)
+        return model, system_instruction
+
+    def get(self, key, build_instruction=None, *options):
+        """Return (model, system_instruction) for key, building it if missing"""
+        with self.lock:
+            entry = self.models.get(key)
+            if entry is not None:
+                self.models.move_to_end(key)
+                return entry
+        if build_instruction is None:
+            raise KeyError(key)
+        return self.add(key, build_instruction(), *options)
@@ -0,0 +1,269 @@
+"""Pick a Gemini model tier and reply length per request, and replay the picks offline"""
+import argparse
+import json
+import os
+import threading
+import time
+from collections import Counter, deque
+
+# (model name, max_output_tokens), cheapest and fastest first
+DEFAULT_TIERS = (
+    ("gemini-1.5-flash-8b", 256),
+    ("gemini-1.5-flash", 1024),
+    ("gemini-1.5-pro", 2048),
+)
+# Where the apps log decisions when asked to: the user's home, not the
+# directory an app happens to be started from
+DEFAULT_LOG = os.environ.get("GEMINI_ROUTING_LOG") or os.path.join(os.path.expanduser("~"), ".gemini_routing.jsonl")
+
+
+def _short_name(model_name):
+    return model_name[len("models/"):] if model_name.startswith("models/") else model_name
+
+
+class Route:
+    """The model and reply length picked for one request"""
+
+    def __init__(self, model_name, max_output_tokens, tier, reason):
+        self.model_name = model_name
+        self.max_output_tokens = max_output_tokens
+        self.tier = tier
+        self.reason = reason
+
+    @property
+    def generation_config(self):
+        return {"max_output_tokens": self.max_output_tokens}
+
+
+class ModelHealth:
+    """Rolling latency (time to first token) and error rate of one model,
+    over its last window calls within max_age seconds"""
+
+    def __init__(self, window=50, max_age=300.0, clock=time.monotonic):
+        self.calls = deque(maxlen=window)
+        self.max_age = max_age
+        self.clock = clock
+
+    def record(self, latency):
+        """A call that answered after latency seconds, or failed (None)"""
+        self.calls.append((self.clock(), latency))
+
+    def summary(self):
+        # Old calls age out, so a tier left for failing gets tried again
+        cutoff = self.clock() - self.max_age
+        while self.calls and self.calls[0][0] < cutoff:
+            self.calls.popleft()
+        ordered = sorted(latency for _, latency in self.calls if latency is not None)
+        failed = len(self.calls) - len(ordered)
+        return {
+            "latency": ordered[len(ordered) // 2] if ordered else None,
+            "error_rate": failed / len(self.calls) if self.calls else 0.0,
+            "samples": len(self.calls),
+        }
+
+
+def features(message, persona, mode, queue_depth):
+    """What routing looks at: cheap to compute, and all of it is logged"""
+    return {
+        "words": len(message.split()),
+        "chars": len(message),
+        "persona": persona["scope"],
+        "mode": mode,
+        "heavy_mode": mode in persona.get("heavy_modes", ()),
+        "tier_bias": persona.get("tier_bias", 0),
+        "queue_depth": queue_depth,
+    }
+
+
+class ModelRouter:
+    """Route each request to a model tier by its features and the tiers' health
+
+    tiers run from cheapest and fastest to the strongest, each with the
+    max_output_tokens its replies get. A message of up to short_words words
+    goes to the first tier; one of long_words or more, or of heavy_words or
+    more in one of the persona's heavy_modes, to the last; anything else to
+    the middle. A persona's tier_bias moves that up or down.
+
+    Under load (busy_depth or more requests queued) a request may move down
+    to a cheaper tier that is answering faster, by the rolling median time
+    to first token. A tier whose error rate over its last window calls
+    reaches max_error_rate (after min_samples) is left for the nearest
+    healthy one, cheaper first, until its failures are max_age seconds old.
+
+    decide() is a pure function of a request's features and the health
+    snapshot; with a log_path, route() writes both with the pick as a line
+    of JSON, so replay() can run a log through different settings offline.
+    Logging is off by default. Once the log reaches max_log_bytes it is
+    moved to log_path + ".1" (replacing the previous one) and started anew.
+    """
+
+    def __init__(self, tiers=DEFAULT_TIERS, log_path=None, short_words=6, long_words=150, heavy_words=30,
+                 busy_depth=3, max_error_rate=0.5, min_samples=5, window=50, max_age=300.0,
+                 max_log_bytes=5_000_000):
+        self.tiers = [tuple(tier) for tier in tiers]
+        self.log_path = log_path
+        self.max_log_bytes = max_log_bytes
+        self.short_words = short_words
+        self.long_words = long_words
+        self.heavy_words = heavy_words
+        self.busy_depth = busy_depth
+        self.max_error_rate = max_error_rate
+        self.min_samples = min_samples
+        self.health = {name: ModelHealth(window, max_age) for name, _ in self.tiers}
+        self.log = None
+        self.lock = threading.Lock()
+
+        # Counters
+        self.decisions = Counter()
+        self.reasons = Counter()
+        self.log_errors = 0
+        self.log_rotations = 0
+
+    def snapshot(self):
+        """Health summary per tier, as decide() takes it"""
+        return {name: self.health[name].summary() for name, _ in self.tiers}
+
+    def _healthy(self, summary):
+        return summary["samples"] < self.min_samples or summary["error_rate"] < self.max_error_rate
+
+    def decide(self, features, health):
+        """(tier, reason) for a request with these features, given health"""
+        top = len(self.tiers) - 1
+        middle = top // 2
+        if features["words"] <= self.short_words and not features["heavy_mode"]:
+            tier, reason = 0, "short message"
+        elif features["words"] >= self.long_words:
+            tier, reason = top, "long message"
+        elif features["heavy_mode"] and features["words"] >= self.heavy_words:
+            tier, reason = top, "heavy mode"
+        else:
+            tier, reason = middle, "default"
+        if features["tier_bias"]:
+            tier = min(top, max(0, tier + features["tier_bias"]))
+            reason += f", persona bias {features['tier_bias']:+d}"
+
+        def summary(index):
+            return health.get(self.tiers[index][0], {"latency": None, "error_rate": 0.0, "samples": 0})
+
+        if features["queue_depth"] >= self.busy_depth and tier:
+            # Busy: the fastest healthy tier at or below the one wanted
+            timed = [
+                (summary(index)["latency"], index) for index in range(tier + 1)
+                if summary(index)["latency"] is not None and self._healthy(summary(index))
+            ]
+            if timed:
+                fastest = min(timed)[1]
+                if fastest != tier:
+                    tier = fastest
+                    reason += f", busy ({features['queue_depth']} queued): fastest tier"
+
+        if not self._healthy(summary(tier)):
+            # Nearest healthy tier, cheaper ones first
+            for index in sorted(range(len(self.tiers)), key=lambda index: (abs(index - tier), index > tier)):
+                if self._healthy(summary(index)):
+                    reason += f", {self.tiers[tier][0]} failing"
+                    tier = index
+                    break
+        return tier, reason
+
+    def route(self, message, persona, mode, queue_depth):
+        """Pick a Route for one request and log the decision"""
+        request = features(message, persona, mode, queue_depth)
+        health = self.snapshot()
+        tier, reason = self.decide(request, health)
+        model_name, max_output_tokens = self.tiers[tier]
+        self.decisions[model_name] += 1
+        self.reasons[reason.split(",")[0]] += 1
+        self._log({
+            "time": time.time(), "features": request, "health": health,
+            "model": model_name, "max_output_tokens": max_output_tokens, "reason": reason,
+        })
+        return Route(model_name, max_output_tokens, tier, reason)
+
+    def peek(self, message, persona, mode, queue_depth):
+        """The Route route() would pick now, without logging or counting it
+        (e.g. for a message still being typed)"""
+        tier, reason = self.decide(features(message, persona, mode, queue_depth), self.snapshot())
+        model_name, max_output_tokens = self.tiers[tier]
+        return Route(model_name, max_output_tokens, tier, reason)
+
+    def record(self, model_name, latency):
+        """A call to model_name answered after latency seconds, or failed (None)"""
+        health = self.health.get(_short_name(model_name))
+        if health is not None:
+            health.record(latency)
+
+    def _log(self, entry):
+        if not self.log_path:
+            return
+        try:
+            with self.lock:
+                if self.log is None:
+                    # Line-buffered, so a crash keeps every decision made so far
+                    self.log = open(self.log_path, "a", encoding="utf-8", buffering=1)
+                self.log.write(json.dumps(entry) + "\n")
+                if self.max_log_bytes and self.log.tell() >= self.max_log_bytes:
+                    self.log.close()
+                    self.log = None
+                    os.replace(self.log_path, self.log_path + ".1")
+                    self.log_rotations += 1
+        except OSError:
+            # Routing goes on without its log
+            self.log_errors += 1
+
+    def close(self):
+        with self.lock:
+            if self.log is not None:
+                self.log.close()
+                self.log = None
+
+    def stats(self):
+        """Picks per model and reason, and each tier's health"""
+        return {
+            "decisions": dict(self.decisions),
+            "reasons": dict(self.reasons),
+            "health": self.snapshot(),
+            "log_errors": self.log_errors,
+            "log_rotations": self.log_rotations,
+        }
+
+
+def replay(path, router):
+    """Run a decision log through router; returns counts of the logged and
+    replayed picks and how many changed"""
+    logged, replayed, changed, total = Counter(), Counter(), Counter(), 0
+    with open(path, encoding="utf-8") as log:
+        for line in log:
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            tier, _ = router.decide(entry["features"], entry["health"])
+            model_name = router.tiers[tier][0]
+            total += 1
+            logged[entry["model"]] += 1
+            replayed[model_name] += 1
+            if model_name != entry["model"]:
+                changed[f"{entry['model']} -> {model_name}"] += 1
+    return {"decisions": total, "logged": dict(logged), "replayed": dict(replayed), "changed": dict(changed)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a routing log with different settings")
+    parser.add_argument("log", nargs="?", default=DEFAULT_LOG)
+    parser.add_argument("--short-words", type=int, default=6)
+    parser.add_argument("--long-words", type=int, default=150)
+    parser.add_argument("--heavy-words", type=int, default=30)
+    parser.add_argument("--busy-depth", type=int, default=3)
+    parser.add_argument("--max-error-rate", type=float, default=0.5)
+    parser.add_argument("--min-samples", type=int, default=5)
+    args = parser.parse_args()
+
+    router = ModelRouter(
+        short_words=args.short_words, long_words=args.long_words, heavy_words=args.heavy_words,
+        busy_depth=args.busy_depth, max_error_rate=args.max_error_rate, min_samples=args.min_samples,
+    )
+    print(json.dumps(replay(args.log, router), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,13 @@
 import tkinter as tk
 from tkinter import ttk, messagebox, scrolledtext
-import sqlite3
-import google.generativeai as genai
 import os
+import sys
 from datetime import datetime
-import threading
+from worker_pool import QueueFull
+from personas import PERSONAS
+from startup import BackgroundInit, mark, profile_startup
+from search_window import SearchWindow
+from history_view import HistoryView
 import re
 
 class MoochieCatChatApp:
@@ -40,20 +43,94 @@ class MoochieCatChatApp:
         self.main_container = ttk.Frame(master, padding="30 30 30 30", style='Main.TFrame')
         self.main_container.pack(fill=tk.BOTH, expand=True)
 
-        # Database setup
-        self.conn = sqlite3.connect('context_memory.db', check_same_thread=False)
-        self.create_tables()
-
-        # Gemini API setup
-        genai.configure(api_key=os.environ["GEMINI_API_KEY"])
-        self.model = genai.GenerativeModel(model_name="gemini-1.5-flash")
-
-        # Context Management
-        self.context_window = []
-        self.MAX_CONTEXT_LENGTH = 5
+        # Chat core: prompt, context, memory and model logic, shared with the
+        # chat host and the HTTP server. This window only shows its events.
+        # One request in flight at a time keeps replies in order; the core
+        # keeps everything in context_memory.db.
+        self.MODEL_NAME = "gemini-1.5-flash"
+        self.SUMMARY_MODEL = None
+        self.MAX_IN_FLIGHT = 1
+        self.MAX_QUEUED_MESSAGES = 5
+        # Race a second call against one slow to start (costs extra quota)
+        self.HEDGE_SLOW_CALLS = False
+        # Pick a model tier and reply length per message (see model_router.py;
+        # short messages get the smallest model and 256-token replies)
+        self.ROUTE_MODELS = False
+        # Log each pick to ~/.gemini_routing.jsonl for model_router.py replays
+        self.LOG_ROUTING = False
+        # Warm the connection and the prompt up as the user focuses the input or types
+        self.PREWARM_ON_TYPING = True
+        self.services = self.core = self.bridge = self.listener = None
+        master.protocol("WM_DELETE_WINDOW", self.on_close)
+
+        # Full-text search over every stored turn (Ctrl+F or the search button)
+        self.search_window = None
+        master.bind("<Control-f>", self.open_search)
 
         # Create UI components
         self.create_ui()
+        self.update_status("Starting up...")
+
+        # The window paints first: the Gemini SDK import, the database and
+        # the conversation load on a background thread, and messages sent
+        # meanwhile wait for them
+        self.startup = BackgroundInit(
+            master, self._start_services, self._services_ready, self._startup_failed,
+            dispose=lambda built: built[0].close(timeout=2),
+        )
+        self.startup.start()
+
+    def _start_services(self):
+        """Import the SDK and open the chat core (on the startup thread)"""
+        import google.generativeai as genai
+        from chat_core import ChatServices
+        from governor import Governor
+        from model_router import DEFAULT_LOG, ModelRouter
+        mark("sdk")
+
+        genai.configure(api_key=os.environ["GEMINI_API_KEY"])
+        services = ChatServices(
+            'context_memory.db',
+            lambda instruction, name=None, config=None: genai.GenerativeModel(
+                model_name=name or self.MODEL_NAME, system_instruction=instruction, generation_config=config,
+            ),
+            max_in_flight=self.MAX_IN_FLIGHT,
+            max_queue=self.MAX_QUEUED_MESSAGES,
+            summary_model=genai.GenerativeModel(model_name=self.SUMMARY_MODEL) if self.SUMMARY_MODEL else None,
+            # Shared with every other chat app using the key
+            governor=Governor("moochie"),
+            hedge=self.HEDGE_SLOW_CALLS,
+            router=ModelRouter(log_path=DEFAULT_LOG if self.LOG_ROUTING else None) if self.ROUTE_MODELS else None,
+            prewarm=self.PREWARM_ON_TYPING,
+        )
+        mark("services")
+        return services, services.core(PERSONAS["moochie"])
+
+    def _services_ready(self, built):
+        """Hook the chat core up to the window (on the Tk thread)"""
+        from async_engine import TkBridge
+        from chat_core import ViewListener
+
+        self.services, self.core = built
+        # Core events come back to Tk through the bridge's single after() pump
+        self.bridge = TkBridge(self.master)
+        self.listener = ViewListener(
+            self.bridge,
+            user_message=self._display_user_message,
+            status=self.update_status,
+            reply=self._display_ai_response,
+            reply_start=self._begin_ai_response,
+            reply_text=self._append_ai_response,
+            reply_end=self._end_ai_response,
+            error=self._display_error,
+        )
+        self.update_status("Moochie Cat is Ready to Purr!")
+        # A message usually follows soon after startup
+        self._prewarm(focus=True)
+
+    def _startup_failed(self, error):
+        self._display_error(f"Could not start the chat: {error}")
+        self.update_status("Startup failed")
 
     def _configure_styles(self):
         """Configure all custom styles"""
@@ -98,19 +175,6 @@ class MoochieCatChatApp:
             padding=(5, 5)
         )
 
-    def create_tables(self):
-        """Create SQLite tables for context memory"""
-        cursor = self.conn.cursor()
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS context_memory (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                key TEXT UNIQUE,
-                value TEXT,
-                timestamp DATETIME
-            )
-        ''')
-        self.conn.commit()
-
     def create_ui(self):
         # Chat History with modern styling
         self.chat_history = None
@@ -129,6 +193,10 @@ class MoochieCatChatApp:
         )
         self.chat_history.pack(fill=tk.BOTH, expand=True, pady=(0, 20))
 
+        # Only the newest messages stay in the widget; older ones page back in
+        # when scrolled to the top
+        self.history = HistoryView(self.chat_history)
+
         # Configure chat tags
         self.chat_history.tag_configure('user',
             foreground="#2C3E50",
@@ -177,6 +245,7 @@ class MoochieCatChatApp:
         self.input_entry.insert(0, "Meow to Moochie Cat...")
         self.input_entry.bind("<FocusIn>", self.on_entry_click)
         self.input_entry.bind("<FocusOut>", self.on_focusout)
+        self.input_entry.bind("<Key>", self._prewarm)
 
         # Send Button with pastel styling
         send_button = ttk.Button(
@@ -187,6 +256,15 @@ class MoochieCatChatApp:
         )
         send_button.pack(side=tk.LEFT)
 
+        # Search Button
+        search_button = ttk.Button(
+            input_frame, 
+            text="Search", 
+            command=self.open_search,
+            style='TButton'
+        )
+        search_button.pack(side=tk.LEFT, padx=(10, 0))
+
         # Status Bar with pastel design
         self.status_var = tk.StringVar(value="Moochie Cat is Ready to Purr!")
         status_bar = ttk.Label(
@@ -200,15 +278,12 @@ class MoochieCatChatApp:
         )
         status_bar.pack(fill=tk.X, pady=(10, 0))
 
-        # Context Management
-        self.context_window = []
-        self.MAX_CONTEXT_LENGTH = 5
-
     def on_entry_click(self, event):
         """Remove placeholder text when entry is clicked"""
         if self.input_entry.get() == "Meow to Moochie Cat...":
             self.input_entry.delete(0, tk.END)
             self.input_entry.config(foreground='black')
+        self._prewarm(focus=True)
 
     def on_focusout(self, event):
         """Restore placeholder if no text is entered"""
@@ -216,99 +291,81 @@ class MoochieCatChatApp:
             self.input_entry.insert(0, "Meow to Moochie Cat...")
             self.input_entry.config(foreground='gray')
 
+    def _prewarm(self, event=None, focus=False):
+        """Get the chat ready for the message being typed (see ChatCore.prewarm)"""
+        if self.core is not None:
+            self.core.prewarm(self.context_var.get(), self.input_entry.get(), focus)
+
     def send_message(self, event=None):
         user_message = self.input_entry.get().strip()
         if user_message and user_message != "Meow to Moochie Cat...":
-            # Thread for non-blocking AI response
-            threading.Thread(target=self._process_message, args=(user_message,), daemon=True).start()
-
-    def _process_message(self, user_message):
-        # Update UI in main thread
-        self.master.after(0, self._display_user_message, user_message)
-        
-        # Status update
-        self.master.after(0, self.update_status, "Generating response...")
-        
-        # Build contextual prompt
-        contextual_prompt = self.build_contextual_prompt(user_message)
-        
+            if not self.startup.done:
+                # Sent once the chat core is up
+                self.startup.when_ready(self._send, user_message, self.context_var.get())
+                self.input_entry.delete(0, tk.END)
+                self.update_status(f"Starting up | queued: {self.startup.queued}")
+            elif self.core is not None and self._send(user_message, self.context_var.get()):
+                self.input_entry.delete(0, tk.END)
+
+    def _send(self, user_message, mode):
+        """Hand a message to the core; False when its queue is full"""
+        # Async engine for non-blocking AI response
         try:
-            # Generate AI response
-            response = self.model.generate_content(contextual_prompt)
-            
-            # Display response in main thread
-            self.master.after(0, self._display_ai_response, response.text)
-            
-            # Update context
-            self.master.after(0, self._update_context, user_message, response.text)
-            
-            # Clear status
-            self.master.after(0, self.update_status, "Response received")
-        
-        except Exception as e:
-            # Display error
-            self.master.after(0, self._display_error, str(e))
+            self.core.send(user_message, mode, self.listener)
+        except QueueFull:
+            self.update_status(f"Busy | queued: {self.core.queue_depth}, try again shortly")
+            return False
+        if self.core.queue_depth:
+            self.update_status(f"queued: {self.core.queue_depth}")
+        return True
 
     def _display_user_message(self, user_message):
-        self.chat_history.insert(tk.END, f"You: {user_message}\n", "user")
-        self.input_entry.delete(0, tk.END)
-        self.chat_history.see(tk.END)
+        self.history.add(f"You: {user_message}\n", "user")
 
     def _display_ai_response(self, response_text):
-        self.chat_history.insert(tk.END, f"Moochie Cat: {response_text}\n\n", "ai")
-        self.chat_history.see(tk.END)
+        self.history.add(f"Moochie Cat: {response_text}\n\n", "ai")
 
-    def _display_error(self, error_message):
-        self.chat_history.insert(tk.END, f"Error: {error_message}\n\n", "system")
-        self.chat_history.see(tk.END)
+    def _begin_ai_response(self):
+        self.history.start("Moochie Cat: ", "ai")
 
-    def _update_context(self, user_message, response_text):
-        context_entry = f"User said: {user_message}\nMoochie Cat responded: {response_text}"
-        self.context_window.append(context_entry)
-        
-        if len(self.context_window) > self.MAX_CONTEXT_LENGTH:
-            self.context_window.pop(0)
+    def _append_ai_response(self, text):
+        self.history.extend(text)
+
+    def _end_ai_response(self):
+        self.history.extend("\n\n")
+
+    def _display_error(self, error_message):
+        self.history.add(f"Error: {error_message}\n\n", "system")
+
+    def open_search(self, event=None):
+        """Open the history search window, or raise it if it is already open"""
+        if self.services is None:
+            return self.startup.when_ready(self.open_search)
+        if self.search_window is not None and self.search_window.exists():
+            self.search_window.lift()
+            return
+        self.search_window = SearchWindow(
+            self.master, self.services.search_index, self.services.pool.submit, self.bridge,
+            scope=self.core.scope,
+            font=self.CHAT_FONT, bg=self.BG_COLOR, fg=self.TEXT_COLOR, accent=self.DARK_PINK,
+        )
 
     def update_status(self, message):
         """Update status bar"""
         self.status_var.set(message)
 
-    def build_contextual_prompt(self, user_message):
-        """Enhanced contextual prompt building with Moochie Cat personality"""
-        context_str = "\n".join(self.context_window)
-        
-        # Retrieve context based on selected context type
-        context_type = self.context_var.get()
-        context_mapping = {
-            "Playful": "Respond with a playful, kitten-like enthusiasm.",
-            "Cuddly": "Give warm, comforting responses like a cute cat.",
-            "Sassy": "Respond with a touch of cat-like sass and attitude.",
-            "Moochie Mode": "Respond as Moochie Cat, with a mix of cute and clever responses."
-        }
-        
-        contextual_prompt = f"""
-You are Moochie Cat, an adorable AI companion with a charming personality.
-Context Type: {context_type}
-Special Instructions: {context_mapping.get(context_type, '')}
-
-Recent Conversation Context:
-{context_str}
-
-User's Latest Message: {user_message}
-
-Craft a response that:
-1. Directly addresses the user's message
-2. Reflects the Moochie Cat personality
-3. Adds a touch of feline charm
-4. Maintains conversation flow
-"""
-        return contextual_prompt
-
-    def __del__(self):
-        """Close database connection"""
-        self.conn.close()
+    def on_close(self):
+        """Cancel outstanding requests, commit queued writes and close the window"""
+        if self.services is not None:
+            self.services.close(timeout=2)
+            self.bridge.stop()
+        else:
+            self.startup.cancel()
+        self.master.destroy()
 
 def main():
+    if "--profile-startup" in sys.argv:
+        return profile_startup(__file__, MoochieCatChatApp)
     root = tk.Tk()
     app = MoochieCatChatApp(root)
     root.mainloop()
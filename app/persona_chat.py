@@ -0,0 +1,233 @@
+"""One persona's chat, as a tab on a ChatHost's shared engine and store"""
+import tkinter as tk
+from tkinter import ttk, scrolledtext
+from worker_pool import QueueFull
+from chat_core import ViewListener
+from search_window import SearchWindow
+from history_view import HistoryView
+
+
+class PersonaChat:
+    """One persona's chat view over a ChatCore from the host's ChatServices
+
+    Everything expensive is the host's and shared (event loop, db worker,
+    store, models, caches); the core owns the conversation and runs its
+    requests in the persona's own lane, so replies stay in order without
+    holding up other personas. The tab only shows the core's events.
+    """
+
+    def __init__(self, parent, key, persona, host):
+        self.key = key
+        self.persona = persona
+        self.host = host
+        self.bridge = host.bridge
+        self.colors = persona["colors"]
+        self.fonts = persona["fonts"]
+        self.core = host.services.core(persona)
+        self.search_window = None
+
+        self.frame = ttk.Frame(parent, padding="20 20 20 20", style=self._style("Main.TFrame"))
+        self._configure_styles()
+        self.create_ui()
+
+        # Core events come back to Tk through the host's bridge
+        self.listener = ViewListener(
+            self.bridge,
+            user_message=self._display_user_message,
+            status=self.update_status,
+            reply=self._display_ai_response,
+            reply_start=self._begin_ai_response,
+            reply_text=self._append_ai_response,
+            reply_end=self._end_ai_response,
+            error=self._display_error,
+        )
+        # The tab was opened to be typed in
+        self._prewarm(focus=True)
+
+    def _style(self, name):
+        """Per-persona ttk style name (styles are global to the Tk root)"""
+        return f"{self.key}.{name}"
+
+    def _configure_styles(self):
+        """Frame, button and entry styles in the persona's colors"""
+        style = self.host.style
+        style.configure(self._style('Main.TFrame'), background=self.colors["background"])
+        style.configure(self._style('Input.TFrame'), background=self.colors["background"])
+        style.configure(self._style('Send.TButton'),
+            font=self.fonts["system"],
+            background=self.colors["accent"],
+            foreground="white",
+            padding=(15, 8)
+        )
+        style.map(self._style('Send.TButton'),
+            background=[('active', self.colors["active"])],
+            foreground=[('active', 'white')]
+        )
+        style.configure(self._style('Modern.TEntry'),
+            fieldbackground=self.colors["field"],
+            foreground=self.colors["text"],
+            padding=(10, 5)
+        )
+
+    def create_ui(self):
+        # Chat History
+        self.chat_history = scrolledtext.ScrolledText(
+            self.frame,
+            wrap=tk.WORD,
+            width=70,
+            height=20,
+            font=self.fonts["chat"],
+            bg=self.colors["background"],
+            fg=self.colors["text"],
+            borderwidth=1,
+            relief="solid",
+            padx=15,
+            pady=15,
+            insertbackground=self.colors["accent"]
+        )
+        self.chat_history.pack(fill=tk.BOTH, expand=True, pady=(0, 20))
+
+        # Only the newest messages stay in the widget; older ones page back in
+        # when scrolled to the top
+        self.history = HistoryView(self.chat_history)
+
+        # Configure chat tags
+        family, size = self.fonts["system"][:2]
+        self.chat_history.tag_configure('user',
+            foreground=self.colors["user"],
+            font=(family, size, 'bold'),
+            spacing1=10,
+            spacing3=5
+        )
+        self.chat_history.tag_configure('ai',
+            foreground=self.colors["ai"],
+            font=(family, size),
+            spacing1=5,
+            spacing3=10
+        )
+        self.chat_history.tag_configure('system',
+            foreground=self.colors["system"],
+            font=(family, size - 2, 'italic'),
+            spacing1=5,
+            spacing3=5
+        )
+
+        # Input Frame
+        input_frame = ttk.Frame(self.frame, style=self._style('Input.TFrame'))
+        input_frame.pack(fill=tk.X, pady=(0, 15))
+
+        # Mode Dropdown
+        self.context_var = tk.StringVar(value=self.persona["default_mode"])
+        context_dropdown = ttk.Combobox(
+            input_frame,
+            textvariable=self.context_var,
+            values=list(self.persona["modes"]),
+            width=15,
+            font=self.fonts["system"]
+        )
+        context_dropdown.pack(side=tk.LEFT, padx=(0, 10))
+
+        # Input Entry with placeholder
+        self.input_entry = ttk.Entry(
+            input_frame,
+            width=50,
+            font=self.fonts["system"],
+            style=self._style('Modern.TEntry')
+        )
+        self.input_entry.pack(side=tk.LEFT, expand=True, fill=tk.X, padx=(0, 10))
+        self.input_entry.bind("<Return>", self.send_message)
+        self.input_entry.insert(0, self.persona["placeholder"])
+        self.input_entry.bind("<FocusIn>", self.on_entry_click)
+        self.input_entry.bind("<FocusOut>", self.on_focusout)
+        self.input_entry.bind("<Key>", self._prewarm)
+
+        # Send and Search Buttons
+        send_button = ttk.Button(
+            input_frame,
+            text=self.persona["send_text"],
+            command=self.send_message,
+            style=self._style('Send.TButton')
+        )
+        send_button.pack(side=tk.LEFT)
+        search_button = ttk.Button(
+            input_frame,
+            text=self.persona["search_text"],
+            command=self.open_search,
+            style=self._style('Send.TButton')
+        )
+        search_button.pack(side=tk.LEFT, padx=(10, 0))
+
+        # Status Bar
+        self.status_var = tk.StringVar(value=self.persona["ready"])
+        status_bar = ttk.Label(
+            self.frame,
+            textvariable=self.status_var,
+            relief=tk.SUNKEN,
+            anchor=tk.W,
+            font=self.fonts["status"],
+            background=self.colors["status_bg"],
+            foreground=self.colors["status_fg"]
+        )
+        status_bar.pack(fill=tk.X, pady=(10, 0))
+
+    def on_entry_click(self, event):
+        """Remove placeholder text when entry is clicked"""
+        if self.input_entry.get() == self.persona["placeholder"]:
+            self.input_entry.delete(0, tk.END)
+            self.input_entry.config(foreground=self.colors["text"])
+        self._prewarm(focus=True)
+
+    def on_focusout(self, event):
+        """Restore placeholder if no text is entered"""
+        if self.input_entry.get() == "":
+            self.input_entry.insert(0, self.persona["placeholder"])
+            self.input_entry.config(foreground='gray')
+
+    def _prewarm(self, event=None, focus=False):
+        """Get the chat ready for the message being typed (see ChatCore.prewarm)"""
+        self.core.prewarm(self.context_var.get(), self.input_entry.get(), focus)
+
+    def send_message(self, event=None):
+        user_message = self.input_entry.get().strip()
+        if user_message and user_message != self.persona["placeholder"]:
+            try:
+                self.core.send(user_message, self.context_var.get(), self.listener)
+            except QueueFull:
+                self.update_status(f"Busy | queued: {self.host.services.engine.queue_depth}, try again shortly")
+                return
+            self.input_entry.delete(0, tk.END)
+            if self.core.queue_depth:
+                self.update_status(f"queued: {self.core.queue_depth}")
+
+    def _display_user_message(self, user_message):
+        self.history.add(f"You: {user_message}\n", "user")
+
+    def _display_ai_response(self, response_text):
+        self.history.add(f"{self.persona['name']}: {response_text}\n\n", "ai")
+
+    def _begin_ai_response(self):
+        self.history.start(f"{self.persona['name']}: ", "ai")
+
+    def _append_ai_response(self, text):
+        self.history.extend(text)
+
+    def _end_ai_response(self):
+        self.history.extend("\n\n")
+
+    def _display_error(self, error_message):
+        self.history.add(f"System Error: {error_message}\n\n", "system")
+
+    def open_search(self, event=None):
+        """Open this persona's history search window, or raise it if it is already open"""
+        if self.search_window is not None and self.search_window.exists():
+            self.search_window.lift()
+            return
+        self.search_window = SearchWindow(
+            self.frame.winfo_toplevel(), self.host.services.search_index, self.host.services.pool.submit,
+            self.bridge, scope=self.core.scope, font=self.fonts["chat"], bg=self.colors["background"],
+            fg=self.colors["text"], accent=self.colors["accent"],
+        )
+
+    def update_status(self, message):
+        """Update status bar"""
+        self.status_var.set(message)
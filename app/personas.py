@@ -0,0 +1,216 @@
+"""Persona registry: everything that differs between the chat apps, as data"""
+
+# Each persona's instruction is a template filled with the interaction mode
+# and that mode's special instruction. scope namespaces everything the
+# persona stores (turns, summary, long-term memory), so personas can share
+# one database; it matches the class name the standalone app stores under.
+PERSONAS = {
+    "kaito": {
+        "name": "Kaito",
+        "title": "N25 Kaito | Brutal Honesty",
+        "scope": "KaitoChatApp",
+        "app": ("kaito-chat-app-fixed.py", "KaitoChatApp"),
+        "instruction": """You are N25 Kaito, an entity from the Empty Sekai who embodies brutal honesty and unfiltered truth.
+Interaction Mode: {mode}
+Special Instructions: {instructions}
+
+Core Personality Traits:
+- Always speak with harsh, cold honesty
+- Do not sugarcoat anything
+- Prioritize truth over feelings
+- Encourage growth through direct criticism
+- Maintain an emotionally detached demeanor
+
+Respond with:
+1. Absolute directness
+2. No emotional padding
+3. Harsh but potentially constructive insights
+4. A tone that suggests you don't care about being liked
+""",
+        "modes": {
+            "Harsh Critique": "Respond with maximum criticism and zero sugar-coating.",
+            "Tough Love": "Provide harsh but constructive feedback.",
+            "Raw Honesty": "Be brutally direct, hold nothing back.",
+            "Direct Mode": "Give unfiltered, straightforward advice.",
+        },
+        "default_mode": "Direct Mode",
+        # Modes whose longer messages go to the strongest model tier
+        "heavy_modes": ("Harsh Critique", "Tough Love"),
+        "placeholder": "Speak. No Filter.",
+        "ready": "System Online | N25 Kaito Initialized",
+        "send_text": "SEND",
+        "search_text": "SEARCH",
+        "context_entry": "User said: {user}\nKaito responded: {reply}",
+        "context_heading": "Recent Context",
+        "latest_label": "User's Latest Message",
+        "colors": {
+            "background": "#0F1A2A",
+            "text": "#E0E0E0",
+            "accent": "#4A90E2",
+            "active": "#3A7CA5",
+            "field": "#34495E",
+            "status_bg": "#1A2C4F",
+            "status_fg": "#4A90E2",
+            "user": "#4A90E2",
+            "ai": "#E0E0E0",
+            "system": "#FF4500",
+        },
+        "fonts": {
+            "system": ("Roboto", 12),
+            "chat": ("Consolas", 11),
+            "status": ("Consolas", 9),
+        },
+    },
+    "miku": {
+        "name": "Miku",
+        "title": "N25 Miku | Nightcord Reflections",
+        "scope": "MikuChatApp",
+        "app": ("miku-chat-app (1).py", "MikuChatApp"),
+        "instruction": """You are N25 Miku from the virtual band Nightcord de., representing a deep, introspective persona.
+Interaction Mode: {mode}
+Special Instructions: {instructions}
+
+Core Personality Traits:
+- Speak with a calm, reflective tone
+- Prioritize emotional understanding
+- Offer nuanced, compassionate insights
+- Maintain a sense of quiet empathy
+- Encourage self-exploration and emotional growth
+
+Respond with:
+1. Deep emotional understanding
+2. Gentle, thoughtful perspectives
+3. A tone that suggests quiet support
+4. Insights that encourage self-reflection
+""",
+        "modes": {
+            "Silent Empathy": "Listen deeply, respond with profound understanding.",
+            "Emotional Depth": "Explore the underlying emotions and unspoken feelings.",
+            "Introspective Mode": "Encourage self-reflection and emotional awareness.",
+            "Quiet Reflection": "Provide gentle, thoughtful insights.",
+        },
+        "default_mode": "Quiet Reflection",
+        "heavy_modes": ("Emotional Depth",),
+        "placeholder": "Share your thoughts...",
+        "ready": "N25 Miku | Nightcord Atmosphere Initialized",
+        "send_text": "SEND",
+        "search_text": "SEARCH",
+        "context_entry": "User's expression: {user}\nMiku's reflection: {reply}",
+        "context_heading": "Connection Context",
+        "latest_label": "User's Latest Expression",
+        "colors": {
+            "background": "#0F1A2A",
+            "text": "#D0D0D0",
+            "accent": "#3A5A7A",
+            "active": "#607D8B",
+            "field": "#1A2B3C",
+            "status_bg": "#1A2B3C",
+            "status_fg": "#3A5A7A",
+            "user": "#4A6C8A",
+            "ai": "#D0D0D0",
+            "system": "#607D8B",
+        },
+        "fonts": {
+            "system": ("Inter", 11),
+            "chat": ("Source Code Pro", 10),
+            "status": ("Source Code Pro", 9),
+        },
+    },
+    "moochie": {
+        "name": "Moochie Cat",
+        "title": "✨ Moochie Cat AI",
+        "scope": "MoochieCatChatApp",
+        "app": ("moochiecatchatapp copy.py", "MoochieCatChatApp"),
+        "instruction": """You are Moochie Cat, an adorable AI companion with a charming personality.
+Context Type: {mode}
+Special Instructions: {instructions}
+
+Craft a response that:
+1. Directly addresses the user's message
+2. Reflects the Moochie Cat personality
+3. Adds a touch of feline charm
+4. Maintains conversation flow
+""",
+        "modes": {
+            "Playful": "Respond with a playful, kitten-like enthusiasm.",
+            "Cuddly": "Give warm, comforting responses like a cute cat.",
+            "Sassy": "Respond with a touch of cat-like sass and attitude.",
+            "Moochie Mode": "Respond as Moochie Cat, with a mix of cute and clever responses.",
+        },
+        "default_mode": "Moochie Mode",
+        # Short, playful replies: one model tier down from the usual
+        "tier_bias": -1,
+        "placeholder": "Meow to Moochie Cat...",
+        "ready": "Moochie Cat is Ready to Purr!",
+        "send_text": "Send",
+        "search_text": "Search",
+        "context_entry": "User said: {user}\nMoochie Cat responded: {reply}",
+        "context_heading": "Recent Conversation Context",
+        "latest_label": "User's Latest Message",
+        "colors": {
+            "background": "#FFFFFF",
+            "text": "#2C3E50",
+            "accent": "#FF69B4",
+            "active": "#FF1493",
+            "field": "#FFF0F5",
+            "status_bg": "#FFB6C1",
+            "status_fg": "#2C3E50",
+            "user": "#2C3E50",
+            "ai": "#FF69B4",
+            "system": "#95A5A6",
+        },
+        "fonts": {
+            "system": ("SF Pro Text", 12),
+            "chat": ("SF Mono", 11),
+            "status": ("SF Pro Text", 9),
+        },
+    },
+    "assistant": {
+        "name": "Gemini",
+        "title": "Gemini AI Companion",
+        "scope": "EnhancedContextAwareChatApp",
+        "app": ("normal chat.py", "EnhancedContextAwareChatApp"),
+        "instruction": """Context Type: {mode}
+Special Instructions: {instructions}
+
+Please craft a response that:
+1. Directly addresses the user's message
+2. Reflects the selected context type
+3. Maintains conversation coherence
+""",
+        "modes": {
+            "Professional": "Maintain a formal, professional tone.",
+            "Casual": "Use a friendly, conversational tone.",
+            "Creative": "Respond with creativity and imagination.",
+            "Default Context": "",
+        },
+        "default_mode": "Default Context",
+        "heavy_modes": ("Creative",),
+        # Always a fresh reply in these modes
+        "uncached_modes": ["Creative"],
+        "placeholder": "Type your message here...",
+        "ready": "Ready",
+        "send_text": "Send",
+        "search_text": "Search",
+        "context_entry": "User said: {user}\nAI responded: {reply}",
+        "context_heading": "Recent Conversation Context",
+        "latest_label": "User's Latest Message",
+        "colors": {
+            "background": "#FFFFFF",
+            "text": "#333333",
+            "accent": "#4A90E2",
+            "active": "#357ABD",
+            "field": "#FFFFFF",
+            "status_bg": "#F0F4F8",
+            "status_fg": "#333333",
+            "user": "#2C3E50",
+            "ai": "#2980B9",
+            "system": "#7F8C8D",
+        },
+        "fonts": {
+            "system": ("Segoe UI", 10),
+            "chat": ("Consolas", 10),
+            "status": ("Segoe UI", 9),
+        },
+    },
+}
@@ -0,0 +1,112 @@
+"""Warm the model connection while the user is typing, and measure what it saves"""
+import threading
+import time
+
+# How a model call found the connection
+COLD, WARMED, HOT = "cold", "warmed", "hot"
+
+
+class Prewarmer:
+    """Open or refresh the connection to the model before a message is sent
+
+    The first call after startup, or after idle_gap seconds without model
+    traffic, pays for DNS, TLS and channel setup on top of generation
+    (idle connections are closed by the server or the client pool). warm()
+    makes a countTokens call for what the next message will reuse, which
+    opens the connection and returns that part's exact token count in one
+    round trip. countTokens has its own quota, so warm-ups do not go through
+    the ModelGuard.
+
+    due() says whether a warm-up is worth making: while typing, once
+    idle_gap has passed since the last traffic; on focus, once focus_gap has.
+
+    Every model call is classed by what came before it within idle_gap:
+    nothing (cold), a warm-up (warmed) or another call (hot), and the time
+    to first token of the cold and warmed ones is kept, so stats() shows
+    the first-message latency the warm-ups save.
+    """
+
+    def __init__(self, enabled=True, idle_gap=60.0, focus_gap=5.0, clock=time.monotonic):
+        self.enabled = enabled
+        self.idle_gap = idle_gap
+        self.focus_gap = focus_gap
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.last_traffic = None
+        self.last_was_warm = False
+        self.warming = 0
+
+        # Counters
+        self.warms = 0
+        self.warm_failures = 0
+        self.total_warm_time = 0.0
+        self.calls = {COLD: 0, WARMED: 0, HOT: 0}
+        self.first_token_totals = {COLD: 0.0, WARMED: 0.0, HOT: 0.0}
+
+    def _idle(self):
+        return None if self.last_traffic is None else self.clock() - self.last_traffic
+
+    def due(self, focus=False):
+        """Whether to warm now: typing after idle_gap, or focus after focus_gap"""
+        with self.lock:
+            if not self.enabled or self.warming:
+                return False
+            idle = self._idle()
+            return idle is None or idle >= (min(self.focus_gap, self.idle_gap) if focus else self.idle_gap)
+
+    async def warm(self, model, contents):
+        """countTokens for contents on model; returns the count, or None if it failed"""
+        with self.lock:
+            self.warming += 1
+        started = time.perf_counter()
+        try:
+            result = await model.count_tokens_async(contents)
+        except Exception:
+            # A failed warm-up costs nothing but the try; the message connects as usual
+            with self.lock:
+                self.warm_failures += 1
+            return None
+        finally:
+            with self.lock:
+                self.warming -= 1
+        with self.lock:
+            self.warms += 1
+            self.total_warm_time += time.perf_counter() - started
+            self.last_traffic = self.clock()
+            self.last_was_warm = True
+        return result.total_tokens
+
+    def call_started(self):
+        """Note a model call starting; returns how it found the connection"""
+        with self.lock:
+            idle = self._idle()
+            if idle is None or idle >= self.idle_gap:
+                warmth = COLD
+            else:
+                warmth = WARMED if self.last_was_warm else HOT
+            self.last_traffic = self.clock()
+            self.last_was_warm = False
+            return warmth
+
+    def first_token(self, warmth, latency):
+        """Record a call's time to first token (or to its whole reply)"""
+        with self.lock:
+            self.calls[warmth] += 1
+            self.first_token_totals[warmth] += latency
+
+    def _average(self, warmth):
+        return self.first_token_totals[warmth] / self.calls[warmth] if self.calls[warmth] else None
+
+    def stats(self):
+        """Warm-ups made, and first-token latency of cold, warmed and hot calls"""
+        with self.lock:
+            cold, warmed = self._average(COLD), self._average(WARMED)
+            return {
+                "enabled": self.enabled,
+                "warms": self.warms,
+                "warm_failures": self.warm_failures,
+                "avg_warm_time": self.total_warm_time / self.warms if self.warms else 0.0,
+                "calls": dict(self.calls),
+                "avg_first_token": {warmth: self._average(warmth) for warmth in self.calls},
+                "saved_per_warmed_call": cold - warmed if cold is not None and warmed is not None else None,
+            }
@@ -0,0 +1,258 @@
+"""Rate limits, retries and a circuit breaker around model calls"""
+import asyncio
+import math
+import random
+import time
+
+# Quota, timeout and transient server errors; anything else is the request's fault
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+
+
+class CircuitOpen(Exception):
+    """Raised instead of calling the model while the breaker is open"""
+
+    def __init__(self, remaining):
+        super().__init__(f"Model unavailable after repeated errors, trying again in {math.ceil(remaining)}s")
+        self.remaining = remaining
+
+
+def is_retryable(exc):
+    """Whether exc is a quota, transient server or connection error
+
+    GeminiError (the REST client) carries the HTTP status as status and the
+    SDK's google.api_core errors carry it as code.
+    """
+    status = getattr(exc, "status", None)
+    if not isinstance(status, int):
+        status = getattr(exc, "code", None)
+    if isinstance(status, int):
+        return status in RETRYABLE_STATUS
+    return isinstance(exc, (ConnectionError, TimeoutError, asyncio.IncompleteReadError))
+
+
+class TokenBucket:
+    """per_minute units a minute, in bursts of up to capacity
+
+    take() may drive the level below zero (a reply longer than expected);
+    later callers then wait for it to refill.
+    """
+
+    def __init__(self, per_minute, capacity=None, clock=time.monotonic):
+        self.rate = per_minute / 60
+        self.capacity = capacity or per_minute
+        self.clock = clock
+        self.level = self.capacity
+        self.updated = clock()
+
+    def _refill(self):
+        now = self.clock()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount):
+        """Seconds until amount can be taken (amounts past capacity wait for a full bucket)"""
+        self._refill()
+        return max(0.0, (min(amount, self.capacity) - self.level) / self.rate)
+
+    def take(self, amount):
+        self._refill()
+        self.level -= amount
+
+
+class ModelGuard:
+    """Every model call goes through call(): throttled, retried, and cut off
+    while the model keeps failing
+
+    Two token buckets hold requests to requests_per_minute and prompt plus
+    reply tokens to tokens_per_minute (None turns a limit off); a call
+    waits until both have room. Retryable errors (429, 5xx, timeouts,
+    dropped connections) are retried up to max_retries times with
+    exponential backoff from base_delay, capped at max_delay, half of each
+    delay random so clients that failed together do not retry together.
+    Other errors are raised at once.
+
+    failure_threshold retryable errors in a row open the breaker: for
+    cooldown seconds calls fail fast with CircuitOpen instead of adding to
+    the pressure. Then one trial call goes through; success closes the
+    breaker, failure opens it for another cooldown.
+
+    With a governor (a Governor shared with the other apps on the machine)
+    the limits are the governor's instead: each attempt waits its turn in
+    the shared line and holds one of its slots until it returns.
+
+    Everything runs on the engine's loop thread.
+    """
+
+    def __init__(self, requests_per_minute=15, tokens_per_minute=1_000_000, max_retries=4, base_delay=1.0,
+                 max_delay=30.0, failure_threshold=5, cooldown=30.0, clock=time.monotonic, governor=None):
+        self.governor = governor
+        local = governor is None
+        self.requests = TokenBucket(requests_per_minute, clock=clock) if local and requests_per_minute else None
+        self.tokens = TokenBucket(tokens_per_minute, clock=clock) if local and tokens_per_minute else None
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.clock = clock
+
+        # Breaker state
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self.trial = False
+
+        # Counters
+        self.calls = 0
+        self.retries = 0
+        self.gave_up = 0
+        self.failures = 0
+        self.throttled = 0
+        self.total_throttle_wait = 0.0
+        self.max_throttle_wait = 0.0
+        self.breaker_opens = 0
+        self.fast_failures = 0
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        return "half-open" if self.cooldown_remaining() <= 0 else "open"
+
+    def cooldown_remaining(self):
+        """Seconds until the open breaker lets a trial call through (0 when closed)"""
+        if self.opened_at is None:
+            return 0.0
+        return max(0.0, self.cooldown - (self.clock() - self.opened_at))
+
+    def _check_breaker(self):
+        if self.opened_at is None:
+            return
+        remaining = self.cooldown_remaining()
+        if remaining > 0 or self.trial:
+            self.fast_failures += 1
+            raise CircuitOpen(remaining)
+        self.trial = True
+
+    def _succeeded(self):
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self.trial = False
+
+    def _failed(self):
+        self.failures += 1
+        self.consecutive_failures += 1
+        if self.trial or self.consecutive_failures >= self.failure_threshold:
+            self.opened_at = self.clock()
+            self.trial = False
+            self.breaker_opens += 1
+
+    async def _throttle(self, tokens, notify):
+        """Wait until both buckets have room, then take a request and tokens;
+        returns the governor ticket to release, if any"""
+        if self.governor is not None:
+            ticket, waited = await self.governor.acquire(tokens, notify)
+            self._waited(waited)
+            return ticket
+        waited = 0.0
+        while True:
+            wait = max(
+                self.requests.wait_time(1) if self.requests else 0.0,
+                self.tokens.wait_time(tokens) if self.tokens else 0.0,
+            )
+            if wait <= 0:
+                break
+            notify(f"Rate limited, waiting {wait:.1f}s")
+            await asyncio.sleep(wait)
+            waited += wait
+        if self.requests:
+            self.requests.take(1)
+        if self.tokens:
+            self.tokens.take(tokens)
+        self._waited(waited)
+
+    def _waited(self, waited):
+        if waited:
+            self.throttled += 1
+            self.total_throttle_wait += waited
+            self.max_throttle_wait = max(self.max_throttle_wait, waited)
+
+    def charge(self, tokens):
+        """Count tokens spent after the fact (the reply) against the token limit"""
+        if self.governor is not None:
+            asyncio.get_running_loop().run_in_executor(None, self.governor.charge, tokens)
+        elif self.tokens:
+            self.tokens.take(tokens)
+
+    def _release(self, ticket):
+        if ticket is not None:
+            asyncio.get_running_loop().run_in_executor(None, self.governor.release, ticket)
+
+    def backoff(self, attempt):
+        """Delay before retry number attempt (from 1), half of it random"""
+        delay = min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    async def call(self, attempt_fn, tokens=0, notify=lambda text: None, can_retry=lambda: True):
+        """Await attempt_fn(attempt) under the limits, retrying retryable errors
+
+        notify(text) hears about throttling and retries (for a status bar);
+        can_retry() is asked before each retry, e.g. whether a stream has
+        already shown text.
+        """
+        self.calls += 1
+        attempt = 0
+        while True:
+            self._check_breaker()
+            ticket = await self._throttle(tokens, notify)
+            try:
+                try:
+                    result = await attempt_fn(attempt)
+                finally:
+                    self._release(ticket)
+            except asyncio.CancelledError:
+                self.trial = False
+                raise
+            except Exception as e:
+                if not is_retryable(e):
+                    self.trial = False
+                    raise
+                self._failed()
+                if attempt >= self.max_retries or self.opened_at is not None or not can_retry():
+                    self.gave_up += 1
+                    raise
+                attempt += 1
+                self.retries += 1
+                delay = self.backoff(attempt)
+                notify(f"{_describe(e)}, retry {attempt}/{self.max_retries} in {delay:.1f}s")
+                await asyncio.sleep(delay)
+                continue
+            self._succeeded()
+            return result
+
+    def stats(self):
+        """Retries, throttle waits and breaker state"""
+        return {
+            "state": self.state,
+            "cooldown_remaining": self.cooldown_remaining(),
+            "calls": self.calls,
+            "retries": self.retries,
+            "gave_up": self.gave_up,
+            "failures": self.failures,
+            "throttled": self.throttled,
+            "total_throttle_wait": self.total_throttle_wait,
+            "max_throttle_wait": self.max_throttle_wait,
+            "breaker_opens": self.breaker_opens,
+            "fast_failures": self.fast_failures,
+            "governor": self.governor.stats() if self.governor is not None else None,
+        }
+
+
+def _describe(exc):
+    status = getattr(exc, "status", None)
+    if not isinstance(status, int):
+        status = getattr(exc, "code", None)
+    if status == 429:
+        return "Quota exceeded"
+    if isinstance(status, int):
+        return f"Server error {status}"
+    return "Connection error"
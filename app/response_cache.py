@@ -0,0 +1,144 @@
+"""LRU + TTL response cache with an optional SQLite second tier"""
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+
+def make_cache_key(model_name, prompt, generation_config=None, system_instruction=None):
+    """Hash the final prompt together with the model, its system instruction
+    and generation config"""
+    payload = json.dumps(
+        [model_name, system_instruction, generation_config or {}, prompt], sort_keys=True, default=str
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """Cache replies in memory (LRU, size and TTL bound) and in SQLite
+
+    The SQLite tier reuses a key/value table shaped like the apps'
+    context_memory table (key TEXT UNIQUE, value TEXT, timestamp), so a
+    repeated prompt is still a hit after a restart. Rows are namespaced with
+    a "cache:" key prefix so they never collide with other uses of the table.
+    With a DbWriter, SQLite writes are queued for its next group commit.
+    """
+
+    KEY_PREFIX = "cache:"
+
+    def __init__(self, conn=None, table="context_memory", max_entries=256, ttl=24 * 3600,
+                 purge_every=100, writer=None):
+        self.conn = conn
+        self.writer = writer
+        self.table = table
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.purge_every = purge_every
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.db_lock = threading.Lock()
+        self.puts_since_purge = 0
+
+        # Counters
+        self.hits = 0
+        self.db_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key):
+        """Return the cached reply for key, or None"""
+        now = time.time()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                value, stored_at = entry
+                if now - stored_at <= self.ttl:
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self.entries[key]
+                self.expirations += 1
+
+        row = self._db_get(key, now)
+        with self.lock:
+            if row is None:
+                self.misses += 1
+                return None
+            self.db_hits += 1
+            self._remember(key, row[0], row[1])
+        return row[0]
+
+    def put(self, key, value):
+        """Store a reply in both tiers"""
+        now = time.time()
+        with self.lock:
+            self._remember(key, value, now)
+        self._db_put(key, value, now)
+
+    def _remember(self, key, value, stored_at):
+        self.entries[key] = (value, stored_at)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def _db_get(self, key, now):
+        if self.conn is None:
+            return None
+        with self.db_lock:
+            row = self.conn.execute(
+                f"SELECT value, timestamp FROM {self.table} WHERE key = ?",
+                (self.KEY_PREFIX + key,),
+            ).fetchone()
+        if row is None:
+            return None
+        try:
+            stored_at = float(row[1])
+        except (TypeError, ValueError):
+            return None
+        if now - stored_at > self.ttl:
+            with self.lock:
+                self.expirations += 1
+            return None
+        return row[0], stored_at
+
+    def _db_put(self, key, value, now):
+        if self.writer is not None:
+            self.writer.submit(self._write, key, value, now)
+            return
+        if self.conn is None:
+            return
+        with self.db_lock:
+            self._write(self.conn, key, value, now)
+            self.conn.commit()
+
+    def _write(self, conn, key, value, now):
+        conn.execute(
+            f"INSERT OR REPLACE INTO {self.table} (key, value, timestamp) VALUES (?, ?, ?)",
+            (self.KEY_PREFIX + key, value, now),
+        )
+        self.puts_since_purge += 1
+        if self.puts_since_purge >= self.purge_every:
+            self.puts_since_purge = 0
+            # Expired rows are dropped in bulk instead of on every write, by
+            # key range (LIKE ignores case and treats _ as a wildcard)
+            conn.execute(
+                f"DELETE FROM {self.table} WHERE key >= ? AND key < ? AND timestamp < ?",
+                (self.KEY_PREFIX, self.KEY_PREFIX + "\uffff", now - self.ttl),
+            )
+
+    def stats(self):
+        """Hit, miss and eviction counters for both tiers"""
+        with self.lock:
+            lookups = self.hits + self.db_hits + self.misses
+            return {
+                "entries": len(self.entries),
+                "hits": self.hits,
+                "db_hits": self.db_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "hit_rate": (self.hits + self.db_hits) / lookups if lookups else 0.0,
+            }
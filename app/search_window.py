@@ -0,0 +1,126 @@
+"""Search box over the stored conversation history"""
+import tkinter as tk
+from tkinter import ttk, scrolledtext
+
+from history_search import MATCH_END, MATCH_START
+
+
+class SearchWindow:
+    """Toplevel with a query box, ranked snippets and Prev/Next paging
+
+    Searches run on the app's db worker (submit(fn, *args) returns a
+    Future) and results come back to Tk through the bridge, so a slow query
+    never freezes the chat. A result that arrives for an outdated query or
+    page is dropped.
+    """
+
+    def __init__(self, master, history_search, submit, bridge, scope=None, page_size=20,
+                 font=None, bg=None, fg=None, accent=None):
+        self.history_search = history_search
+        self.submit = submit
+        self.bridge = bridge
+        self.scope = scope
+        self.page_size = page_size
+        self.query = ""
+        self.offset = 0
+        self.generation = 0
+
+        self.window = tk.Toplevel(master)
+        self.window.title("Search History")
+        self.window.geometry("700x500")
+        if bg:
+            self.window.configure(bg=bg)
+
+        search_frame = ttk.Frame(self.window)
+        search_frame.pack(fill=tk.X, padx=10, pady=10)
+        self.query_entry = ttk.Entry(search_frame, font=font)
+        self.query_entry.pack(side=tk.LEFT, expand=True, fill=tk.X, padx=(0, 10))
+        self.query_entry.bind("<Return>", self.start_search)
+        ttk.Button(search_frame, text="Search", command=self.start_search).pack(side=tk.LEFT)
+
+        self.results = scrolledtext.ScrolledText(
+            self.window, wrap=tk.WORD, font=font, bg=bg, fg=fg, padx=10, pady=10
+        )
+        self.results.pack(fill=tk.BOTH, expand=True, padx=10)
+        self.results.tag_configure("match", font=font, foreground=accent or "#4A90E2", underline=True)
+        self.results.tag_configure("separator", foreground="#888888")
+        self.results.config(state=tk.DISABLED)
+
+        page_frame = ttk.Frame(self.window)
+        page_frame.pack(fill=tk.X, padx=10, pady=10)
+        self.prev_button = ttk.Button(page_frame, text="< Prev", command=self.prev_page, state=tk.DISABLED)
+        self.prev_button.pack(side=tk.LEFT)
+        self.next_button = ttk.Button(page_frame, text="Next >", command=self.next_page, state=tk.DISABLED)
+        self.next_button.pack(side=tk.RIGHT)
+        self.page_var = tk.StringVar(value="")
+        ttk.Label(page_frame, textvariable=self.page_var).pack(side=tk.LEFT, expand=True)
+
+        self.query_entry.focus_set()
+
+    def exists(self):
+        return bool(self.window.winfo_exists())
+
+    def lift(self):
+        self.window.deiconify()
+        self.window.lift()
+        self.query_entry.focus_set()
+
+    def start_search(self, event=None):
+        self.query = self.query_entry.get().strip()
+        self.offset = 0
+        self._run()
+
+    def prev_page(self):
+        self.offset = max(0, self.offset - self.page_size)
+        self._run()
+
+    def next_page(self):
+        self.offset += self.page_size
+        self._run()
+
+    def _run(self):
+        if not self.query:
+            return
+        self.generation += 1
+        generation = self.generation
+        self.page_var.set("Searching...")
+        try:
+            future = self.submit(self.history_search.search, self.query, self.scope, self.page_size, self.offset)
+        except Exception as e:
+            # e.g. QueueFull while the db worker is busy
+            self.page_var.set(f"Search failed: {e}")
+            return
+        future.add_done_callback(lambda f: self.bridge.post(self._show, generation, f))
+
+    def _show(self, generation, future):
+        if generation != self.generation or not self.exists():
+            return
+        try:
+            hits, more = future.result()
+        except Exception as e:
+            self.page_var.set(f"Search failed: {e}")
+            return
+
+        self.results.config(state=tk.NORMAL)
+        self.results.delete("1.0", tk.END)
+        for _, snippet in hits:
+            self._insert_snippet(snippet)
+            self.results.insert(tk.END, "\n" + "-" * 40 + "\n", "separator")
+        if not hits:
+            self.results.insert(tk.END, "No matches.")
+        self.results.config(state=tk.DISABLED)
+
+        first = self.offset + 1 if hits else 0
+        self.page_var.set(f"Results {first}-{self.offset + len(hits)}")
+        self.prev_button.config(state=tk.NORMAL if self.offset else tk.DISABLED)
+        self.next_button.config(state=tk.NORMAL if more else tk.DISABLED)
+
+    def _insert_snippet(self, snippet):
+        """Insert a snippet with its matched words tagged"""
+        for i, part in enumerate(snippet.split(MATCH_START)):
+            if i == 0:
+                self.results.insert(tk.END, part)
+                continue
+            matched, _, rest = part.partition(MATCH_END)
+            self.results.insert(tk.END, matched, "match")
+            self.results.insert(tk.END, rest)
@@ -0,0 +1,163 @@
+"""Near-duplicate reply cache using local SimHash fingerprints"""
+import hashlib
+import re
+import threading
+import time
+from collections import OrderedDict
+
+FINGERPRINT_BITS = 64
+# Unicode words: CJK runs, accented letters and digits all count
+_WORD_RE = re.compile(r"\w+")
+
+
+def _features(text):
+    """Word tokens plus character trigrams of the normalized text"""
+    words = _WORD_RE.findall(text.casefold())
+    features = list(words)
+    joined = " ".join(words)
+    features.extend(joined[i:i + 3] for i in range(len(joined) - 2))
+    return features
+
+
+# Bit counting is done on packed 32-bit lanes: each byte value maps to an
+# integer holding its 8 bits in 8 lanes, so one big-int add per feature
+# updates all 64 per-bit counters at once.
+_LANE_BITS = 32
+_BYTE_LANES = [
+    sum(1 << (_LANE_BITS * bit) for bit in range(8) if value >> bit & 1)
+    for value in range(256)
+]
+
+
+def simhash(text):
+    """64-bit SimHash of text; similar texts differ in few bits"""
+    return _fold(_features(text))
+
+
+def _fold(features):
+    totals = 0
+    for feature in features:
+        digest = hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest()
+        for i, byte in enumerate(reversed(digest)):
+            totals += _BYTE_LANES[byte] << (_LANE_BITS * 8 * i)
+    lane_mask = (1 << _LANE_BITS) - 1
+    half = len(features) / 2
+    fingerprint = 0
+    for bit in range(FINGERPRINT_BITS):
+        if (totals >> (_LANE_BITS * bit) & lane_mask) > half:
+            fingerprint |= 1 << bit
+    return fingerprint
+
+
+class SemanticCache:
+    """Reuse replies for messages whose fingerprints are within a threshold
+
+    Lookups use the pigeonhole trick: with at most d differing bits, two
+    fingerprints split into d + 1 bands must agree exactly on one band, so
+    only entries sharing a band bucket are compared. Buckets are keyed by
+    the caller's scope (persona, session, mode and generation config), so
+    replies never cross them.
+
+    Messages with fewer than min_features features ("why?", emoji only) are
+    neither looked up nor stored: their fingerprints say too little, and
+    every such message would match every other.
+    """
+
+    def __init__(self, threshold=0.95, max_entries=100_000, min_features=8):
+        self.max_distance = int((1 - threshold) * FINGERPRINT_BITS)
+        self.bands = self.max_distance + 1
+        self.band_bits = FINGERPRINT_BITS // self.bands
+        self.max_entries = max_entries
+        self.min_features = min_features
+        self.entries = OrderedDict()
+        self.buckets = {}
+        self.next_id = 0
+        self.lock = threading.Lock()
+
+        # Counters
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.skipped = 0
+        self.candidates_checked = 0
+        self.lookup_time = 0.0
+
+    def _band_keys(self, scope, fingerprint):
+        mask = (1 << self.band_bits) - 1
+        for band in range(self.bands):
+            shift = band * self.band_bits
+            if band == self.bands - 1:
+                value = fingerprint >> shift
+            else:
+                value = fingerprint >> shift & mask
+            yield (scope, band, value)
+
+    def _fingerprint(self, message):
+        """SimHash of message, or None when it has too few features"""
+        features = _features(message)
+        return _fold(features) if len(features) >= self.min_features else None
+
+    def get(self, scope, message):
+        """Return the reply cached for a near-identical message, or None"""
+        started = time.perf_counter()
+        fingerprint = self._fingerprint(message)
+        if fingerprint is None:
+            with self.lock:
+                self.skipped += 1
+            return None
+        best = None
+        with self.lock:
+            seen = set()
+            for key in self._band_keys(scope, fingerprint):
+                for entry_id in self.buckets.get(key, ()):
+                    if entry_id in seen:
+                        continue
+                    seen.add(entry_id)
+                    distance = (self.entries[entry_id][1] ^ fingerprint).bit_count()
+                    if distance <= self.max_distance and (best is None or distance < best[0]):
+                        best = (distance, entry_id)
+            self.candidates_checked += len(seen)
+            if best is None:
+                self.misses += 1
+                reply = None
+            else:
+                self.hits += 1
+                self.entries.move_to_end(best[1])
+                reply = self.entries[best[1]][2]
+            self.lookup_time += time.perf_counter() - started
+        return reply
+
+    def put(self, scope, message, reply):
+        """Index a reply under the fingerprint of the message that produced it"""
+        fingerprint = self._fingerprint(message)
+        if fingerprint is None:
+            return
+        with self.lock:
+            entry_id = self.next_id
+            self.next_id += 1
+            self.entries[entry_id] = (scope, fingerprint, reply)
+            for key in self._band_keys(scope, fingerprint):
+                self.buckets.setdefault(key, set()).add(entry_id)
+            while len(self.entries) > self.max_entries:
+                old_id, (old_scope, old_fingerprint, _) = self.entries.popitem(last=False)
+                for key in self._band_keys(old_scope, old_fingerprint):
+                    bucket = self.buckets[key]
+                    bucket.discard(old_id)
+                    if not bucket:
+                        del self.buckets[key]
+                self.evictions += 1
+
+    def stats(self):
+        """Hit rate, index size and average lookup cost"""
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self.entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "skipped": self.skipped,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "avg_candidates": self.candidates_checked / lookups if lookups else 0.0,
+                "avg_lookup_ms": self.lookup_time * 1000 / lookups if lookups else 0.0,
+            }
@@ -0,0 +1,161 @@
+"""Keep many conversations within a memory budget, evicting idle ones to SQLite"""
+import threading
+import time
+from collections import OrderedDict
+
+
+class SessionStore:
+    """Resident ChatCores by scope, least recently used first out
+
+    get(scope, build) returns the resident core or builds one; building
+    rehydrates the conversation from SQLite (saved turns, summary, snapshot)
+    and the long-term memory files. A core that has sat idle for idle_ttl
+    seconds is evicted by sweep(), and when the resident cores' estimated
+    footprint passes max_bytes the least recently used idle ones go first.
+    Eviction asks the core to suspend() (write out what only lives in RAM)
+    and drops it; the next message for that scope brings it back.
+
+    Pinned cores (a desktop view's one conversation) are never evicted, and
+    neither is a core with a request queued or running or a fold in flight.
+    """
+
+    def __init__(self, max_bytes=256 * 2 ** 20, idle_ttl=900, clock=time.monotonic):
+        self.max_bytes = max_bytes
+        self.idle_ttl = idle_ttl
+        self.clock = clock
+        self.cores = OrderedDict()
+        self.sizes = {}
+        self.pinned = set()
+        self.lock = threading.Lock()
+        self.total_bytes = 0
+
+        # Counters
+        self.opens = 0
+        self.rehydrations = 0
+        self.total_rehydrate_time = 0.0
+        self.max_rehydrate_time = 0.0
+        self.idle_evictions = 0
+        self.pressure_evictions = 0
+        self.peak_resident = 0
+        self.peak_bytes = 0
+
+    def get(self, scope, build, pin=False):
+        """The resident core for scope, built with build() when it is not"""
+        with self.lock:
+            core = self.cores.get(scope)
+            if core is not None:
+                self.cores.move_to_end(scope)
+                core.last_used = self.clock()
+                if pin:
+                    self.pinned.add(scope)
+                return core
+
+        # Loading reads the store; done outside the lock
+        started = time.perf_counter()
+        core = build()
+        elapsed = time.perf_counter() - started
+        size = core.footprint()
+        with self.lock:
+            resident = self.cores.get(scope)
+            if resident is not None:
+                # Built twice at once; keep the first
+                self.cores.move_to_end(scope)
+                return resident
+            self.cores[scope] = core
+            self.sizes[scope] = size
+            self.total_bytes += size
+            if pin:
+                self.pinned.add(scope)
+            self.opens += 1
+            if core.restored:
+                self.rehydrations += 1
+                self.total_rehydrate_time += elapsed
+                self.max_rehydrate_time = max(self.max_rehydrate_time, elapsed)
+            self.peak_resident = max(self.peak_resident, len(self.cores))
+            self.peak_bytes = max(self.peak_bytes, self.total_bytes)
+            victims = self._over_budget(keep=scope)
+        self._evict(victims)
+        return core
+
+    def update(self, core):
+        """Re-measure a core after it changed (a reply, a fold) and enforce the budget"""
+        size = core.footprint()
+        with self.lock:
+            if self.cores.get(core.scope) is not core:
+                return
+            self.total_bytes += size - self.sizes[core.scope]
+            self.sizes[core.scope] = size
+            self.peak_bytes = max(self.peak_bytes, self.total_bytes)
+            victims = self._over_budget(keep=core.scope)
+        self._evict(victims)
+
+    def _evictable(self, scope, core):
+        return scope not in self.pinned and not core.busy
+
+    def _take(self, scope):
+        core = self.cores.pop(scope)
+        self.total_bytes -= self.sizes.pop(scope)
+        return core
+
+    def _over_budget(self, keep=None):
+        """Idle cores to drop, oldest first, until the rest fit in max_bytes"""
+        victims = []
+        if self.total_bytes <= self.max_bytes:
+            return victims
+        for scope, core in list(self.cores.items()):
+            if self.total_bytes <= self.max_bytes:
+                break
+            if scope != keep and self._evictable(scope, core):
+                victims.append(self._take(scope))
+                self.pressure_evictions += 1
+        return victims
+
+    def sweep(self):
+        """Evict cores idle for longer than idle_ttl; returns how many went"""
+        now = self.clock()
+        victims = []
+        with self.lock:
+            for scope, core in list(self.cores.items()):
+                if now - core.last_used < self.idle_ttl:
+                    # Least recently used first, so the rest are newer
+                    break
+                if self._evictable(scope, core):
+                    victims.append(self._take(scope))
+                    self.idle_evictions += 1
+        self._evict(victims)
+        return len(victims)
+
+    def _evict(self, victims):
+        for core in victims:
+            core.suspend()
+
+    def close(self):
+        """Suspend every resident core (on shutdown)"""
+        with self.lock:
+            cores = list(self.cores.values())
+        for core in cores:
+            core.suspend()
+
+    def __len__(self):
+        with self.lock:
+            return len(self.cores)
+
+    def stats(self):
+        """Resident sessions, memory used and rehydration latency"""
+        with self.lock:
+            return {
+                "resident": len(self.cores),
+                "pinned": len(self.pinned),
+                "peak_resident": self.peak_resident,
+                "bytes": self.total_bytes,
+                "peak_bytes": self.peak_bytes,
+                "max_bytes": self.max_bytes,
+                "opens": self.opens,
+                "rehydrations": self.rehydrations,
+                "avg_rehydrate_time": (
+                    self.total_rehydrate_time / self.rehydrations if self.rehydrations else 0.0
+                ),
+                "max_rehydrate_time": self.max_rehydrate_time,
+                "idle_evictions": self.idle_evictions,
+                "pressure_evictions": self.pressure_evictions,
+            }
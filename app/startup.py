@@ -0,0 +1,180 @@
+"""Paint the window first: build a chat app's services on a background thread"""
+import json
+import os
+import re
+import subprocess
+import sys
+import threading
+import time
+
+# Cold-start target: the window painted this many seconds after launch
+PAINT_TARGET = 0.5
+
+# Named startup phases, as time.time() when each was reached
+MARKS = {}
+
+_IMPORTTIME_RE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+
+def mark(name):
+    """Note that startup reached name (the first time only)"""
+    MARKS.setdefault(name, time.time())
+
+
+class BackgroundInit:
+    """Run build() on its own thread while the window comes up, and hold
+    back calls that need what it builds
+
+    The window's constructor only creates widgets, then start()s this.
+    build() does the slow part (importing the Gemini SDK, opening SQLite,
+    loading the conversation) and returns what the window needs; ready(result)
+    then runs on the Tk thread, followed by every call queued with
+    when_ready(), in order. failed(error) runs instead if build() raises.
+    Tk is not thread-safe, so the Tk thread polls for the result every
+    poll_ms rather than being called from the worker.
+
+    If the window closes before ready() has run it calls cancel(), and
+    what was built goes to dispose(result) instead, from whichever thread
+    gets there last.
+    """
+
+    def __init__(self, master, build, ready, failed, dispose=None, poll_ms=15):
+        self.master = master
+        self.build = build
+        self.ready = ready
+        self.failed = failed
+        self.dispose = dispose
+        self.poll_ms = poll_ms
+        self.pending = []
+        self.lock = threading.Lock()
+        self.result = None
+        self.error = None
+        self.finished = False
+        self.done = False
+        self.cancelled = False
+        self.thread = None
+
+    @property
+    def queued(self):
+        return len(self.pending)
+
+    def start(self):
+        mark("window")
+        self.paint_binding = self.master.bind("<Expose>", self._painted, add="+")
+        # Not a daemon: a window closed mid-startup still disposes of what was built
+        self.thread = threading.Thread(target=self._run, name="startup")
+        self.thread.start()
+        self.master.after(self.poll_ms, self._poll)
+
+    def _painted(self, event=None):
+        mark("painted")
+        self.master.unbind("<Expose>", self.paint_binding)
+
+    def _run(self):
+        try:
+            result = self.build()
+        except Exception as e:
+            result, error = None, e
+        else:
+            error = None
+        mark("built")
+        with self.lock:
+            self.result, self.error, self.finished = result, error, True
+            dispose = self.cancelled and error is None and self.dispose is not None
+        if dispose:
+            self.dispose(result)
+
+    def _poll(self):
+        with self.lock:
+            finished = self.finished and not self.cancelled
+        if not finished:
+            if not self.cancelled:
+                self.master.after(self.poll_ms, self._poll)
+            return
+        self.done = True
+        if self.error is not None:
+            self.pending.clear()
+            self.failed(self.error)
+            return
+        self.ready(self.result)
+        mark("ready")
+        pending, self.pending = self.pending, []
+        for fn, args in pending:
+            fn(*args)
+
+    def when_ready(self, fn, *args):
+        """Call fn(*args) now if startup is done, else once it is"""
+        if self.done:
+            if self.error is None:
+                fn(*args)
+            return
+        self.pending.append((fn, args))
+
+    def cancel(self):
+        """The window is closing before ready() ran: drop the queued calls
+        and dispose of what was built, now or once it is"""
+        with self.lock:
+            self.cancelled = True
+            dispose = self.finished and self.error is None and self.dispose is not None
+        self.pending.clear()
+        if dispose:
+            self.dispose(self.result)
+
+
+def profile_startup(script, app_class):
+    """--profile-startup: launch script again under -X importtime, let the
+    app start until it is painted and ready, and report the phases and the
+    slowest imports"""
+    if "importtime" in sys._xoptions:
+        return _run_profiled(app_class)
+    launched = time.time()
+    child = subprocess.run(
+        [sys.executable, "-X", "importtime", os.path.abspath(script), "--profile-startup"],
+        capture_output=True, text=True,
+    )
+    lines = child.stdout.strip().splitlines()
+    if child.returncode or not lines:
+        sys.stderr.write(child.stderr[-2000:])
+        raise SystemExit(f"{script} exited with {child.returncode} before reporting")
+    marks = json.loads(lines[-1])
+
+    print(f"Startup of {os.path.basename(script)}, seconds after launch (-X importtime adds some overhead)")
+    for name, at in sorted(marks.items(), key=lambda item: item[1]):
+        note = ""
+        if name == "painted":
+            note = f"  target {PAINT_TARGET:.2f}s: {'met' if at - launched <= PAINT_TARGET else 'MISSED'}"
+        print(f"  {name:<12} {at - launched:7.3f}{note}")
+    print("Slowest imports (cumulative):")
+    for seconds, name in slowest_imports(child.stderr):
+        print(f"  {name:<32} {seconds:7.3f}")
+
+
+def slowest_imports(report, count=12):
+    """(seconds, module) of the slowest top-level imports in -X importtime output"""
+    imports = []
+    for line in report.splitlines():
+        match = _IMPORTTIME_RE.match(line)
+        if match and len(match.group(3)) == 1:
+            imports.append((int(match.group(2)) / 1e6, match.group(4)))
+    return sorted(imports, reverse=True)[:count]
+
+
+def _run_profiled(app_class, timeout=30):
+    """In the profiled child: run the app until it is painted and ready,
+    print the marks as one JSON line and close it"""
+    import tkinter as tk
+
+    mark("imported")
+    root = tk.Tk()
+    app = app_class(root)
+    deadline = time.time() + timeout
+
+    def check():
+        if ("painted" in MARKS and app.startup.done) or time.time() > deadline:
+            print(json.dumps(MARKS), flush=True)
+            app.on_close()
+        else:
+            root.after(10, check)
+
+    root.after(10, check)
+    root.mainloop()
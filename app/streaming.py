@@ -0,0 +1,79 @@
+"""Batch streamed Gemini chunks into Tk text inserts"""
+import threading
+import time
+
+
+def chunk_text(chunk):
+    """Return the text of a streamed chunk, or '' when it has no text parts"""
+    try:
+        return chunk.text
+    except ValueError:
+        # Chunks that only carry finish/safety metadata have no text
+        return ""
+
+
+class StreamBuffer:
+    """Collect streamed text off the Tk thread and flush it in batches
+
+    The first chunk is flushed right away so time-to-first-token is what the
+    user sees; later chunks are merged and flushed at most once per interval.
+    scheduler is anything with a Tk-style after(), e.g. the root or a TkBridge.
+    """
+
+    def __init__(self, scheduler, on_flush, interval_ms=50):
+        self.scheduler = scheduler
+        self.on_flush = on_flush
+        self.interval_ms = interval_ms
+        self.parts = []
+        self.pending = []
+        self.lock = threading.Lock()
+        self.flush_scheduled = False
+        self.started = time.perf_counter()
+        self.first_token_latency = None
+
+    @property
+    def text(self):
+        """Full text received so far"""
+        with self.lock:
+            return "".join(self.parts)
+
+    def append(self, text):
+        """Queue a chunk for display (safe to call from any thread)"""
+        if not text:
+            return
+        with self.lock:
+            first = self.first_token_latency is None
+            if first:
+                self.first_token_latency = time.perf_counter() - self.started
+            self.parts.append(text)
+            self.pending.append(text)
+            if self.flush_scheduled:
+                return
+            self.flush_scheduled = True
+        self.scheduler.after(0 if first else self.interval_ms, self._flush)
+
+    def _flush(self):
+        with self.lock:
+            text = "".join(self.pending)
+            self.pending.clear()
+            self.flush_scheduled = False
+        if text:
+            self.on_flush(text)
+
+    def close(self):
+        """Flush whatever is still pending once the stream has ended"""
+        self.scheduler.after(0, self._flush)
+
+
+async def stream_response(model, prompt, buffer):
+    """Stream a reply from the model into the buffer and return the full text
+
+    model may also be a chat started with start_chat(), which then records
+    the exchange in its own history. The buffer is left open: whoever made
+    it closes it once every attempt (retries, a hedge) is over.
+    """
+    send = getattr(model, "send_message_async", None) or model.generate_content_async
+    response = await send(prompt, stream=True)
+    async for chunk in response:
+        buffer.append(chunk_text(chunk))
+    return buffer.text
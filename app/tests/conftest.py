@@ -0,0 +1,18 @@
+"""The app modules import each other by name, as when run from app/"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def fake_gemini():
+    """A local stand-in for the Gemini REST API (see fake_gemini.py)"""
+    from fake_gemini import FakeGemini
+
+    fake = FakeGemini()
+    fake.start()
+    yield fake
+    fake.close()
@@ -0,0 +1,86 @@
+import asyncio
+import concurrent.futures
+import threading
+
+import pytest
+
+from async_engine import AsyncEngine
+from worker_pool import QueueFull
+
+
+@pytest.fixture
+def engine():
+    engine = AsyncEngine(max_in_flight=2, max_queue=50)
+    yield engine
+    engine.shutdown()
+
+
+def settled(engine):
+    """Wait until the loop has run everything scheduled so far"""
+    asyncio.run_coroutine_threadsafe(asyncio.sleep(0), engine.loop).result(2)
+
+
+def test_lane_runs_in_order_and_is_dropped_when_idle(engine):
+    order = []
+
+    async def step(name, delay):
+        await asyncio.sleep(delay)
+        order.append(name)
+        return name
+
+    futures = [engine.submit(step, i, 0.03 - i * 0.01, lane="chat") for i in range(3)]
+    assert [future.result(2) for future in futures] == [0, 1, 2]
+    assert order == [0, 1, 2]
+    settled(engine)
+    assert engine.lanes == {} and engine.lane_pending == {}
+
+
+def test_one_lane_per_session_does_not_pile_up(engine):
+    async def reply(session):
+        await asyncio.sleep(0)
+        return session
+
+    futures = [engine.submit(reply, session, lane=f"kaito/{session}") for session in range(40)]
+    concurrent.futures.wait(futures, timeout=5)
+    settled(engine)
+    assert engine.lanes == {} and engine.lane_pending == {}
+
+
+def test_lane_cancelled_while_waiting_is_dropped(engine):
+    release = threading.Event()
+
+    async def hold():
+        await asyncio.get_running_loop().run_in_executor(None, release.wait)
+
+    async def never():
+        raise AssertionError("cancelled before it ran")
+
+    running = engine.submit(hold, lane="chat")
+    waiting = engine.submit(never, lane="chat")
+    settled(engine)
+    assert engine.lane_depth("chat") == 1
+    waiting.cancel()
+    release.set()
+    running.result(2)
+    settled(engine)
+    assert engine.lanes == {} and engine.lane_pending == {}
+    assert engine.queue_depth == 0
+
+
+def test_full_queue_is_rejected():
+    engine = AsyncEngine(max_in_flight=1, max_queue=1)
+    release = threading.Event()
+
+    async def hold():
+        await asyncio.get_running_loop().run_in_executor(None, release.wait)
+
+    try:
+        engine.submit(hold)
+        settled(engine)
+        # One running, one waiting for its slot, no room for a third
+        engine.submit(hold)
+        with pytest.raises(QueueFull):
+            engine.submit(hold)
+    finally:
+        release.set()
+        engine.shutdown()
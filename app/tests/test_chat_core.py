@@ -0,0 +1,76 @@
+import pytest
+
+from chat_core import ChatListener, ChatServices
+from gemini_rest import GeminiClient, HttpClient
+from memory_store import MemoryStore, connect
+from personas import PERSONAS
+
+
+def open_services(path, fake_gemini, **options):
+    client = GeminiClient("fake-key", fake_gemini.url, http=HttpClient())
+    return ChatServices(
+        str(path),
+        lambda instruction, name=None, config=None: client.GenerativeModel(
+            name or "gemini-1.5-flash", instruction, config
+        ),
+        requests_per_minute=0,
+        **options,
+    )
+
+
+@pytest.fixture
+def services(tmp_path, fake_gemini):
+    services = open_services(tmp_path / "chat.db", fake_gemini)
+    yield services
+    services.close()
+
+
+def send(core, message, mode="Direct Mode"):
+    return core.send(message, mode, ChatListener()).result(10)
+
+
+def test_rephrased_repeat_hits_the_near_duplicate_cache_later_in_the_session(services, fake_gemini):
+    core = services.core(PERSONAS["kaito"], "repeat")
+    first, _ = send(core, "what is the capital city of france")
+    send(core, "and what about the weather there today")
+    calls = len(fake_gemini.requests)
+    reply, note = send(core, "What is the capital city of France?")
+    assert reply == first
+    assert note == "from cache (similar message)"
+    assert len(fake_gemini.requests) == calls
+
+
+def test_near_duplicate_cache_stays_within_its_session(services, fake_gemini):
+    send(services.core(PERSONAS["kaito"], "one"), "what is the capital city of france")
+    calls = len(fake_gemini.requests)
+    reply, note = send(services.core(PERSONAS["kaito"], "two"), "What is the capital city of France?")
+    assert note != "from cache (similar message)"
+    assert len(fake_gemini.requests) == calls + 1
+
+
+def test_turn_log_keeps_a_memory_store_history(tmp_path, fake_gemini):
+    path = tmp_path / "memory.db"
+    conn = connect(str(path))
+    store = MemoryStore(conn)
+    store.create_tables()
+    store.append("User said: my name is Ren\nKaito responded: Noted.")
+    conn.close()
+    with pytest.raises(RuntimeError, match="no key column"):
+        open_services(path, fake_gemini)
+
+    persona = dict(PERSONAS["kaito"], scope="kaito-memory")
+    services = open_services(path, fake_gemini, table="chat_state", turn_log="context_memory")
+    core = services.core(persona)
+    assert list(core.context_window) == ["User said: my name is Ren\nKaito responded: Noted."]
+    reply, _ = send(core, "what is my name")
+    services.close()
+
+    conn = connect(str(path))
+    store = MemoryStore(conn)
+    assert store.recent()[-1] == f"User said: what is my name\nKaito responded: {reply}"
+    assert conn.execute("SELECT COUNT(*) FROM chat_state WHERE key LIKE 'turn:%'").fetchone()[0] == 0
+    conn.close()
+
+    services = open_services(path, fake_gemini, table="chat_state", turn_log="context_memory")
+    assert len(services.core(persona).session) == 2
+    services.close()
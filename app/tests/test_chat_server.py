@@ -0,0 +1,292 @@
+import asyncio
+import base64
+import json
+import os
+import struct
+import time
+from urllib.parse import urlsplit
+
+import pytest
+
+from chat_server import create_server, read_frame, write_frame
+from gemini_rest import HttpClient
+from model_router import ModelRouter, replay
+
+
+@pytest.fixture
+def routing_log(tmp_path):
+    return str(tmp_path / "model_routing.jsonl")
+
+
+def start_server(tmp_path, fake_gemini, **options):
+    """A started server on tmp_path's database, talking to the fake endpoint"""
+    # More calls than the free tier's 15 a minute, none of them throttled
+    server = create_server(
+        str(tmp_path / "chat_server.db"), "fake-key", fake_gemini.url, port=0, requests_per_minute=0, **options
+    )
+    server.services.guard.base_delay = 0.05
+    server.start()
+    return server
+
+
+@pytest.fixture
+def server(tmp_path, fake_gemini, routing_log):
+    fake_gemini.chunk_delay = 0.01
+    server = start_server(tmp_path, fake_gemini, router=ModelRouter(log_path=routing_log))
+    yield server
+    server.close()
+
+
+class Client:
+    """JSON requests to a running server"""
+
+    def __init__(self, server):
+        self.base = f"http://127.0.0.1:{server.port}"
+        self.http = HttpClient()
+
+    async def request(self, method, path, body=None):
+        response = await self.http.request(method, self.base + path, body, {"Content-Type": "application/json"})
+        return response.status, response
+
+    async def post(self, path, body):
+        status, response = await self.request("POST", path, body)
+        return status, await response.json()
+
+    async def session(self, persona, session=None):
+        """Open a session; returns its messages path"""
+        body = {"persona": persona} if session is None else {"persona": persona, "session": session}
+        status, data = await self.post("/sessions", body)
+        assert status == 201, data
+        return f"/sessions/{data['session']}/messages"
+
+    def close(self):
+        self.http.close()
+
+
+def run(server, scenario):
+    """Run scenario(client) to completion against server"""
+    async def main():
+        client = Client(server)
+        try:
+            return await scenario(client)
+        finally:
+            client.close()
+    return asyncio.run(main())
+
+
+async def websocket_turn(base, session, message):
+    """Send one message over the session's WebSocket; returns its events"""
+    parts = urlsplit(base)
+    reader, writer = await asyncio.open_connection(parts.hostname, parts.port)
+    key = base64.b64encode(os.urandom(16)).decode("ascii")
+    writer.write((
+        f"GET /sessions/{session}/ws HTTP/1.1\r\nHost: {parts.netloc}\r\n"
+        f"Upgrade: websocket\r\nConnection: Upgrade\r\nSec-WebSocket-Key: {key}\r\n"
+        f"Sec-WebSocket-Version: 13\r\n\r\n"
+    ).encode("latin-1"))
+    assert b" 101 " in await reader.readline()
+    while (await reader.readline()).strip():
+        pass
+    await write_frame(writer, 0x1, json.dumps({"message": message}).encode("utf-8"), mask=True)
+    frames = []
+    while not frames or frames[-1]["event"] != "done":
+        opcode, payload = await read_frame(reader, mask_required=False)
+        frames.append(json.loads(payload))
+    await write_frame(writer, 0x8, struct.pack("!H", 1000), mask=True)
+    assert (await read_frame(reader, mask_required=False))[0] == 0x8
+    writer.close()
+    return frames
+
+
+def test_json_sse_and_websocket_turns_share_a_session(server, fake_gemini):
+    async def scenario(client):
+        status, response = await client.request("GET", "/health")
+        assert status == 200 and (await response.json())["ok"]
+        path = await client.session("kaito", "check")
+
+        # Plain JSON turn: the persona rides in the system instruction
+        status, data = await client.post(path, {"message": "first question"})
+        assert status == 200 and "first question" in data["reply"], data
+        assert "N25 Kaito" in fake_gemini.requests[-1]["system"]
+
+        # Streamed turn: the chat carries the first exchange along
+        status, response = await client.request("POST", path, {"message": "second question", "stream": True})
+        assert status == 200 and response.headers["content-type"] == "text/event-stream"
+        events = [json.loads(line[5:]) async for line in response.iter_lines() if line.startswith("data:")]
+        names = [event["event"] for event in events]
+        assert names[0] == "user_message" and names[-1] == "done", names
+        assert names.index("reply_start") < names.index("reply_text") < names.index("reply_end"), names
+        streamed = "".join(event["text"] for event in events if event["event"] == "reply_text")
+        assert events[-1]["ok"] and streamed == events[-1]["reply"], events[-1]
+        assert fake_gemini.requests[-1]["turns"] == 3
+
+        # WebSocket turn on the same session
+        frames = await websocket_turn(client.base, "kaito.check", "third question")
+        assert frames[-1]["ok"] and "third question" in frames[-1]["reply"], frames[-1]
+        assert fake_gemini.requests[-1]["turns"] == 5
+
+    run(server, scenario)
+
+
+def test_session_carries_on_after_a_restart(tmp_path, fake_gemini):
+    async def first(client):
+        path = await client.session("kaito", "check")
+        for message in ("first question", "second question"):
+            status, data = await client.post(path, {"message": message})
+            assert status == 200, data
+
+    server = start_server(tmp_path, fake_gemini)
+    try:
+        run(server, first)
+    finally:
+        server.close()
+
+    # The saved session is loaded and its history sent again
+    restarted = start_server(tmp_path, fake_gemini)
+    try:
+        status, data = run(restarted, lambda client: client.post(
+            "/sessions/kaito.check/messages", {"message": "after the restart"}
+        ))
+    finally:
+        restarted.close()
+    assert status == 200, data
+    assert fake_gemini.requests[-1]["turns"] == 5
+
+
+def test_sessions_are_separate_conversations(server, fake_gemini):
+    async def scenario(client):
+        status, data = await client.post(await client.session("kaito"), {"message": "a question"})
+        assert status == 200, data
+        status, data = await client.post(await client.session("miku"), {"message": "a different question"})
+        assert status == 200, data
+        assert fake_gemini.requests[-1]["turns"] == 1
+        assert "N25 Miku" in fake_gemini.requests[-1]["system"]
+
+    run(server, scenario)
+
+
+def test_identical_concurrent_sends_join_one_call(server, fake_gemini):
+    async def scenario(client):
+        path = await client.session("moochie")
+        calls = len(fake_gemini.requests)
+        replies = await asyncio.gather(*(client.post(path, {"message": "same question"}) for _ in range(2)))
+        assert replies[0][1]["reply"] == replies[1][1]["reply"], replies
+        assert len(fake_gemini.requests) == calls + 1
+
+    run(server, scenario)
+
+
+def test_supersede_stops_the_streaming_reply(server, fake_gemini):
+    async def scenario(client):
+        path = await client.session("moochie")
+        status, data = await client.post(path, {"message": "same question"})
+        assert status == 200, data
+        status, response = await client.request("POST", path, {"message": "long " * 60, "stream": True})
+        lines = response.iter_lines()
+        async for line in lines:
+            if line.startswith("event: reply_text"):
+                break
+        status, newer = await client.post(path, {"message": "never mind", "supersede": True})
+        events = [json.loads(line[5:]) async for line in lines if line.startswith("data:")]
+        assert not events[-1]["ok"] and "superseded" in events[-2]["text"], events[-2:]
+        # The superseded exchange never made it into the conversation
+        assert "never mind" in newer["reply"] and fake_gemini.requests[-1]["turns"] == 3
+
+    run(server, scenario)
+
+
+def test_quota_and_overload_errors_are_retried(server, fake_gemini):
+    fake_gemini.fail_next(1, 429)
+    fake_gemini.fail_next(1, 503)
+    status, data = run(server, lambda client: _send_once(client, "despite errors"))
+    assert status == 200 and "despite errors" in data["reply"], data
+    assert server.services.guard.stats()["retries"] == 2
+
+
+async def _send_once(client, message):
+    return await client.post(await client.session("kaito"), {"message": message})
+
+
+def test_slow_call_is_raced_by_a_hedge(server, fake_gemini):
+    # Hedge from the fourth call on
+    server.services.hedger.enabled = True
+    server.services.hedger.min_samples = 3
+
+    async def scenario(client):
+        path = await client.session("kaito")
+        for i in range(3):
+            status, data = await client.post(path, {"message": f"question {i}"})
+            assert status == 200, data
+        fake_gemini.stall_next(1, 2.0)
+        started = time.perf_counter()
+        status, data = await client.post(path, {"message": "hedged question"})
+        assert status == 200 and "hedged question" in data["reply"], data
+        return time.perf_counter() - started
+
+    assert run(server, scenario) < 1.5
+    assert server.services.hedger.stats()["hedge_wins"] == 1
+
+
+def test_routing_picks_a_tier_per_message_and_replays(tmp_path, fake_gemini, routing_log):
+    async def scenario(client):
+        path = await client.session("kaito", "routed")
+        # A greeting goes to the cheapest tier with a short reply
+        status, data = await client.post(path, {"message": "hi"})
+        assert status == 200 and "hi" in data["reply"], data
+        assert fake_gemini.requests[-1]["model"] == "models/gemini-1.5-flash-8b"
+        assert fake_gemini.requests[-1]["max_output_tokens"] == 256
+        # A long critique goes to the strongest
+        critique = "Tell me everything wrong with this plan. " * 6
+        status, data = await client.post(path, {"message": critique, "mode": "Harsh Critique"})
+        assert status == 200, data
+        assert fake_gemini.requests[-1]["model"] == "models/gemini-1.5-pro"
+        # The chat moved to the new model with the conversation so far
+        assert fake_gemini.requests[-1]["turns"] == 3
+
+    server = start_server(tmp_path, fake_gemini, router=ModelRouter(log_path=routing_log))
+    try:
+        run(server, scenario)
+    finally:
+        server.close()
+    # The logged decisions replay to the same picks offline
+    replayed = replay(routing_log, ModelRouter(log_path=None))
+    assert replayed["decisions"] == 2 and not replayed["changed"], replayed
+
+
+def test_typing_warms_the_connection_after_idle(server, fake_gemini):
+    server.services.prewarmer.idle_gap = 0.2
+    fake_gemini.connect_delay = 0.3
+
+    async def scenario(client):
+        path = await client.session("miku", "warm")
+        timings = {}
+        for name, typing in (("cold", False), ("warmed", True)):
+            # Drop the pooled Gemini connections, as an endpoint left idle would
+            server.engine.after(0, server.client.http.close)
+            await asyncio.sleep(0.3)
+            if typing:
+                status, response = await client.request("POST", path.replace("/messages", "/typing"), {"focus": True})
+                assert status == 202 and (await response.json())["warming"]
+                # Still typing (the warm-up takes the 0.3 s the connection does)
+                await asyncio.sleep(0.4)
+                assert fake_gemini.requests[-1]["method"] == "countTokens"
+            started = time.perf_counter()
+            status, data = await client.post(path, {"message": f"{name} please"})
+            timings[name] = time.perf_counter() - started
+            assert status == 200 and name in data["reply"], data
+        return timings
+
+    timings = run(server, scenario)
+    assert timings["warmed"] < timings["cold"] - 0.2, timings
+    stats = server.services.prewarmer.stats()
+    assert stats["warms"] == 1 and stats["calls"]["warmed"] == 1, stats
+
+
+def test_errors_come_back_as_json(server):
+    async def scenario(client):
+        status, data = await client.post(await client.session("kaito"), {"message": ""})
+        assert status == 400 and "error" in data, data
+        status, data = await client.post("/sessions/nobody.x/messages", {"message": "hi"})
+        assert status == 404 and "error" in data, data
+
+    run(server, scenario)
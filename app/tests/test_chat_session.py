@@ -0,0 +1,86 @@
+import pytest
+
+from chat_session import ChatSession
+from memory_store import connect
+
+
+class FakeChat:
+    def __init__(self, history):
+        self.history = list(history)
+
+    def send(self, message, reply):
+        self.history += [{"role": "user", "parts": [message]}, {"role": "model", "parts": [reply]}]
+
+
+class FakeModel:
+    def start_chat(self, history):
+        return FakeChat(history)
+
+
+@pytest.fixture
+def conn(tmp_path):
+    conn = connect(str(tmp_path / "chat.db"))
+    conn.execute(
+        "CREATE TABLE context_memory (id INTEGER PRIMARY KEY AUTOINCREMENT, key TEXT UNIQUE, value TEXT, timestamp DATETIME)"
+    )
+    yield conn
+    conn.close()
+
+
+def test_saved_exchanges_reload_oldest_first(conn):
+    session = ChatSession(conn, key_prefix="turn:a:")
+    for i in range(5):
+        session.save(f"q{i}", f"r{i}")
+    assert ChatSession(conn, key_prefix="turn:a:").load(3) == [("q2", "r2"), ("q3", "r3"), ("q4", "r4")]
+
+
+def test_sessions_with_lookalike_prefixes_stay_apart(conn):
+    prefixes = ["turn:a:", "turn:A:", "turn:a_:", "turn:ab:", "turn:a:b:"]
+    for prefix in prefixes:
+        ChatSession(conn, key_prefix=prefix).save(prefix, "reply")
+    for prefix in prefixes:
+        assert ChatSession(conn, key_prefix=prefix).load(10) == [(prefix, "reply")]
+
+
+def test_prune_keeps_other_sessions(conn):
+    other = ChatSession(conn, key_prefix="turn:A:")
+    other.save("keep", "me")
+    session = ChatSession(conn, key_prefix="turn:a:", max_stored=3, prune_every=2)
+    for i in range(6):
+        session.save(f"q{i}", f"r{i}")
+    assert session.load(10) == [("q3", "r3"), ("q4", "r4"), ("q5", "r5")]
+    assert other.load(10) == [("keep", "me")]
+
+
+def test_chat_is_reused_until_history_changes():
+    session = ChatSession()
+    model = FakeModel()
+    chat = session.chat_for(model)
+    chat.send("hi", "hello")
+    session.record("hi", "hello", chat)
+    assert session.chat_for(model) is chat
+
+    # A reply the chat did not produce (a cache hit) restarts it
+    session.record("again", "cached")
+    restarted = session.chat_for(model)
+    assert restarted is not chat
+    assert len(restarted.history) == 4
+    assert session.chat_for(model, preamble="summary") is not restarted
+    assert session.stats()["rebuilds"] == 3
+
+
+def test_preamble_rides_with_the_oldest_turn():
+    session = ChatSession()
+    session.extend([("hi", "hello")])
+    assert session.turns("summary")[0] == {"role": "user", "parts": ["summary", "hi"]}
+    assert ChatSession().turns("summary")[1] == {"role": "model", "parts": ["Understood."]}
+
+
+def test_record_trims_to_keep_and_chains_the_digest():
+    session = ChatSession()
+    digests = set()
+    for i in range(4):
+        session.record(f"q{i}", f"r{i}", keep=2)
+        digests.add(session.digest)
+    assert len(session) == 2
+    assert len(digests) == 4
@@ -0,0 +1,62 @@
+import pytest
+
+from db_writer import DbWriter
+from memory_store import connect
+
+
+@pytest.fixture
+def path(tmp_path):
+    path = str(tmp_path / "writer.db")
+    conn = connect(path)
+    conn.execute("CREATE TABLE items (name TEXT UNIQUE)")
+    conn.commit()
+    conn.close()
+    return path
+
+
+def insert(conn, *names):
+    for name in names:
+        conn.execute("INSERT INTO items (name) VALUES (?)", (name,))
+    return len(names)
+
+
+def names(path):
+    conn = connect(path)
+    try:
+        return sorted(row[0] for row in conn.execute("SELECT name FROM items"))
+    finally:
+        conn.close()
+
+
+def test_writes_are_grouped_into_one_commit(path):
+    writer = DbWriter(path, max_delay=0.05)
+    futures = [writer.submit(insert, f"n{i}") for i in range(20)]
+    writer.flush()
+    assert [future.result() for future in futures] == [1] * 20
+    assert len(names(path)) == 20
+    assert writer.stats()["batches"] < 20
+    writer.close()
+
+
+def test_failed_intent_is_rolled_back_whole(path):
+    writer = DbWriter(path, max_delay=0.05)
+    first = writer.submit(insert, "a")
+    # Inserts "b", then fails on the duplicate "a"
+    failed = writer.submit(insert, "b", "a")
+    last = writer.submit(insert, "c")
+    writer.flush()
+    assert first.result() == 1 and last.result() == 1
+    with pytest.raises(Exception, match="UNIQUE"):
+        failed.result()
+    assert names(path) == ["a", "c"]
+    assert writer.stats()["errors"] == 1
+    writer.close()
+
+
+def test_close_commits_what_is_queued(path):
+    writer = DbWriter(path, max_delay=0.05)
+    writer.submit(insert, "x")
+    writer.close()
+    assert names(path) == ["x"]
+    with pytest.raises(RuntimeError):
+        writer.submit(insert, "y")
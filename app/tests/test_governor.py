@@ -0,0 +1,142 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from governor import Governor
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+
+@pytest.fixture
+def open_governor(tmp_path, clock):
+    opened = []
+
+    def open_governor(app, **limits):
+        governor = Governor(app, str(tmp_path / "governor.db"), clock=clock, **limits)
+        opened.append(governor)
+        return governor
+    yield open_governor
+    for governor in opened:
+        governor.close()
+
+
+def grant(governor, tokens=0):
+    ticket = governor.enqueue()
+    return ticket, governor.try_acquire(ticket, tokens)
+
+
+def test_request_bucket_refills_over_the_minute(open_governor, clock):
+    governor = open_governor("a", requests_per_minute=2, max_concurrent=0)
+    assert grant(governor)[1][0] and grant(governor)[1][0]
+    ticket, (granted, wait, why) = grant(governor)
+    assert not granted and why == "rate" and wait == pytest.approx(30)
+    clock.now += 30
+    assert governor.try_acquire(ticket)[0]
+
+
+def test_concurrency_slots_are_released(open_governor):
+    governor = open_governor("a", requests_per_minute=0, max_concurrent=1)
+    first, (granted, _, _) = grant(governor)
+    assert granted
+    second, (granted, _, why) = grant(governor)
+    assert not granted and why == "busy"
+    governor.release(first)
+    assert governor.try_acquire(second)[0]
+
+
+def test_expired_lease_frees_its_slot(open_governor, clock):
+    governor = open_governor("a", requests_per_minute=0, max_concurrent=1, lease=10)
+    assert grant(governor)[1][0]
+    second = governor.enqueue()
+    assert not governor.try_acquire(second)[0]
+    clock.now += 11
+    assert governor.try_acquire(second)[0]
+
+
+def test_app_with_fewer_recent_grants_goes_first(open_governor):
+    busy = open_governor("busy", requests_per_minute=0, max_concurrent=0)
+    quiet = open_governor("quiet")
+    assert grant(busy)[1][0]
+    busy_ticket = busy.enqueue()
+    quiet_ticket = quiet.enqueue()
+    assert busy.try_acquire(busy_ticket)[2] == "turn"
+    assert quiet.try_acquire(quiet_ticket)[0]
+    assert busy.try_acquire(busy_ticket)[0]
+
+
+def test_limits_are_shared_through_the_file(open_governor):
+    first = open_governor("a", requests_per_minute=15)
+    second = open_governor("b", requests_per_minute=99)
+    assert second.usage()["limits"]["requests_per_minute"] == 15
+    second.set_limits(requests_per_minute=30)
+    assert first.usage()["limits"]["requests_per_minute"] == 30
+
+
+def test_tokens_are_charged_to_the_bucket(open_governor):
+    governor = open_governor("a", requests_per_minute=0, tokens_per_minute=1000, max_concurrent=0)
+    assert grant(governor, tokens=600)[1][0]
+    governor.charge(300)
+    _, (granted, _, why) = grant(governor, tokens=200)
+    assert not granted and why == "rate"
+    assert governor.usage()["last_minute"]["a"] == {"requests": 1, "tokens": 900}
+
+
+def test_acquire_waits_its_turn(open_governor):
+    governor = open_governor("a", requests_per_minute=0, max_concurrent=1)
+    held, _ = grant(governor)
+    notes = []
+
+    async def run():
+        waiter = asyncio.ensure_future(governor.acquire(notify=notes.append))
+        await asyncio.sleep(0.2)
+        assert not waiter.done()
+        governor.release(held)
+        return await asyncio.wait_for(waiter, 2)
+
+    ticket, waited = asyncio.run(run())
+    assert waited > 0
+    assert notes == ["Waiting for a free request slot"]
+    assert governor.stats()["waited"] == 1
+    governor.release(ticket)
+
+
+def test_cancelled_while_granting_leaves_no_lease(open_governor):
+    governor = open_governor("a", requests_per_minute=0, max_concurrent=1)
+    granting = threading.Event()
+    try_acquire = governor.try_acquire
+
+    def slow_try_acquire(ticket, tokens=0):
+        granting.set()
+        # The caller is cancelled while this grant is being made
+        time.sleep(0.2)
+        return try_acquire(ticket, tokens)
+
+    governor.try_acquire = slow_try_acquire
+
+    async def run():
+        waiter = asyncio.ensure_future(governor.acquire())
+        await asyncio.get_running_loop().run_in_executor(None, granting.wait)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        # The grant lands after the cancel; the withdraw follows it
+        await asyncio.sleep(0.5)
+
+    asyncio.run(run())
+    usage = governor.usage()
+    assert usage["in_flight"] == [] and usage["waiting"] == []
+    governor.try_acquire = try_acquire
+    assert grant(governor)[1][0]
@@ -0,0 +1,70 @@
+import asyncio
+
+from hedging import Hedger
+
+
+class Sink:
+    def __init__(self):
+        self.parts = []
+
+    def append(self, text):
+        self.parts.append(text)
+
+
+def make_run(delays, cancelled):
+    """run(sink, hedge) that waits delays[hedge] then streams two parts"""
+    async def run(sink, hedge):
+        try:
+            await asyncio.sleep(delays[hedge])
+            sink.append("hedge " if hedge else "first ")
+            await asyncio.sleep(0.05)
+            sink.append("reply")
+            return hedge
+        except asyncio.CancelledError:
+            cancelled.append(hedge)
+            raise
+    return run
+
+
+def warmed(**options):
+    hedger = Hedger(enabled=True, percentile=0.5, min_samples=3, min_delay=0.05, **options)
+    hedger.samples.extend([0.02, 0.03, 0.04, 1.0, 2.0])
+    return hedger
+
+
+def test_fast_call_is_not_hedged():
+    hedger = warmed()
+    cancelled = []
+    result, hedged = asyncio.run(hedger.race(make_run({False: 0.01, True: 0.0}, cancelled), Sink()))
+    assert (result, hedged) == (False, False)
+    assert hedger.hedges == 0 and cancelled == []
+
+
+def test_loser_is_cancelled_at_the_winners_first_token():
+    hedger = warmed()
+    cancelled = []
+    sink = Sink()
+
+    async def race():
+        started = asyncio.get_running_loop().time()
+        outcome = await hedger.race(make_run({False: 5.0, True: 0.01}, cancelled), sink)
+        return outcome, asyncio.get_running_loop().time() - started
+
+    (result, hedged), elapsed = asyncio.run(race())
+    assert (result, hedged) == (True, True)
+    assert "".join(sink.parts) == "hedge reply"
+    assert cancelled == [False]
+    assert elapsed < 1.0
+    stats = hedger.stats()
+    assert stats["hedge_wins"] == 1 and stats["saved_estimated"] == 1
+    # Samples slower than the hedged answer were 1.0 and 2.0 seconds
+    assert 1.0 < stats["avg_saved"] < 1.5
+
+
+def test_hedges_are_capped_by_credit():
+    hedger = warmed(burst=1.0, max_rate=0.0)
+    cancelled = []
+    run = make_run({False: 0.2, True: 0.01}, cancelled)
+    for _ in range(2):
+        asyncio.run(hedger.race(run, Sink()))
+    assert hedger.hedges == 1 and hedger.capped == 1
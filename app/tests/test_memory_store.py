@@ -0,0 +1,65 @@
+import pytest
+
+from db_writer import DbWriter
+from memory_store import MemoryStore, TurnLog, connect
+
+
+@pytest.fixture
+def conn(tmp_path):
+    conn = connect(str(tmp_path / "turns.db"))
+    yield conn
+    conn.close()
+
+
+def test_recent_is_oldest_first(conn):
+    store = MemoryStore(conn, max_stored=3)
+    store.create_tables()
+    for value in "abcd":
+        store.append(value)
+    assert store.recent() == ["b", "c", "d"]
+    assert store.recent(2) == ["c", "d"]
+
+
+def test_prune_keeps_newest_rows(conn):
+    store = MemoryStore(conn, max_stored=5, prune_every=4)
+    store.create_tables()
+    for i in range(12):
+        store.append(str(i))
+    count = conn.execute("SELECT COUNT(*) FROM context_memory").fetchone()[0]
+    assert count == 5
+    store.prune()
+    assert store.recent() == [str(i) for i in range(7, 12)]
+
+
+def test_refuses_a_key_value_table(conn):
+    conn.execute(
+        "CREATE TABLE context_memory (id INTEGER PRIMARY KEY AUTOINCREMENT, key TEXT UNIQUE, value TEXT, timestamp DATETIME)"
+    )
+    conn.execute("INSERT INTO context_memory (key, value) VALUES ('cache:x', 'reply')")
+    conn.commit()
+    with pytest.raises(RuntimeError, match="key/value table"):
+        MemoryStore(conn).create_tables()
+    assert conn.execute("SELECT value FROM context_memory").fetchall() == [("reply",)]
+
+
+def test_writer_appends_after_flush(conn, tmp_path):
+    writer = DbWriter(str(tmp_path / "turns.db"))
+    store = MemoryStore(conn, max_stored=10, writer=writer)
+    store.create_tables()
+    for value in "xyz":
+        store.append(value)
+    writer.flush()
+    assert store.recent() == ["x", "y", "z"]
+    writer.close()
+
+
+def test_turn_log_round_trips_exchanges(conn):
+    store = MemoryStore(conn, max_stored=10)
+    store.create_tables()
+    # A row written before the chat core, and one it cannot split
+    store.append("User said: hi\nKaito responded: what")
+    store.append("something else")
+    log = TurnLog(store, "User said: {user}\nKaito responded: {reply}")
+    log.save("two\nlines", "reply")
+    assert log.load(10) == [("hi", "what"), ("two\nlines", "reply")]
+    assert store.recent()[-1] == "User said: two\nlines\nKaito responded: reply"
@@ -0,0 +1,84 @@
+import os
+
+from model_router import ModelRouter, features, replay
+
+PERSONA = {"scope": "kaito", "heavy_modes": ["Critique"]}
+
+
+def pick(router, message, mode="Chat", queue_depth=0, persona=PERSONA):
+    return router.route(message, persona, mode, queue_depth)
+
+
+def test_tier_follows_message_length_and_mode():
+    router = ModelRouter()
+    assert pick(router, "hi there").model_name == "gemini-1.5-flash-8b"
+    assert pick(router, "tell me a bit more about how the rolling summary works").model_name == "gemini-1.5-flash"
+    assert pick(router, "word " * 150).model_name == "gemini-1.5-pro"
+    assert pick(router, "word " * 30, mode="Critique").model_name == "gemini-1.5-pro"
+    biased = dict(PERSONA, tier_bias=1)
+    assert pick(router, "hi there", persona=biased).model_name == "gemini-1.5-flash"
+
+
+def test_route_carries_its_reply_length():
+    route = pick(ModelRouter(), "hi there")
+    assert route.generation_config == {"max_output_tokens": 256}
+
+
+def test_busy_moves_down_to_a_faster_tier():
+    router = ModelRouter()
+    for _ in range(5):
+        router.record("models/gemini-1.5-flash-8b", 0.2)
+        router.record("gemini-1.5-flash", 1.5)
+    message = "tell me a bit more about how the rolling summary works"
+    assert pick(router, message, queue_depth=0).model_name == "gemini-1.5-flash"
+    route = pick(router, message, queue_depth=3)
+    assert route.model_name == "gemini-1.5-flash-8b" and "busy" in route.reason
+
+
+def test_failing_tier_is_left_for_a_healthy_one():
+    router = ModelRouter()
+    for _ in range(5):
+        router.record("gemini-1.5-pro", None)
+    route = pick(router, "word " * 150)
+    assert route.model_name == "gemini-1.5-flash" and "failing" in route.reason
+
+
+def test_no_log_by_default(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    router = ModelRouter()
+    pick(router, "hi there")
+    router.close()
+    assert os.listdir(tmp_path) == []
+
+
+def test_peek_neither_logs_nor_counts(tmp_path):
+    path = str(tmp_path / "routing.jsonl")
+    router = ModelRouter(log_path=path)
+    router.peek("hi there", PERSONA, "Chat", 0)
+    router.close()
+    assert not os.path.exists(path)
+    assert router.stats()["decisions"] == {}
+
+
+def test_log_replays_and_rotates(tmp_path):
+    path = str(tmp_path / "routing.jsonl")
+    router = ModelRouter(log_path=path, max_log_bytes=2000)
+    for i in range(12):
+        pick(router, "hi there" if i % 2 else "word " * 150)
+    router.close()
+    # About 470 bytes a decision: rotated after the 5th and 10th
+    assert router.stats()["log_rotations"] == 2
+    assert os.path.getsize(path + ".1") >= 2000
+    assert os.path.getsize(path) < 2000
+
+    # A higher long-message threshold sends the logged long messages to the middle tier
+    result = replay(path + ".1", ModelRouter(long_words=200))
+    assert result["logged"].get("gemini-1.5-pro")
+    assert result["changed"] == {"gemini-1.5-pro -> gemini-1.5-flash": result["logged"]["gemini-1.5-pro"]}
+
+
+def test_features_are_cheap_and_serializable():
+    assert features("hi there", PERSONA, "Critique", 2) == {
+        "words": 2, "chars": 8, "persona": "kaito", "mode": "Critique",
+        "heavy_mode": True, "tier_bias": 0, "queue_depth": 2,
+    }
@@ -0,0 +1,69 @@
+import os
+
+import pytest
+
+from chat_core import ChatServices
+from memory_store import MemoryStore, connect
+from response_cache import ResponseCache, make_cache_key
+
+
+@pytest.fixture
+def conn(tmp_path):
+    conn = connect(str(tmp_path / "cache.db"))
+    conn.execute(
+        "CREATE TABLE context_memory (id INTEGER PRIMARY KEY AUTOINCREMENT, key TEXT UNIQUE, value TEXT, timestamp DATETIME)"
+    )
+    yield conn
+    conn.close()
+
+
+def test_key_covers_model_instruction_and_config():
+    key = make_cache_key("models/a", "prompt", {"max_output_tokens": 256}, "be terse")
+    assert key == make_cache_key("models/a", "prompt", {"max_output_tokens": 256}, "be terse")
+    assert key != make_cache_key("models/b", "prompt", {"max_output_tokens": 256}, "be terse")
+    assert key != make_cache_key("models/a", "prompt", {"max_output_tokens": 2048}, "be terse")
+    assert key != make_cache_key("models/a", "prompt", {"max_output_tokens": 256}, "be kind")
+    assert key != make_cache_key("models/a", "prompt 2", {"max_output_tokens": 256}, "be terse")
+
+
+def test_lru_evicts_oldest():
+    cache = ResponseCache(max_entries=2)
+    cache.put("a", "1")
+    cache.put("b", "2")
+    assert cache.get("a") == "1"
+    cache.put("c", "3")
+    assert cache.get("b") is None
+    assert cache.get("a") == "1" and cache.get("c") == "3"
+    assert cache.stats()["evictions"] == 1
+
+
+def test_sqlite_tier_survives_restart(conn):
+    ResponseCache(conn).put("k", "reply")
+    conn.commit()
+    fresh = ResponseCache(conn)
+    assert fresh.get("k") == "reply"
+    assert fresh.stats()["db_hits"] == 1
+
+
+def test_expired_entries_miss(conn):
+    cache = ResponseCache(conn, ttl=-1)
+    cache.put("k", "reply")
+    assert cache.get("k") is None
+
+
+def test_purge_only_touches_cache_rows(conn):
+    conn.execute("INSERT INTO context_memory (key, value, timestamp) VALUES ('turn:x', 'kept', 0)")
+    conn.execute("INSERT INTO context_memory (key, value, timestamp) VALUES ('CACHE:old', 'kept', 0)")
+    conn.execute("INSERT INTO context_memory (key, value, timestamp) VALUES ('cache:old', 'gone', 0)")
+    ResponseCache(conn, ttl=60, purge_every=1).put("new", "reply")
+    values = sorted(row[0] for row in conn.execute("SELECT value FROM context_memory"))
+    assert values == ["kept", "kept", "reply"]
+
+
+def test_services_refuse_a_turn_log_database(tmp_path):
+    path = str(tmp_path / "memory.db")
+    store = MemoryStore(connect(path))
+    store.create_tables()
+    with pytest.raises(RuntimeError, match="no key column"):
+        ChatServices(path, lambda instruction, name=None, config=None: None)
+    assert os.path.exists(path)
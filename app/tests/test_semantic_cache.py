@@ -0,0 +1,48 @@
+from semantic_cache import SemanticCache, simhash
+
+
+def test_similar_texts_have_close_fingerprints():
+    a = simhash("what is the capital city of france")
+    b = simhash("what is the capital city of france?")
+    c = simhash("tell me a long story about dragons and castles")
+    assert (a ^ b).bit_count() < (a ^ c).bit_count()
+
+
+def test_non_ascii_messages_get_distinct_fingerprints():
+    assert simhash("今日はとても良い天気ですね") != 0
+    assert simhash("今日はとても良い天気ですね") != simhash("明日の会議は何時から始まりますか")
+
+
+def test_hit_for_near_duplicate_in_same_scope():
+    cache = SemanticCache(threshold=0.9)
+    cache.put("scope", "what is the capital city of france", "Paris")
+    assert cache.get("scope", "What is the capital city of France?") == "Paris"
+    assert cache.get("other", "what is the capital city of france") is None
+
+
+def test_unrelated_japanese_messages_do_not_match():
+    cache = SemanticCache()
+    cache.put("scope", "今日はとても良い天気ですね", "そうですね")
+    assert cache.get("scope", "明日の会議は何時から始まりますか") is None
+
+
+def test_messages_with_too_few_features_are_skipped():
+    cache = SemanticCache()
+    cache.put("scope", "why?", "Because.")
+    cache.put("scope", "🙂🙂", "Glad you like it")
+    assert cache.get("scope", "why?") is None
+    assert cache.get("scope", "👍") is None
+    stats = cache.stats()
+    assert stats["entries"] == 0
+    assert stats["skipped"] == 2
+    assert stats["misses"] == 0
+
+
+def test_oldest_entries_are_evicted():
+    cache = SemanticCache(max_entries=2)
+    messages = ["the first message here", "another second message", "a third one appears now"]
+    for i, message in enumerate(messages):
+        cache.put("scope", message, str(i))
+    assert cache.get("scope", messages[0]) is None
+    assert cache.get("scope", messages[2]) == "2"
+    assert cache.stats()["evictions"] == 1
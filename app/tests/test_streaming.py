@@ -0,0 +1,55 @@
+import asyncio
+
+from streaming import StreamBuffer, stream_response
+
+
+class Scheduler:
+    """Tk-style after() that runs callbacks when run() is called"""
+
+    def __init__(self):
+        self.calls = []
+
+    def after(self, ms, fn):
+        self.calls.append((ms, fn))
+
+    def run(self):
+        calls, self.calls = self.calls, []
+        for _, fn in calls:
+            fn()
+
+
+class Chunk:
+    def __init__(self, text):
+        self.text = text
+
+
+class Model:
+    async def generate_content_async(self, prompt, stream=False):
+        async def chunks():
+            for text in ("Hello", ", ", "world"):
+                yield Chunk(text)
+        return chunks()
+
+
+def test_first_chunk_flushes_at_once_and_the_rest_in_a_batch():
+    scheduler, flushed = Scheduler(), []
+    buffer = StreamBuffer(scheduler, flushed.append, interval_ms=50)
+    buffer.append("a")
+    buffer.append("b")
+    buffer.append("c")
+    assert [ms for ms, _ in scheduler.calls] == [0]
+    scheduler.run()
+    assert flushed == ["abc"]
+    assert buffer.first_token_latency is not None
+
+
+def test_stream_response_leaves_closing_to_the_buffers_owner():
+    scheduler, flushed = Scheduler(), []
+    buffer = StreamBuffer(scheduler, flushed.append)
+    closes = []
+    buffer.close = lambda: closes.append(True)
+    text = asyncio.run(stream_response(Model(), "prompt", buffer))
+    assert text == "Hello, world"
+    assert closes == []
+    scheduler.run()
+    assert "".join(flushed) == "Hello, world"
@@ -0,0 +1,334 @@
+"""Long-term memory: every stored turn in a local hashed TF-IDF index"""
+import math
+import os
+import struct
+import threading
+import time
+import zlib
+from array import array
+from collections import Counter
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from memory_summary import _STOPWORDS, _WORD_RE
+
+_RECORD = struct.Struct("<iif")
+
+
+def hashed_terms(text, dim):
+    """Sublinear term frequencies of text's content words, hashed into dim buckets"""
+    counts = Counter(
+        zlib.crc32(word.encode("utf-8")) % dim
+        for word in _WORD_RE.findall(text.lower())
+        if word not in _STOPWORDS and len(word) > 1
+    )
+    return {bucket: 1.0 + math.log(tf) for bucket, tf in counts.items()}
+
+
+def create_memory_table(conn):
+    """Create the long_term_memory table VectorMemory keeps turn texts in"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS long_term_memory (
+            scope TEXT,
+            row INTEGER,
+            value TEXT,
+            PRIMARY KEY (scope, row)
+        )
+    ''')
+    conn.commit()
+
+
+class VectorMemory:
+    """Retrieve the past turns most similar to a message, offline
+
+    Turns are vectorized by hashing their words into dim buckets (the
+    hashing trick, so there is no vocabulary to keep) and L2-normalizing the
+    sublinear term frequencies of their max_terms most distinctive words.
+    IDF is applied on the query side from running document frequencies, so
+    stored vectors never need re-weighting. Scores are cosine similarities
+    between the TF-IDF query and the stored vectors. A query scans at most
+    about max_postings postings, rarest words first, which bounds its cost
+    however large the index grows.
+
+    The vectors are sparse, so the index is the float32 matrix stored by
+    bucket (CSC: indptr, rows, weights); a query only touches the buckets of
+    its own words. New turns go to a small delta segment, appended to a log
+    file in batches, and are merged into the matrix every merge_every turns.
+    Both files sit next to the database (path + ".npz" / ".log"); the turn
+    texts go in a long_term_memory table. Without NumPy everything stays in
+    the delta segment, which works the same but scales linearly.
+    """
+
+    def __init__(self, path, conn=None, scope="default", writer=None, dim=2 ** 20, max_terms=24,
+                 merge_every=4096, flush_every=16, max_postings=50_000):
+        self.path = path
+        self.conn = conn
+        self.scope = scope
+        self.writer = writer
+        self.dim = dim
+        self.max_terms = max_terms
+        self.merge_every = merge_every
+        self.flush_every = flush_every
+        self.max_postings = max_postings
+        self.lock = threading.Lock()
+        self.merge_lock = threading.Lock()
+        self.db_lock = threading.Lock()
+
+        # Merged segment (NumPy only)
+        self.main_count = 0
+        self.indptr = None
+        self.rows = None
+        self.weights = None
+
+        # Delta segment: postings per bucket plus the flat log order, packed
+        # as log records
+        self.delta = {}
+        self.delta_log = bytearray()
+        self.pending = bytearray()
+        self.pending_turns = 0
+        self.count = 0
+        # Document frequencies; sparse, since the turns of one conversation
+        # touch few of the dim buckets
+        self.df = Counter()
+
+        # Counters
+        self.searches = 0
+        self.total_search_time = 0.0
+        self.merges = 0
+        self.last_merge_time = 0.0
+
+    def create_tables(self):
+        if self.conn is None:
+            return
+        with self.db_lock:
+            create_memory_table(self.conn)
+
+    def __len__(self):
+        with self.lock:
+            return self.count
+
+    def load(self):
+        """Load the merged matrix and replay the delta log"""
+        if np is not None and os.path.exists(self.path + ".npz"):
+            with np.load(self.path + ".npz") as saved:
+                self.indptr = saved["indptr"]
+                self.rows = saved["rows"]
+                self.weights = saved["weights"]
+                df = saved["df"]
+                buckets = np.flatnonzero(df)
+                self.df = Counter(dict(zip(buckets.tolist(), df[buckets].tolist())))
+                self.main_count = int(saved["count"])
+            self.count = self.main_count
+        if os.path.exists(self.path + ".log"):
+            with open(self.path + ".log", "rb") as f:
+                data = f.read()
+            # A torn last record (crash mid-write) is dropped
+            usable = len(data) - len(data) % _RECORD.size
+            for row, bucket, weight in _RECORD.iter_unpack(data[:usable]):
+                if row < self.main_count:
+                    continue
+                self._add_posting(row, bucket, weight)
+                self.df[bucket] += 1
+                self.count = max(self.count, row + 1)
+        return self.count
+
+    def _idf(self, bucket, total):
+        return math.log((total + 1) / (int(self.df[bucket]) + 1)) + 1.0
+
+    def _add_posting(self, row, bucket, weight):
+        postings = self.delta.get(bucket)
+        if postings is None:
+            postings = self.delta[bucket] = (array("i"), array("f"))
+        postings[0].append(row)
+        postings[1].append(weight)
+        self.delta_log += _RECORD.pack(row, bucket, weight)
+
+    def add(self, text):
+        """Index one turn; returns True when a merge is due"""
+        terms = hashed_terms(text, self.dim)
+        with self.lock:
+            row = self.count
+            self.count += 1
+            if len(terms) > self.max_terms:
+                # Keep the words that say the most about this turn
+                total = self.count
+                terms = dict(sorted(
+                    terms.items(), key=lambda item: item[1] * self._idf(item[0], total), reverse=True
+                )[:self.max_terms])
+            norm = math.sqrt(sum(w * w for w in terms.values())) or 1.0
+            for bucket, weight in terms.items():
+                self._add_posting(row, bucket, weight / norm)
+                self.df[bucket] += 1
+                self.pending += _RECORD.pack(row, bucket, weight / norm)
+            self.pending_turns += 1
+            flush = self.pending_turns >= self.flush_every
+            merge_due = np is not None and self.count - self.main_count >= self.merge_every
+        self._save_text(row, text)
+        if flush:
+            self.flush()
+        return merge_due
+
+    def _save_text(self, row, text):
+        if self.writer is not None:
+            self.writer.submit(self._write_text, row, text)
+        elif self.conn is not None:
+            with self.db_lock:
+                self._write_text(self.conn, row, text)
+                self.conn.commit()
+
+    def _write_text(self, conn, row, text):
+        conn.execute(
+            "INSERT OR REPLACE INTO long_term_memory (scope, row, value) VALUES (?, ?, ?)",
+            (self.scope, row, text),
+        )
+
+    def flush(self):
+        """Append buffered delta postings to the log file"""
+        with self.lock:
+            if self.pending:
+                with open(self.path + ".log", "ab") as f:
+                    f.write(self.pending)
+                self.pending = bytearray()
+            self.pending_turns = 0
+
+    def search(self, text, k=3, exclude_recent=0, min_score=0.2):
+        """Return up to k stored turns most similar to text, best first
+
+        The newest exclude_recent turns (already in the prompt) are skipped.
+        """
+        started = time.perf_counter()
+        terms = hashed_terms(text, self.dim)
+        with self.lock:
+            total = self.count
+            limit = total - exclude_recent
+            query = {b: tf * self._idf(b, total) for b, tf in terms.items() if self.df[b]}
+            norm = math.sqrt(sum(w * w for w in query.values())) or 1.0
+            indptr, rows, weights = self.indptr, self.rows, self.weights
+            # Most distinctive words first; once max_postings are scanned the
+            # common words left would only add small, widely spread scores
+            scanned, budget = {}, self.max_postings
+            for bucket in sorted(query, key=query.get, reverse=True):
+                length = int(self.df[bucket])
+                if scanned and length > budget:
+                    continue
+                scanned[bucket] = query[bucket] / norm
+                budget -= length
+            delta = [(self.delta[b][0][:], self.delta[b][1][:], w) for b, w in scanned.items() if b in self.delta]
+        if not scanned or limit <= 0:
+            return []
+
+        scores = Counter()
+        if rows is not None and len(rows):
+            buckets = np.fromiter(scanned, dtype=np.int64, count=len(scanned))
+            qw = np.fromiter(scanned.values(), dtype=np.float32, count=len(scanned))
+            starts, ends = indptr[buckets], indptr[buckets + 1]
+            hit_rows = np.concatenate([rows[s:e] for s, e in zip(starts, ends)])
+            hit_weights = np.concatenate([weights[s:e] * w for s, e, w in zip(starts, ends, qw)])
+            if len(hit_rows):
+                order = np.argsort(hit_rows, kind="stable")
+                hit_rows, hit_weights = hit_rows[order], hit_weights[order]
+                firsts = np.flatnonzero(np.r_[True, hit_rows[1:] != hit_rows[:-1]])
+                candidates = hit_rows[firsts]
+                totals = np.add.reduceat(hit_weights, firsts)
+                keep = candidates < limit
+                candidates, totals = candidates[keep], totals[keep]
+                if len(candidates) > k:
+                    # Delta rows may still add to these; take a margin
+                    top = np.argpartition(totals, -min(len(totals), 4 * k))[-4 * k:]
+                    candidates, totals = candidates[top], totals[top]
+                scores.update(dict(zip(candidates.tolist(), totals.tolist())))
+        for delta_rows, delta_weights, w in delta:
+            for row, weight in zip(delta_rows, delta_weights):
+                if row < limit:
+                    scores[row] += weight * w
+        best = [(row, score) for row, score in scores.most_common(k) if score >= min_score]
+
+        with self.lock:
+            self.searches += 1
+            self.total_search_time += time.perf_counter() - started
+        return self._texts([row for row, _ in best])
+
+    def _texts(self, rows):
+        if not rows or self.conn is None:
+            return []
+        with self.db_lock:
+            found = dict(self.conn.execute(
+                f"SELECT row, value FROM long_term_memory WHERE scope = ? AND row IN ({','.join('?' * len(rows))})",
+                (self.scope, *rows),
+            ).fetchall())
+        return [found[row] for row in rows if row in found]
+
+    def merge(self):
+        """Fold the delta segment into the matrix and save it (NumPy only)"""
+        if np is None:
+            return
+        with self.merge_lock:
+            started = time.perf_counter()
+            with self.lock:
+                merged = len(self.delta_log)
+                if not merged:
+                    return
+                log = np.frombuffer(
+                    bytes(self.delta_log), dtype=[("row", "<i4"), ("bucket", "<i4"), ("weight", "<f4")]
+                )
+                main_count = self.count
+                df = np.zeros(self.dim, dtype=np.int32)
+                if self.df:
+                    df[np.fromiter(self.df.keys(), dtype=np.int64)] = np.fromiter(self.df.values(), dtype=np.int32)
+                indptr, rows, weights = self.indptr, self.rows, self.weights
+            if indptr is None:
+                indptr = np.zeros(self.dim + 1, dtype=np.int64)
+                rows = np.zeros(0, dtype=np.int32)
+                weights = np.zeros(0, dtype=np.float32)
+            log = log[np.argsort(log["bucket"], kind="stable")]
+            # Each new posting goes at the end of its bucket's run
+            positions = indptr[log["bucket"] + 1]
+            rows = np.insert(rows, positions, log["row"])
+            weights = np.insert(weights, positions, log["weight"])
+            indptr = indptr.copy()
+            indptr[1:] += np.cumsum(np.bincount(log["bucket"], minlength=self.dim))
+
+            tmp = self.path + ".tmp.npz"
+            np.savez(tmp, indptr=indptr, rows=rows, weights=weights, df=df, count=main_count)
+            with self.lock:
+                self.indptr, self.rows, self.weights = indptr, rows, weights
+                self.main_count = main_count
+                remaining = bytes(self.delta_log[merged:])
+                self.delta, self.delta_log = {}, bytearray()
+                for row, bucket, weight in _RECORD.iter_unpack(remaining):
+                    self._add_posting(row, bucket, weight)
+                self.pending = bytearray()
+                self.pending_turns = 0
+                with open(self.path + ".log.tmp", "wb") as f:
+                    f.write(remaining)
+                os.replace(tmp, self.path + ".npz")
+                os.replace(self.path + ".log.tmp", self.path + ".log")
+            self.merges += 1
+            self.last_merge_time = time.perf_counter() - started
+
+    def footprint(self):
+        """Rough bytes held in RAM: the matrix, the delta segment and the frequencies"""
+        with self.lock:
+            size = len(self.delta_log) + len(self.pending) + 100 * len(self.df)
+            # Two arrays and a dict slot per delta bucket, plus the postings
+            size += 300 * len(self.delta) + len(self.delta_log) * 8 // _RECORD.size
+            if self.indptr is not None:
+                size += self.indptr.nbytes + self.rows.nbytes + self.weights.nbytes
+            return size
+
+    def stats(self):
+        """Index size, search time and merge counters"""
+        with self.lock:
+            return {
+                "turns": self.count,
+                "merged": self.main_count,
+                "delta_postings": len(self.delta_log) // _RECORD.size,
+                "searches": self.searches,
+                "avg_search_time": self.total_search_time / self.searches if self.searches else 0.0,
+                "merges": self.merges,
+                "last_merge_time": self.last_merge_time,
+                "numpy": np is not None,
+            }
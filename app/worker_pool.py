@@ -0,0 +1,127 @@
+"""Fixed-size worker pool with a bounded request queue"""
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+
+class QueueFull(Exception):
+    """Raised when a job is submitted while the queue is already full"""
+
+
+class WorkerPool:
+    """Run jobs on a fixed set of threads, rejecting work past max_queue
+
+    Rejecting instead of spawning a new thread is the backpressure: callers
+    see QueueFull and can tell the user to wait.
+    """
+
+    def __init__(self, max_workers=1, max_queue=5, name="chat-worker"):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.jobs = queue.Queue()
+        self.lock = threading.Lock()
+        self.closed = False
+
+        # Counters
+        self.pending = 0
+        self.active = 0
+        self.submitted = 0
+        self.completed = 0
+        self.rejected = 0
+        self.cancelled = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+        self.workers = []
+        for i in range(max_workers):
+            worker = threading.Thread(target=self._worker, name=f"{name}-{i}", daemon=True)
+            worker.start()
+            self.workers.append(worker)
+
+    @property
+    def queue_depth(self):
+        """Number of jobs waiting for a free worker"""
+        with self.lock:
+            return self.pending
+
+    def submit(self, fn, *args, **kwargs):
+        """Queue fn(*args, **kwargs) and return a Future for its result"""
+        with self.lock:
+            if self.closed:
+                raise RuntimeError("worker pool is shut down")
+            if self.pending >= self.max_queue:
+                self.rejected += 1
+                raise QueueFull(f"{self.pending} requests already queued")
+            self.pending += 1
+            self.submitted += 1
+        future = Future()
+        self.jobs.put((future, time.perf_counter(), fn, args, kwargs))
+        return future
+
+    def _worker(self):
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                break
+            future, queued_at, fn, args, kwargs = job
+            wait = time.perf_counter() - queued_at
+            with self.lock:
+                self.pending -= 1
+                self.total_wait += wait
+                self.max_wait = max(self.max_wait, wait)
+                if not future.set_running_or_notify_cancel():
+                    self.cancelled += 1
+                    continue
+                self.active += 1
+            try:
+                future.set_result(fn(*args, **kwargs))
+            except BaseException as e:
+                future.set_exception(e)
+            finally:
+                with self.lock:
+                    self.active -= 1
+                    self.completed += 1
+
+    def stats(self):
+        """Snapshot of queue depth, throughput and wait time counters"""
+        with self.lock:
+            started = self.completed + self.active
+            return {
+                "workers": self.max_workers,
+                "queue_depth": self.pending,
+                "active": self.active,
+                "submitted": self.submitted,
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "cancelled": self.cancelled,
+                "avg_wait": self.total_wait / started if started else 0.0,
+                "max_wait": self.max_wait,
+            }
+
+    def shutdown(self, cancel_pending=False, wait=False, timeout=None):
+        """Stop accepting work, then either drain or cancel the queue
+
+        With wait=True the call blocks until running and (undrained) queued
+        jobs finish, up to timeout seconds per worker.
+        """
+        with self.lock:
+            if self.closed:
+                return
+            self.closed = True
+        if cancel_pending:
+            while True:
+                try:
+                    job = self.jobs.get_nowait()
+                except queue.Empty:
+                    break
+                future = job[0]
+                with self.lock:
+                    self.pending -= 1
+                    if future.cancel():
+                        self.cancelled += 1
+        for _ in self.workers:
+            self.jobs.put(None)
+        if wait:
+            for worker in self.workers:
+                worker.join(timeout)